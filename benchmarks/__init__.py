@@ -0,0 +1,6 @@
+"""Performance benchmarks on synthetic data; run with python -m benchmarks.run"""
+import os
+import sys
+
+# The app's modules import each other from src/, as when running app.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
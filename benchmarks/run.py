@@ -0,0 +1,309 @@
+"""
+Time BudgetBuddy's hot paths on synthetic users and compare with baselines.
+
+    python -m benchmarks.run                          # compare with benchmarks/baselines.json
+    python -m benchmarks.run --update-baseline        # record the results as the new baselines
+    python -m benchmarks.run --filter context --threshold 0.5
+
+Every case gets a warm-up call, then timeit picks a loop count and takes
+--repeat samples. Cases are compared on the median sample, which a single
+lucky or unlucky sample can't move. A case whose median is more than
+--threshold slower than its baseline (default 25%, or its own "threshold"
+in the baseline file) and also more than --min-slowdown-us microseconds
+slower is timed again up to --recheck times, and only if it stays that slow
+is it a regression, which makes the run exit with status 1. The absolute
+floor keeps sub-millisecond cases from failing on scheduler noise. Baselines
+depend on the machine, so record them on the machine that runs the
+comparison.
+"""
+import argparse
+import functools
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+
+from benchmarks.synthetic import generate_user, generate_transactions
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+DEFAULT_THRESHOLD = float(os.getenv("BUDGETBUDDY_BENCH_THRESHOLD", 0.25))
+# A regression must also be at least this many microseconds per call
+DEFAULT_MIN_SLOWDOWN_US = float(os.getenv("BUDGETBUDDY_BENCH_MIN_SLOWDOWN_US", 250))
+HISTORY_YEARS = (1, 10, 30)
+USER_ID = "bench_user"
+
+# Size of the synthetic model response for the parsing cases
+RESPONSE_PARAGRAPHS = 400
+
+
+# Each setup function prepares its data in workdir and returns the callable to time
+def setup_storage_load(mode, years, workdir):
+    from components.utils.backends import create_backend
+    create_backend(mode, data_dir=workdir).save_user(USER_ID, generate_user(years))
+    if mode == "json":
+        # A fresh backend each call, so the parsed-document cache never hides the read
+        return lambda: create_backend(mode, data_dir=workdir).load_user(USER_ID)
+    backend = create_backend(mode, data_dir=workdir)
+    return lambda: backend.load_user(USER_ID)
+
+
+def setup_storage_save(mode, years, workdir):
+    from components.utils.backends import create_backend
+    backend = create_backend(mode, data_dir=workdir)
+    document = generate_user(years)
+    return lambda: backend.save_user(USER_ID, document)
+
+
+def setup_financial_context(years, workdir):
+    from components.tips_review import build_financial_context
+    from components.utils.model import UserRecord
+    record = UserRecord.from_document(generate_user(years))
+    return lambda: build_financial_context(record.profile, record.years)
+
+
+def setup_analysis_prompt(years, workdir):
+    from components.tips_review import build_financial_context, create_analysis_prompt
+    from components.utils.model import UserRecord
+    record = UserRecord.from_document(generate_user(years))
+    context = build_financial_context(record.profile, record.years)
+    return lambda: create_analysis_prompt(context, "Comprehensive Review")
+
+
+def synthetic_response(paragraphs=RESPONSE_PARAGRAPHS):
+    """A long model answer with many dollar amounts and a savings target at the end"""
+    lines = []
+    for i in range(paragraphs):
+        lines.append(
+            f"{i + 1}. Your groceries averaged ${400 + i:,}.{i % 100:02d} a month, ${25 + i % 40} above "
+            f"plan; moving ${1000 + 10 * i:,} a year into savings would add ${12 * (100 + i):,} by retirement."
+        )
+    lines.append("NEW SAVINGS TARGET: $1,250")
+    return "\n".join(lines)
+
+
+def setup_extract_recommendation(workdir):
+    from components.tips_review import extract_savings_recommendation
+    response = synthetic_response()
+    return lambda: extract_savings_recommendation(response)
+
+
+def setup_highlight(workdir):
+    from components.tips_review import highlight_dollar_amounts
+    response = synthetic_response()
+    return lambda: highlight_dollar_amounts(response)
+
+
+def setup_savings_frame(years, workdir):
+    from components.visualization import build_savings_frame
+    from components.utils.model import YearLedger
+    ledger = YearLedger.from_months(generate_user(years)["months"], "2024")
+    return lambda: build_savings_frame(ledger, 1000.0)
+
+
+def setup_savings_figures(workdir):
+    from components.visualization import build_savings_frame, build_savings_figures
+    from components.utils.model import YearLedger
+    df = build_savings_frame(YearLedger.from_months(generate_user(1)["months"], "2024"), 1000.0)
+    return lambda: build_savings_figures(df)
+
+
+def setup_history_figure(years, workdir):
+    import numpy as np
+    import plotly.express as px
+    from components.utils.ledger import TransactionLedger, CATEGORY_CODES
+    from components.utils.downsample import lttb
+    transactions = generate_transactions(years)
+    ledger = TransactionLedger(USER_ID, data_dir=os.path.join(workdir, "ledger"))
+    categories = np.where(transactions["amount"] > 0, CATEGORY_CODES["salary"], CATEGORY_CODES["other_expenses"])
+    # Money in is salary and money out is spend, so both are positive in their category
+    ledger.append(transactions["date"].to_numpy(), np.abs(transactions["amount"].to_numpy()), categories)
+
+    def build():
+        # Same steps as visualization.build_history_figure, minus the Streamlit cache
+        days, net = ledger.daily_net()
+        x, y = lttb(days, np.cumsum(net))
+        return px.line(x=x, y=y)
+    return build
+
+
+def setup_first_render(workdir):
+    from benchmarks.startup import APP_PATH, render_once
+    # A fresh interpreter each call, so this is a true cold start
+    return lambda: render_once(APP_PATH, workdir)
+
+
+def build_cases():
+    """{case name: setup function(workdir)}"""
+    cases = {}
+    for years in HISTORY_YEARS:
+        for mode in ("json", "sqlite"):
+            cases[f"storage.load.{mode}.{years}y"] = functools.partial(setup_storage_load, mode, years)
+            cases[f"storage.save.{mode}.{years}y"] = functools.partial(setup_storage_save, mode, years)
+        cases[f"tips.financial_context.{years}y"] = functools.partial(setup_financial_context, years)
+        cases[f"visualization.savings_frame.{years}y"] = functools.partial(setup_savings_frame, years)
+        cases[f"visualization.history_figure.{years}y"] = functools.partial(setup_history_figure, years)
+    cases["tips.analysis_prompt.30y"] = functools.partial(setup_analysis_prompt, 30)
+    cases["tips.extract_recommendation"] = setup_extract_recommendation
+    cases["tips.highlight_dollar_amounts"] = setup_highlight
+    cases["visualization.savings_figures"] = setup_savings_figures
+    cases["startup.first_render"] = setup_first_render
+    return cases
+
+
+def time_case(fn, repeat):
+    """Fastest and median seconds per call"""
+    fn()
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    samples = sorted(total / number for total in timer.repeat(repeat, number))
+    return {"best_s": samples[0], "median_s": samples[len(samples) // 2], "loops": number}
+
+
+def run_case(setup, repeat):
+    workdir = tempfile.mkdtemp(prefix="budgetbuddy-bench-")
+    try:
+        return time_case(setup(workdir), repeat)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_cases(cases, repeat):
+    results = {}
+    for name, setup in cases.items():
+        results[name] = run_case(setup, repeat)
+        print(f"  {name:<42} {results[name]['median_s'] * 1000:>10.3f} ms", flush=True)
+    return results
+
+
+def recheck(cases, results, baselines, threshold, min_slowdown_s, repeat, attempts):
+    """Time cases that look like regressions again, keeping their fastest median"""
+    for _ in range(attempts):
+        _, regressions = compare(results, baselines, threshold, min_slowdown_s)
+        if not regressions:
+            return
+        print(f"🔁 Re-timing {len(regressions)} slow case(s)...", flush=True)
+        for name in regressions:
+            result = run_case(cases[name], repeat)
+            if result["median_s"] < results[name]["median_s"]:
+                results[name] = result
+
+
+def compare(results, baselines, threshold, min_slowdown_s=DEFAULT_MIN_SLOWDOWN_US / 1e6):
+    """Rows of (name, median, baseline median, change, status) and the names that regressed"""
+    rows, regressions = [], []
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            rows.append((name, result["median_s"], None, None, "🆕"))
+            continue
+        baseline_s = baseline["median_s"]
+        change = result["median_s"] / baseline_s - 1
+        # Noisy cases (e.g. ones bound by fsync) can carry their own threshold
+        regressed = (change > baseline.get("threshold", threshold)
+                     and result["median_s"] - baseline_s > min_slowdown_s)
+        if regressed:
+            regressions.append(name)
+        rows.append((name, result["median_s"], baseline_s, change, "❌" if regressed else "✅"))
+    return rows, regressions
+
+
+def load_baselines(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding="utf-8") as f:
+        return json.load(f).get("cases", {})
+
+
+def save_baselines(path, results):
+    cases = load_baselines(path)
+    for name, result in results.items():
+        if "threshold" in cases.get(name, {}):
+            result = dict(result, threshold=cases[name]["threshold"])
+        cases[name] = result
+    document = {
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.machine(),
+            "recorded": time.strftime("%Y-%m-%d"),
+        },
+        "cases": dict(sorted(cases.items())),
+    }
+    with open(path, 'w', encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+        f.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark BudgetBuddy hot paths against stored baselines")
+    parser.add_argument("--filter", action="append", default=[],
+                        help="only run cases whose name contains this; repeat for several")
+    parser.add_argument("--repeat", type=int, default=9, help="timing samples per case; the median is compared")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown before a case fails, e.g. 0.25 for 25%%")
+    parser.add_argument("--min-slowdown-us", type=float, default=DEFAULT_MIN_SLOWDOWN_US,
+                        help="a case must also be this many microseconds slower to fail")
+    parser.add_argument("--recheck", type=int, default=2,
+                        help="times to re-run a case that looks slower before failing it")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="write the results to the baseline file instead of comparing")
+    parser.add_argument("--output", help="also write the raw results to this JSON file")
+    args = parser.parse_args(argv)
+
+    cases = build_cases()
+    if args.filter:
+        cases = {name: setup for name, setup in cases.items() if any(text in name for text in args.filter)}
+    if not cases:
+        print("❌ No benchmark cases match the filter")
+        return 1
+
+    print(f"🚀 Running {len(cases)} benchmark cases...")
+    eager = []
+    if any(name.startswith("startup.") for name in cases):
+        # The first render must not import what only later pages need
+        from benchmarks.startup import profile_startup, print_report
+        profile = profile_startup()
+        print_report(profile)
+        eager = profile["eager"]
+    results = run_cases(cases, args.repeat)
+    if args.update_baseline:
+        if eager:
+            print(f"❌ First render imported {', '.join(eager)}; baselines not updated")
+            return 1
+        save_baselines(args.baseline, results)
+        print(f"✅ Baselines for {len(results)} cases written to {args.baseline}")
+        return 0
+
+    baselines = load_baselines(args.baseline)
+    min_slowdown_s = args.min_slowdown_us / 1e6
+    recheck(cases, results, baselines, args.threshold, min_slowdown_s, args.repeat, args.recheck)
+    if args.output:
+        with open(args.output, 'w', encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    rows, regressions = compare(results, baselines, args.threshold, min_slowdown_s)
+    print("-" * 80)
+    for name, median, baseline, change, status in rows:
+        if baseline is None:
+            print(f"{status} {name:<42} {median * 1000:>10.3f} ms   (no baseline)")
+        else:
+            print(f"{status} {name:<42} {median * 1000:>10.3f} ms   baseline {baseline * 1000:.3f} ms   {change:+.0%}")
+    print("-" * 80)
+    if eager:
+        print(f"❌ First render imported {', '.join(eager)}")
+    if regressions:
+        print(f"❌ {len(regressions)} case(s) slower than baseline by more than {args.threshold:.0%} "
+              f"and {args.min_slowdown_us:.0f} µs")
+    if eager or regressions:
+        return 1
+    print(f"🎉 No regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+Cold-start profile of the app's first render.
+
+    python -m benchmarks.startup
+
+Renders src/app.py once with Streamlit's AppTest in a fresh interpreter
+started with -X importtime, next to a one-line Streamlit script as the
+baseline, and reports the time to first render of both plus where the
+app's import time went, by top-level package. Modules in DEFERRED_MODULES
+must not be imported by the first render; benchmarks.run fails if they are.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "src", "app.py")
+
+# Only needed by pages other than the default one, or by the first analysis
+# request. Streamlit imports plotly's core itself, but not plotly.express.
+DEFERRED_MODULES = ("plotly.express", "strands", "boto3", "botocore", "dotenv")
+
+_BASELINE_APP = 'import streamlit as st\nst.title("Hello")\n'
+
+_RENDER_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+at.run()
+print(json.dumps({
+    "seconds": time.perf_counter() - start,
+    "exceptions": [str(e.value) for e in at.exception],
+    "modules": sorted(sys.modules),
+}))
+"""
+
+
+def parse_importtime(stderr):
+    """{top-level package: seconds} from -X importtime output, counting self time only"""
+    totals = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        totals[name.strip().partition(".")[0]] += int(self_us) / 1e6
+    return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+
+def render_once(app_path, workdir):
+    """Time to first render and import profile of one app, in a fresh interpreter"""
+    env = dict(os.environ, BUDGETBUDDY_WARM_UP="0", BUDGETBUDDY_TRACE="0")
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _RENDER_SCRIPT, app_path],
+        cwd=workdir, env=env, capture_output=True, text=True, check=True
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["imports"] = parse_importtime(completed.stderr)
+    return result
+
+
+def profile_startup(app_path=APP_PATH):
+    """
+    First-render profile of the app and of a bare Streamlit script:
+    {"app": ..., "baseline": ..., "eager": deferred modules the app imported}.
+    """
+    with tempfile.TemporaryDirectory(prefix="budgetbuddy-startup-") as workdir:
+        # The app creates its data files under the working directory
+        baseline_path = os.path.join(workdir, "baseline_app.py")
+        with open(baseline_path, 'w', encoding="utf-8") as f:
+            f.write(_BASELINE_APP)
+        baseline = render_once(baseline_path, workdir)
+        app = render_once(os.path.abspath(app_path), workdir)
+    eager = [name for name in DEFERRED_MODULES if name in app["modules"]]
+    return {"app": app, "baseline": baseline, "eager": eager}
+
+
+def print_report(profile, top=15):
+    app, baseline = profile["app"], profile["baseline"]
+    print(f"⏱️  First render: app {app['seconds']:.2f}s, bare Streamlit {baseline['seconds']:.2f}s "
+          f"(+{app['seconds'] - baseline['seconds']:.2f}s)")
+    print(f"📦 Import time by package (app, {sum(app['imports'].values()):.2f}s total):")
+    extra = {name: seconds - baseline["imports"].get(name, 0.0) for name, seconds in app["imports"].items()}
+    for name, seconds in list(app["imports"].items())[:top]:
+        marker = "" if name in baseline["imports"] else "   (not imported by bare Streamlit)"
+        print(f"  {name:<28} {seconds * 1000:>8.1f} ms{marker}")
+    over = sorted(((s, n) for n, s in extra.items() if n not in baseline["imports"]), reverse=True)
+    if over:
+        print(f"  app-only packages: {sum(s for s, _ in over) * 1000:.1f} ms")
+    if app["exceptions"]:
+        print(f"❌ App raised: {app['exceptions']}")
+    if profile["eager"]:
+        print(f"❌ Imported before they were needed: {', '.join(profile['eager'])}")
+    else:
+        print(f"✅ None of {', '.join(DEFERRED_MODULES)} imported by the first render")
+
+
+def main():
+    profile = profile_startup()
+    print_report(profile)
+    return 1 if profile["eager"] or profile["app"]["exceptions"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
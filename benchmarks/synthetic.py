@@ -0,0 +1,137 @@
+"""
+Synthetic BudgetBuddy users for benchmarks.
+
+Amounts follow the shapes real budgets have: salaries with yearly raises,
+rent stepping up once a year, seasonal groceries and utilities, a holiday
+bump in entertainment and occasional large one-off expenses. Everything is
+drawn from a seeded generator, so the same arguments give the same data.
+"""
+import numpy as np
+import pandas as pd
+from components.utils.schema import build_month_record, month_key
+
+END_YEAR = 2024
+
+# Card purchase descriptions per category, as they'd appear on a statement
+MERCHANTS = {
+    "groceries": ["WHOLE FOODS #{n}", "TRADER JOE'S #{n}", "KROGER #{n}", "SAFEWAY {n}"],
+    "transportation": ["SHELL OIL {n}", "UBER TRIP", "LYFT RIDE", "METRO TRANSIT"],
+    "entertainment": ["STARBUCKS #{n}", "AMC CINEMA {n}", "DOORDASH", "STEAM GAMES", "TICKETMASTER"],
+    "other_expenses": ["AMAZON MKTPLACE", "TARGET #{n}", "CVS PHARMACY {n}", "HOME DEPOT {n}"],
+}
+
+
+def generate_months(years=10, seed=0, end_year=END_YEAR, monthly_target=1000.0, completed_ratio=0.9):
+    """{month_key: month document} for `years` years ending December of end_year"""
+    rng = np.random.default_rng(seed)
+    n = years * 12
+    t = np.arange(n)
+    year_index = t // 12
+    month_of_year = t % 12
+    # 0 in summer, 1 in midwinter
+    winter = (np.cos(2 * np.pi * month_of_year / 12) + 1) / 2
+
+    income = {
+        "salary": rng.uniform(3500, 7000) * 1.03 ** year_index,
+        "investment": np.where(month_of_year % 3 == 2, rng.gamma(2.0, 120, n), rng.gamma(1.0, 15, n)),
+        "other_income": np.where(rng.random(n) < 0.15, rng.gamma(2.0, 200, n), 0.0),
+    }
+    expenses = {
+        "rent": rng.uniform(900, 2200) * 1.04 ** year_index,
+        "groceries": rng.uniform(350, 700) * (1 + 0.1 * winter) * rng.lognormal(0, 0.12, n),
+        "transportation": rng.normal(260, 60, n).clip(40),
+        "utilities": rng.uniform(120, 200) * (1 + 0.6 * winter) * rng.lognormal(0, 0.08, n),
+        "entertainment": rng.lognormal(5.2, 0.35, n) * np.where(month_of_year == 11, 1.8, 1.0),
+        "other_expenses": rng.gamma(2.0, 90, n) + np.where(rng.random(n) < 0.05, rng.gamma(3.0, 600, n), 0.0),
+    }
+    completed = rng.random(n) < completed_ratio
+
+    months = {}
+    start_year = end_year - years + 1
+    for i in range(n):
+        record = build_month_record(
+            {field: round(float(values[i]), 2) for field, values in income.items()},
+            {field: round(float(values[i]), 2) for field, values in expenses.items()},
+            monthly_target,
+            completed=bool(completed[i])
+        )
+        months[month_key(start_year + year_index[i], month_of_year[i] + 1)] = record
+    return months
+
+
+def generate_profile(seed=0, monthly_target=1000.0):
+    rng = np.random.default_rng(seed)
+    current_age = int(rng.integers(22, 55))
+    return {
+        "name": f"Synthetic User {seed}",
+        "current_age": current_age,
+        "retirement_age": int(rng.integers(max(current_age + 5, 55), 70)),
+        "current_income": int(rng.integers(3, 15)) * 500,
+        "current_savings": int(rng.integers(0, 200)) * 1000,
+        "risk_tolerance": str(rng.choice(["Conservative", "Moderate", "Aggressive"])),
+        "inflation_rate": 2.5,
+        "monthly_savings_target": monthly_target,
+    }
+
+
+def generate_user(years=10, seed=0, end_year=END_YEAR):
+    """A full user document ({"profile", "months"}) with `years` years of history"""
+    return {"profile": generate_profile(seed), "months": generate_months(years, seed, end_year)}
+
+
+def generate_transactions(years=10, seed=0, per_month=80, end_year=END_YEAR):
+    """
+    Statement rows (date, description, amount) for `years` years: two
+    paychecks, rent and bills each month plus per_month card purchases.
+    """
+    rng = np.random.default_rng(seed)
+    months = pd.period_range(f"{end_year - years + 1}-01", f"{end_year}-12", freq="M")
+    starts = months.to_timestamp().to_numpy()
+    lengths = months.days_in_month.to_numpy()
+    n_months = len(months)
+
+    frames = []
+    salary = rng.uniform(1800, 3500)
+    rent = rng.uniform(900, 2200)
+    # (description, day of month, amount, month-to-month variation)
+    fixed = [
+        ("ACME CORP PAYROLL", 1, salary, 0.0), ("ACME CORP PAYROLL", 15, salary, 0.0),
+        ("OAKWOOD APARTMENTS RENT", 1, -rent, 0.0),
+        ("CITY ELECTRIC", 20, -rng.uniform(60, 120), 0.1), ("COMCAST", 22, -rng.uniform(50, 90), 0.0),
+        ("NETFLIX.COM", 5, -15.49, 0.0), ("SPOTIFY", 9, -10.99, 0.0),
+    ]
+    growth = 1.03 ** (np.arange(n_months) // 12)
+    for description, day, amount, variation in fixed:
+        frames.append(pd.DataFrame({
+            "date": starts + np.timedelta64(day - 1, "D"),
+            "description": description,
+            "amount": np.round(amount * growth * rng.lognormal(0, variation, n_months), 2),
+        }))
+
+    # Card purchases: random days, categories and store numbers
+    count = n_months * per_month
+    month_index = np.repeat(np.arange(n_months), per_month)
+    days = (rng.random(count) * lengths[month_index]).astype(np.int64)
+    spend = ["groceries", "transportation", "entertainment", "other_expenses"]
+    category = rng.choice(len(spend), count, p=[0.4, 0.25, 0.2, 0.15])
+    scale = np.array([45.0, 30.0, 25.0, 60.0])[category]
+    templates = [MERCHANTS[name] for name in spend]
+    picks = rng.integers(0, 5, count)
+    stores = rng.integers(100, 160, count)
+    descriptions = [templates[c][pick % len(templates[c])].format(n=store)
+                    for c, pick, store in zip(category, picks, stores)]
+    frames.append(pd.DataFrame({
+        "date": starts[month_index] + days.astype("timedelta64[D]"),
+        "description": descriptions,
+        "amount": -np.round(rng.gamma(2.0, scale / 2), 2),
+    }))
+
+    transactions = pd.concat(frames, ignore_index=True).sort_values("date", kind="stable")
+    return transactions.reset_index(drop=True)
+
+
+def write_statement_csv(transactions, path):
+    """Write transactions as a bank CSV export the importer understands"""
+    out = transactions.assign(date=transactions["date"].dt.strftime("%Y-%m-%d"))
+    out.rename(columns={"date": "Date", "description": "Description", "amount": "Amount"}).to_csv(path, index=False)
+    return path
@@ -1,28 +1,110 @@
 import os
-from strands import Agent
-from strands.models import BedrockModel
-from dotenv import load_dotenv
-import boto3
+import asyncio
+import json
+import queue
+import threading
+import time
+from collections import OrderedDict
+from components.utils.tracing import traced
+from components.utils.recommendation import AnalysisReport, build_repair_prompt
+from components.utils.gateway import get_model_gateway, request_key
+from components.utils.ratelimit import PRIORITY_INTERACTIVE
 
-load_dotenv(".env")
+# Bedrock HTTP client tuning; the pool is shared by every session in the process
+BEDROCK_MAX_POOL_CONNECTIONS = int(os.getenv("BEDROCK_MAX_POOL_CONNECTIONS", 50))
+BEDROCK_CONNECT_TIMEOUT = float(os.getenv("BEDROCK_CONNECT_TIMEOUT", 5))
+BEDROCK_READ_TIMEOUT = float(os.getenv("BEDROCK_READ_TIMEOUT", 120))
+BEDROCK_MAX_ATTEMPTS = int(os.getenv("BEDROCK_MAX_ATTEMPTS", 4))
+
+DEFAULT_MODEL_ID = 'anthropic.claude-3-5-haiku-20241022-v1:0'
+
+# Conversation history kept per agent, and limits for the per-session pool
+AGENT_HISTORY_TOKENS = int(os.getenv("BUDGETBUDDY_HISTORY_TOKENS", 4000))
+AGENT_POOL_SIZE = int(os.getenv("BUDGETBUDDY_AGENT_POOL_SIZE", 64))
+AGENT_IDLE_SECONDS = float(os.getenv("BUDGETBUDDY_AGENT_IDLE_SECONDS", 1800))
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+def _load_environment():
+    """Load .env once, on first use rather than at import time"""
+    if "env_loaded" not in _shared:
+        from dotenv import load_dotenv
+        load_dotenv(".env")
+        _shared["env_loaded"] = True
+
+def get_model_id():
+    """Bedrock model id from the environment"""
+    _load_environment()
+    return os.getenv('BEDROCK_MODEL_ID', DEFAULT_MODEL_ID)
+
+def get_bedrock_model():
+    """
+    Process-wide BedrockModel, built on first use.
+
+    boto3 clients are thread-safe, so one client and its connection pool serve
+    every agent. The pool is sized for concurrent sessions, connections are
+    kept alive, and botocore's adaptive retry mode backs off on throttling.
+    """
+    with _shared_lock:
+        if "model" not in _shared:
+            import boto3
+            from botocore.config import Config
+            from strands.models import BedrockModel
+            
+            _load_environment()
+            session = boto3.Session(
+                aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+                aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+                region_name=os.getenv('AWS_REGION', 'us-east-1')
+            )
+            client_config = Config(
+                max_pool_connections=BEDROCK_MAX_POOL_CONNECTIONS,
+                tcp_keepalive=True,
+                connect_timeout=BEDROCK_CONNECT_TIMEOUT,
+                read_timeout=BEDROCK_READ_TIMEOUT,
+                retries={"max_attempts": BEDROCK_MAX_ATTEMPTS, "mode": "adaptive"}
+            )
+            _shared["model"] = BedrockModel(
+                boto_session=session,
+                boto_client_config=client_config,
+                model_id=get_model_id()
+            )
+        return _shared["model"]
+
+def estimate_message_tokens(message):
+    """Rough token count for one conversation message (~4 characters per token)"""
+    size = 0
+    for block in message.get("content", []):
+        text = block.get("text")
+        size += len(text) if text is not None else len(json.dumps(block, default=str))
+    return size // 4 + 1
+
+def warm_up():
+    """Import the SDKs and build the shared Bedrock client ahead of the first request"""
+    get_bedrock_model()
+    from strands import Agent  # noqa: F401
 
 class BudgetBuddyAgent:
     """
     A simple agentic AI financial coach that creates personalized savings plans.
-    """
-    def __init__(self):
-        # Initialize the Bedrock client and provider with environment variables
-        self.session = boto3.Session(
-            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),      # Changed
-            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'), # Changed
-            region_name=os.getenv('AWS_REGION', 'us-east-1')
-        )
-        self.bedrock_runtime = self.session.client('bedrock-runtime')
 
-        self.model_provider = BedrockModel(
-            client=self.bedrock_runtime,
-            model_id=os.getenv('BEDROCK_MODEL_ID', 'aanthropic.claude-3-5-haiku-20241022-v1:0')  # Changed
-        )
+    Construction is cheap: the Bedrock client is shared process-wide and the
+    strands agent is only built on the first call. Calls go through the
+    process-wide ModelGateway (or the one given), so identical requests in
+    flight share one Bedrock call and throttling slows every session down
+    together; priority orders this agent's calls against others waiting for
+    the limiter.
+    """
+    def __init__(self, max_history_tokens=AGENT_HISTORY_TOKENS, tools=None, priority=PRIORITY_INTERACTIVE,
+                 gateway=None):
+        self._model_id = None
+        self.max_history_tokens = max_history_tokens
+        self.tools = list(tools or [])
+        self.user_id = None
+        self.priority = priority
+        self.gateway = gateway
+        self._agent = None
 
         # Define the agent's personality and goal
         self.system_prompt = """You are BudgetBuddy Pro, a comprehensive financial advisor. Provide detailed, personalized financial advice including:
@@ -37,12 +119,205 @@ class BudgetBuddyAgent:
         Be specific, practical, and supportive. Use financial data to provide quantitative recommendations.
         """
 
-        # Create the agent with access to its tools
-        self.agent = Agent(
-            model=self.model_provider,
-            system_prompt=self.system_prompt
+    @property
+    def model_id(self):
+        """Bedrock model id; reading it is what first loads .env"""
+        if self._model_id is None:
+            self._model_id = get_model_id()
+        return self._model_id
+
+    @property
+    def model_provider(self):
+        return get_bedrock_model()
+
+    @property
+    def agent(self):
+        """The strands agent, created on first use"""
+        if self._agent is None:
+            from strands import Agent
+            self._agent = Agent(
+                model=self.model_provider,
+                system_prompt=self.system_prompt,
+                tools=self.tools
+            )
+        return self._agent
+
+    @agent.setter
+    def agent(self, value):
+        self._agent = value
+
+    @property
+    def messages(self):
+        """Conversation so far; empty until the strands agent is built"""
+        return self._agent.messages if self._agent is not None else []
+
+    def set_tools(self, tools, user_id=None):
+        """
+        Tools the model may call, reading user_id's data; a strands agent
+        built with other tools is rebuilt.
+        """
+        tools = list(tools)
+        self.user_id = user_id
+        if tools != self.tools:
+            self.tools = tools
+            self._agent = None
+
+    def _gateway(self):
+        return self.gateway or get_model_gateway()
+
+    def _record(self, user_input, response):
+        """Add an exchange answered for another agent to this one's history"""
+        self.agent.messages.extend([
+            {"role": "user", "content": [{"text": user_input}]},
+            {"role": "assistant", "content": [{"text": str(response)}]},
+        ])
+        self.trim_history()
+
+    def trim_history(self):
+        """
+        Drop the oldest messages until the history fits max_history_tokens.
+
+        The most recent exchange is always kept, and the history always
+        restarts at a plain user turn so tool calls aren't split from their results.
+        """
+        if self._agent is None:
+            return
+        messages = self._agent.messages
+        sizes = [estimate_message_tokens(message) for message in messages]
+        total = sum(sizes)
+        start = 0
+        while total > self.max_history_tokens and start < len(messages) - 2:
+            total -= sizes[start]
+            start += 1
+        while start < len(messages) - 2 and not self._is_user_turn(messages[start]):
+            start += 1
+        if start:
+            del messages[:start]
+
+    @staticmethod
+    def _is_user_turn(message):
+        return message.get("role") == "user" and not any(
+            "toolResult" in block for block in message.get("content", [])
         )
 
+    @traced()
     def run(self, user_input: str) -> str:
+        return self._gateway().call(request_key("run", self, user_input),
+                                    lambda: self._run(user_input), self.priority,
+                                    on_shared=lambda response: self._record(user_input, response))
+
+    def _run(self, user_input):
         response = self.agent(user_input)
-        return response
\ No newline at end of file
+        self.trim_history()
+        return response
+
+    @traced()
+    def run_structured(self, user_input: str, output_model=AnalysisReport):
+        """
+        Answer as an instance of output_model, a pydantic model.
+
+        strands exposes the model's schema as a tool the model has to call,
+        and the tool input is validated locally. If validation fails the
+        request is repeated once with the errors spelled out; a second
+        failure is raised to the caller.
+        """
+        from pydantic import ValidationError
+        from strands.types.exceptions import StructuredOutputException
+        try:
+            result = self._structured_output(output_model, user_input)
+        except (ValidationError, StructuredOutputException) as e:
+            result = self._structured_output(output_model, build_repair_prompt(user_input, e))
+        self.trim_history()
+        return output_model.model_validate(result)
+
+    def _structured_output(self, output_model, prompt):
+        # strands doesn't add structured output calls to the history, so
+        # there is nothing to record for callers sharing the answer
+        return self._gateway().call(request_key("structured", self, prompt, output_model.__name__),
+                                    lambda: self.agent.structured_output(output_model, prompt),
+                                    self.priority)
+
+    async def astream(self, user_input: str):
+        """Async iterator over response text chunks as the model produces them"""
+        async for event in self.agent.stream_async(user_input):
+            if "data" in event:
+                yield event["data"]
+        self.trim_history()
+
+    def stream(self, user_input: str):
+        """Sync iterator over response text chunks as the model produces them"""
+        return self._gateway().stream(request_key("stream", self, user_input),
+                                      lambda: self._stream(user_input), self.priority,
+                                      on_shared=lambda chunks: self._record(user_input, "".join(chunks)))
+
+    def _stream(self, user_input):
+        chunks = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for chunk in self.astream(user_input):
+                    chunks.put(chunk)
+            except Exception as e:
+                chunks.put(e)
+            finally:
+                chunks.put(done)
+
+        # Run the event loop on its own thread so this works inside callers
+        # that already have one running (e.g. Streamlit)
+        worker = threading.Thread(target=lambda: asyncio.run(pump()), daemon=True)
+        worker.start()
+        while True:
+            chunk = chunks.get()
+            if chunk is done:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+        worker.join()
+
+
+class AgentPool:
+    """
+    Agents checked out per session (or user) key.
+
+    Each key gets its own agent so conversations never mix between sessions.
+    Agents idle for longer than idle_seconds are dropped, and once the pool
+    holds max_size agents the least recently used one is evicted.
+    """
+    def __init__(self, factory=BudgetBuddyAgent, max_size=AGENT_POOL_SIZE, idle_seconds=AGENT_IDLE_SECONDS):
+        self.factory = factory
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self._agents = OrderedDict()  # key -> (agent, last used)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Get the agent for key, creating it if needed"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            if key in self._agents:
+                agent, _ = self._agents.pop(key)
+            else:
+                agent = self.factory()
+            self._agents[key] = (agent, now)
+            while len(self._agents) > self.max_size:
+                self._agents.popitem(last=False)
+            return agent
+
+    def release(self, key):
+        """Drop the agent for key, e.g. when its session ends"""
+        with self._lock:
+            self._agents.pop(key, None)
+
+    def _evict_idle(self, now):
+        # Entries are kept in last-used order, so idle ones are at the front
+        while self._agents:
+            key, (_, last_used) = next(iter(self._agents.items()))
+            if now - last_used <= self.idle_seconds:
+                break
+            del self._agents[key]
+
+    def __len__(self):
+        return len(self._agents)
\ No newline at end of file
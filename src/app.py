@@ -1,31 +1,46 @@
+import importlib
 import streamlit as st
-from components.savings_recommender import render_savings_recommender
-from components.income_expense_tracker import render_income_expense_tracker
-from components.visualization import render_visualization
-from components.tips_review import render_tips_review
+from components.utils.storage import get_document_cache, get_user_id, register_session_flush
+from components.utils.files import StorageError
+from components.utils.tracing import trace_rerun
 
 # Page config
 st.set_page_config(page_title="BudgetBuddy Pro", page_icon="💸", layout="wide")
 
-st.title("💰 BudgetBuddy Pro")
-st.caption("Complete Financial Planning for Test User")
+# Page label -> (module, render function). Modules are imported the first
+# time their page is shown, so pandas, Plotly and the agent stack stay out
+# of the cold start until a page needs them.
+PAGES = {
+    "🎯 Savings Target": ("components.savings_recommender", "render_savings_recommender"),
+    "📊 Monthly Tracking": ("components.income_expense_tracker", "render_income_expense_tracker"),
+    "📈 Visualization": ("components.visualization", "render_visualization"),
+    "💡 Tips & Review": ("components.tips_review", "render_tips_review"),
+}
 
-# Create tabs for the 4 sections
-tab1, tab2, tab3, tab4 = st.tabs([
-    "🎯 Savings Target", 
-    "📊 Monthly Tracking", 
-    "📈 Visualization", 
-    "💡 Tips & Review"
-])
+def load_page(label):
+    """Render function for a page, importing its module on first use"""
+    module_name, function_name = PAGES[label]
+    return getattr(importlib.import_module(module_name), function_name)
 
-with tab1:
-    render_savings_recommender()
+# Each run of this script is one traced rerun (a no-op unless BUDGETBUDDY_TRACE=1)
+with trace_rerun():
+    # Stop here rather than run on top of unreadable data. Reads through the
+    # shared cache, so the file is only parsed again after a write
+    try:
+        get_document_cache().get(get_user_id())
+    except StorageError as e:
+        st.error(f"Could not load your data: {e}")
+        st.stop()
+    register_session_flush()
 
-with tab2:
-    render_income_expense_tracker()
+    st.title("💰 BudgetBuddy Pro")
+    st.caption("Complete Financial Planning for Test User")
 
-with tab3:
-    render_visualization()
+    # Only the selected page runs, unlike st.tabs which renders every tab on each rerun
+    page = st.radio("Section", list(PAGES), horizontal=True, key="page", label_visibility="collapsed")
+    load_page(page)()
 
-with tab4:
-    render_tips_review()
\ No newline at end of file
+    # Hidden panel: open the app with ?diagnostics=1
+    if st.query_params.get("diagnostics") == "1":
+        from components.diagnostics import render_diagnostics
+        render_diagnostics()
@@ -0,0 +1,193 @@
+"""
+Headless batch generation of monthly reviews for every user in a data directory.
+
+    python src/batch_review.py --data-dir data --output reviews.jsonl
+    python src/batch_review.py --model fake --rate 50     # offline dry run
+
+Results are appended to the output file as one JSON object per line. Every
+finished (user, analysis type) pair is also recorded in a checkpoint file, so
+rerunning the same command after an interruption resumes where it stopped.
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from components.utils.backends import create_backend
+from components.utils.data_tools import FinancialDataTools
+from components.utils.model import Profile, split_years
+from components.utils.gateway import ModelGateway
+from components.utils.ratelimit import PRIORITY_BATCH
+from components.tips_review import (
+    ANALYSIS_TYPES,
+    TOOLS_DIGEST_TOKEN_BUDGET,
+    build_financial_context,
+    create_analysis_prompt,
+    extract_savings_recommendation,
+)
+
+
+def load_agent_factory(model):
+    """Resolve --model to a zero-argument callable that builds an agent"""
+    if model == "bedrock":
+        from agent import BudgetBuddyAgent
+        return BudgetBuddyAgent
+    if model == "fake":
+        from fake_agent import FakeBudgetBuddyAgent
+        return FakeBudgetBuddyAgent
+    module_name, _, attr = model.partition(":")
+    if not attr:
+        raise ValueError(f"--model must be 'bedrock', 'fake' or 'module:callable', got '{model}'")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def load_checkpoint(path):
+    """Set of (user_id, analysis_type) pairs already written"""
+    done = set()
+    if os.path.exists(path):
+        with open(path, 'r', encoding="utf-8") as f:
+            for line in f:
+                user_id, _, analysis_type = line.rstrip("\n").partition("\t")
+                if analysis_type:
+                    done.add((user_id, analysis_type))
+    return done
+
+
+class BatchReviewRunner:
+    """
+    Runs analyses for many users through a worker pool.
+
+    Every model call goes through one ModelGateway, which applies the rate
+    limit and retries throttled calls. Agents with a gateway attribute are
+    handed it; any other agent's whole call is run through it.
+    """
+    def __init__(self, backend, agent_factory, output_path, checkpoint_path=None,
+                 analysis_types=("Comprehensive Review",), workers=4, rate=2.0,
+                 max_retries=5, base_delay=1.0, gateway=None):
+        self.backend = backend
+        self.agent_factory = agent_factory
+        self.output_path = output_path
+        self.checkpoint_path = checkpoint_path or f"{output_path}.checkpoint"
+        self.analysis_types = list(analysis_types)
+        self.workers = workers
+        self.gateway = gateway or ModelGateway(rate=rate, min_rate=rate / 20, burst=max(1.0, rate),
+                                               max_retries=max_retries, base_delay=base_delay)
+        self._write_lock = threading.Lock()
+
+    def pending_jobs(self):
+        """(user_id, analysis_type) pairs not yet in the checkpoint"""
+        done = load_checkpoint(self.checkpoint_path)
+        return [
+            (user_id, analysis_type)
+            for user_id in self.backend.list_users()
+            for analysis_type in self.analysis_types
+            if (user_id, analysis_type) not in done
+        ]
+
+    def run(self):
+        """Process every pending job; returns counts of ok/error results"""
+        jobs = self.pending_jobs()
+        counts = {"ok": 0, "error": 0}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch-review") as pool:
+            for record in pool.map(lambda job: self.process(*job), jobs):
+                counts[record["status"]] += 1
+        return counts
+
+    def process(self, user_id, analysis_type):
+        """Generate, record and checkpoint one analysis"""
+        started = time.time()
+        record = {"user_id": user_id, "analysis_type": analysis_type}
+        try:
+            profile = Profile.from_dict(self.backend.load_profile(user_id))
+            years, _ = split_years(self.backend.load_months(user_id))
+            # One set of tools per user; the stored data doesn't change during the run
+            tools = FinancialDataTools(self.backend, user_id)
+
+            # Fresh agent per job so conversation history doesn't leak between users
+            agent = self.agent_factory()
+            # Interactive sessions go first if the gateway is shared with the app
+            if hasattr(agent, "priority"):
+                agent.priority = PRIORITY_BATCH
+
+            def call():
+                has_tools = hasattr(agent, "set_tools")
+                if has_tools:
+                    agent.set_tools(tools.as_strands_tools(), user_id=user_id)
+                context = (build_financial_context(profile, years, token_budget=TOOLS_DIGEST_TOKEN_BUDGET)
+                           if has_tools else build_financial_context(profile, years))
+                if hasattr(agent, "run_structured"):
+                    report = agent.run_structured(
+                        create_analysis_prompt(context, analysis_type, structured=True, tools=has_tools))
+                    return report.analysis, report.recommended_monthly_savings, report.action_items
+                response = str(agent.run(create_analysis_prompt(context, analysis_type, tools=has_tools)))
+                return response, extract_savings_recommendation(response), []
+
+            if hasattr(agent, "gateway"):
+                agent.gateway = self.gateway
+                response, recommended_amount, action_items = call()
+            else:
+                response, recommended_amount, action_items = self.gateway.call(
+                    (user_id, analysis_type), call, PRIORITY_BATCH)
+            record.update({
+                "status": "ok",
+                "recommended_amount": recommended_amount,
+                "action_items": action_items,
+                "response": response
+            })
+        except Exception as e:
+            record.update({"status": "error", "error": f"{type(e).__name__}: {e}"})
+        record["elapsed_seconds"] = round(time.time() - started, 3)
+
+        self._write(record)
+        return record
+
+    def _write(self, record):
+        with self._write_lock:
+            with open(self.output_path, 'a', encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+            # Failed jobs stay out of the checkpoint so a rerun retries them
+            if record["status"] == "ok":
+                with open(self.checkpoint_path, 'a', encoding="utf-8") as f:
+                    f.write(f"{record['user_id']}\t{record['analysis_type']}\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate AI reviews for every stored user")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--storage-mode", default=os.getenv("BUDGETBUDDY_STORAGE_MODE", "json"),
+                        help="json, journal or sqlite")
+    parser.add_argument("--output", default="reviews.jsonl")
+    parser.add_argument("--checkpoint", default=None,
+                        help="defaults to <output>.checkpoint")
+    parser.add_argument("--analysis-type", action="append", choices=ANALYSIS_TYPES,
+                        help="repeat for several; defaults to Comprehensive Review")
+    parser.add_argument("--model", default="bedrock",
+                        help="bedrock, fake, or module:callable returning an agent")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=2.0, help="max model calls per second")
+    parser.add_argument("--max-retries", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    runner = BatchReviewRunner(
+        create_backend(args.storage_mode, data_dir=args.data_dir),
+        load_agent_factory(args.model),
+        args.output,
+        checkpoint_path=args.checkpoint,
+        analysis_types=args.analysis_type or ["Comprehensive Review"],
+        workers=args.workers,
+        rate=args.rate,
+        max_retries=args.max_retries,
+    )
+    counts = runner.run()
+    print(f"✅ {counts['ok']} reviews written, ❌ {counts['error']} failed")
+    return 0 if counts["error"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,45 @@
+import streamlit as st
+import pandas as pd
+from .utils.tracing import get_tracer
+from .utils.gateway import peek_model_gateway
+from .utils.storage import get_document_cache
+
+def render_diagnostics():
+    """Span latency panel, shown in the sidebar when the app is opened with ?diagnostics=1"""
+    with st.sidebar.expander("🩺 Diagnostics", expanded=True):
+        gateway = peek_model_gateway()
+        if gateway is not None:
+            st.markdown("**Model calls**")
+            st.dataframe(pd.DataFrame([gateway.stats()]), use_container_width=True, hide_index=True)
+        documents = get_document_cache()
+        st.caption(f"User documents: {len(documents)} cached ({documents.bytes / 1e6:.1f} MB), "
+                   f"{documents.hits} hits, {documents.misses} misses")
+
+        tracer = get_tracer()
+        if tracer is None:
+            st.caption("Tracing is off. Start the app with BUDGETBUDDY_TRACE=1 to record timings.")
+            return
+
+        summary = tracer.summary()
+        if not summary:
+            st.caption("No spans recorded yet.")
+            return
+
+        st.markdown("**Rolling latency (ms)**")
+        st.dataframe(
+            pd.DataFrame.from_dict(summary, orient="index").sort_values("p95_ms", ascending=False),
+            use_container_width=True,
+            column_config={
+                name: st.column_config.NumberColumn(name, format="%.1f")
+                for name in ("p50_ms", "p95_ms", "p99_ms")
+            }
+        )
+
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        spans = tracer.recent_spans(ctx.session_id if ctx is not None else None)
+        if spans:
+            st.markdown("**Previous rerun**")
+            st.dataframe(pd.DataFrame(spans)[["name", "duration_ms", "thread", "error"]],
+                         use_container_width=True, hide_index=True)
+        st.caption(f"Spans: {tracer.trace_path} · Metrics: {tracer.metrics_path}")
@@ -1,113 +1,258 @@
 import streamlit as st
-from .utils.storage import get_month_data, update_month_data, get_profile
-import calendar
+import numpy as np
+import pandas as pd
+from .utils.storage import (
+    get_month_data, update_month_data, update_months_data, get_year_ledger, get_profile, import_statement,
+    set_category_override
+)
+from .utils.schema import INCOME_FIELDS, EXPENSE_FIELDS, MONTH_NAMES, month_key as make_month_key
+from .utils.model import YearLedger
+from .utils.tracing import traced
 
+AMOUNT_FIELDS = INCOME_FIELDS + EXPENSE_FIELDS
+
+# Column labels for the bulk editor, matching the single-month form
+FIELD_LABELS = {
+    "salary": "Salary/Wages",
+    "investment": "Investment Income",
+    "other_income": "Other Income",
+    "rent": "Rent/Mortgage",
+    "groceries": "Groceries",
+    "transportation": "Transportation",
+    "utilities": "Utilities",
+    "entertainment": "Entertainment",
+    "other_expenses": "Other Expenses",
+}
+
+GRID_COLUMNS = {
+    **{field: st.column_config.NumberColumn(label, min_value=0.0, format="dollar", required=True)
+       for field, label in FIELD_LABELS.items()},
+    "completed": st.column_config.CheckboxColumn("Completed"),
+}
+
+@traced()
 def render_income_expense_tracker():
     st.header("📊 Monthly Income & Expense Tracking")
     
     # Get current year and months
     current_year = "2024"
-    months = list(calendar.month_name[1:])
+    months = list(MONTH_NAMES)
+    
+    monthly_target = get_profile().monthly_savings_target
     
-    # Create tabs for each month
-    month_tabs = st.tabs(months)
+    render_statement_import()
     
-    for i, month_tab in enumerate(month_tabs):
-        month_name = months[i]
-        month_key = f"{month_name.lower()}_{current_year}"
+    mode = st.radio("Entry mode", ["Single month", "Bulk editor"], horizontal=True,
+                    key="tracker_mode")
+    if mode == "Bulk editor":
+        render_bulk_editor(current_year, monthly_target)
+        return
+    
+    # Only the selected month is rendered
+    month_name = st.selectbox("Month", months, key="tracker_month")
+    render_month_form(month_name, current_year, monthly_target)
+
+@traced()
+def render_statement_import():
+    """Upload a bank statement and add its transactions to the monthly buckets"""
+    with st.expander("📥 Import Bank Statement"):
+        uploaded = st.file_uploader("Statement file (CSV, OFX/QFX or QIF)",
+                                    type=["csv", "ofx", "qfx", "qif"], key="statement_file")
+        account = st.text_input("Account (optional)", key="statement_account",
+                                help="Name the card or account when you import statements from more than one, "
+                                     "so a purchase that appears on two of them isn't skipped as a duplicate.")
+        dayfirst = st.checkbox("Dates are day-first (e.g. 31/01/2024)", key="statement_dayfirst")
+        use_agent = st.checkbox("Ask the AI coach to categorize merchants the rules don't recognise",
+                                key="statement_use_agent")
+        if uploaded is not None and st.button("Import Statement", key="import_statement"):
+            resolver = None
+            if use_agent:
+                resolver = resolve_merchants_with_agent
+            try:
+                with st.spinner("Importing transactions..."):
+                    result = import_statement(uploaded, dayfirst=dayfirst, resolver=resolver,
+                                              account=account.strip() or None)
+            except ValueError as e:
+                st.error(f"Could not import statement: {e}")
+                return
+            st.success(f"Imported {result['imported']:,} transactions into {len(result['months'])} month(s).")
+            if result["duplicates"] or result["invalid"]:
+                st.caption(f"Skipped {result['duplicates']:,} already imported and "
+                           f"{result['invalid']:,} unreadable rows.")
         
-        with month_tab:
-            st.subheader(f"{month_name} {current_year}")
-            
-            # Load existing data for this month
-            month_data = get_month_data(month_key)
-            income_data = month_data.get("income", {})
-            expenses_data = month_data.get("expenses", {})
-            savings_data = month_data.get("savings", {})
+        # Category rules apply to future imports
+        with st.form(key="category_rule_form"):
+            st.markdown("**🏷️ Category Rules**")
+            col1, col2 = st.columns(2)
+            with col1:
+                keyword = st.text_input("Merchant or keyword", key="rule_keyword")
+            with col2:
+                category = st.selectbox("Category", list(AMOUNT_FIELDS),
+                                        format_func=FIELD_LABELS.get, key="rule_category")
+            if st.form_submit_button("Add Rule") and keyword.strip():
+                set_category_override(keyword, category)
+                st.success(f"Transactions matching '{keyword.strip()}' will go to {FIELD_LABELS[category]}.")
+
+def resolve_merchants_with_agent(merchants):
+    """Categorize unrecognised merchants with one prompt to a fresh agent"""
+    from agent import BudgetBuddyAgent
+    from .utils.categorizer import resolve_with_agent
+    try:
+        return resolve_with_agent(BudgetBuddyAgent(), merchants)
+    except Exception as e:
+        st.warning(f"AI categorization unavailable, using other expenses: {e}")
+        return {}
+
+@traced()
+def render_month_form(month_name, current_year, monthly_target):
+    """Income and expense form for a single month"""
+    month_key = f"{month_name.lower()}_{current_year}"
+    st.subheader(f"{month_name} {current_year}")
+    
+    # Load existing data for this month
+    month_data = get_month_data(month_key)
+    income_data = month_data.get("income", {})
+    expenses_data = month_data.get("expenses", {})
+    savings_data = month_data.get("savings", {})
+    
+    with st.form(key=f"form_{month_key}"):
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.markdown("**💰 Income Sources**")
+            salary = st.number_input("Salary/Wages", min_value=0.0, 
+                                  value=income_data.get("salary", 0.0), 
+                                  key=f"salary_{month_key}", step=100.0)
+            investment = st.number_input("Investment Income", min_value=0.0, 
+                                      value=income_data.get("investment", 0.0),
+                                      key=f"investment_{month_key}", step=50.0)
+            other_income = st.number_input("Other Income", min_value=0.0, 
+                                         value=income_data.get("other_income", 0.0),
+                                         key=f"other_income_{month_key}", step=50.0)
+            total_income = salary + investment + other_income
+            st.metric("Total Income", f"${total_income:,.2f}")
+        
+        with col2:
+            st.markdown("**💸 Expenses**")
+            rent = st.number_input("Rent/Mortgage", min_value=0.0,
+                                 value=expenses_data.get("rent", 0.0),
+                                 key=f"rent_{month_key}", step=100.0)
+            groceries = st.number_input("Groceries", min_value=0.0,
+                                      value=expenses_data.get("groceries", 0.0),
+                                      key=f"groceries_{month_key}", step=50.0)
+            transportation = st.number_input("Transportation", min_value=0.0,
+                                           value=expenses_data.get("transportation", 0.0),
+                                           key=f"transportation_{month_key}", step=50.0)
+            utilities = st.number_input("Utilities", min_value=0.0,
+                                      value=expenses_data.get("utilities", 0.0),
+                                      key=f"utilities_{month_key}", step=50.0)
+            entertainment = st.number_input("Entertainment", min_value=0.0,
+                                          value=expenses_data.get("entertainment", 0.0),
+                                          key=f"entertainment_{month_key}", step=50.0)
+            other_expenses = st.number_input("Other Expenses", min_value=0.0,
+                                           value=expenses_data.get("other_expenses", 0.0),
+                                           key=f"other_expenses_{month_key}", step=50.0)
+            total_expenses = rent + groceries + transportation + utilities + entertainment + other_expenses
+            st.metric("Total Expenses", f"${total_expenses:,.2f}")
+        
+        # Savings section
+        st.markdown("**💵 Savings**")
+        
+        # Calculations
+        cash_flow = total_income - total_expenses
+        savings_difference = cash_flow - monthly_target
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Monthly Cash Flow", f"${cash_flow:,.2f}")
+        with col2:
+            st.metric("Savings Target", f"${monthly_target:,.2f}")
+        with col3:
+            st.metric("Savings Difference", f"${savings_difference:,.2f}",
+                     delta_color="inverse" if savings_difference < 0 else "normal")
+        
+        if st.form_submit_button(f"Save {month_name} Data"):
+            updated_data = {
+                "income": {
+                    "salary": salary,
+                    "investment": investment,
+                    "other_income": other_income,
+                    "total": total_income
+                },
+                "expenses": {
+                    "rent": rent,
+                    "groceries": groceries,
+                    "transportation": transportation,
+                    "utilities": utilities,
+                    "entertainment": entertainment,
+                    "other_expenses": other_expenses,
+                    "total": total_expenses
+                },
+                "savings": {
+                    "target": monthly_target,
+                    "actual": cash_flow,
+                    "difference": savings_difference
+                },
+                "cash_flow": cash_flow,
+                "completed": True
+            }
             
-            with st.form(key=f"form_{month_key}"):
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    st.markdown("**💰 Income Sources**")
-                    salary = st.number_input("Salary/Wages", min_value=0.0, 
-                                          value=income_data.get("salary", 0.0), 
-                                          key=f"salary_{month_key}", step=100.0)
-                    investment = st.number_input("Investment Income", min_value=0.0, 
-                                              value=income_data.get("investment", 0.0),
-                                              key=f"investment_{month_key}", step=50.0)
-                    other_income = st.number_input("Other Income", min_value=0.0, 
-                                                 value=income_data.get("other_income", 0.0),
-                                                 key=f"other_income_{month_key}", step=50.0)
-                    total_income = salary + investment + other_income
-                    st.metric("Total Income", f"${total_income:,.2f}")
-                
-                with col2:
-                    st.markdown("**💸 Expenses**")
-                    rent = st.number_input("Rent/Mortgage", min_value=0.0,
-                                         value=expenses_data.get("rent", 0.0),
-                                         key=f"rent_{month_key}", step=100.0)
-                    groceries = st.number_input("Groceries", min_value=0.0,
-                                              value=expenses_data.get("groceries", 0.0),
-                                              key=f"groceries_{month_key}", step=50.0)
-                    transportation = st.number_input("Transportation", min_value=0.0,
-                                                   value=expenses_data.get("transportation", 0.0),
-                                                   key=f"transportation_{month_key}", step=50.0)
-                    utilities = st.number_input("Utilities", min_value=0.0,
-                                              value=expenses_data.get("utilities", 0.0),
-                                              key=f"utilities_{month_key}", step=50.0)
-                    entertainment = st.number_input("Entertainment", min_value=0.0,
-                                                  value=expenses_data.get("entertainment", 0.0),
-                                                  key=f"entertainment_{month_key}", step=50.0)
-                    other_expenses = st.number_input("Other Expenses", min_value=0.0,
-                                                   value=expenses_data.get("other_expenses", 0.0),
-                                                   key=f"other_expenses_{month_key}", step=50.0)
-                    total_expenses = rent + groceries + transportation + utilities + entertainment + other_expenses
-                    st.metric("Total Expenses", f"${total_expenses:,.2f}")
-                
-                # Savings section
-                st.markdown("**💵 Savings**")
-                profile = get_profile()
-                monthly_target = profile.get("monthly_savings_target", 0)
-                
-                # Calculations
-                cash_flow = total_income - total_expenses
-                savings_difference = cash_flow - monthly_target
-                
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    st.metric("Monthly Cash Flow", f"${cash_flow:,.2f}")
-                with col2:
-                    st.metric("Savings Target", f"${monthly_target:,.2f}")
-                with col3:
-                    st.metric("Savings Difference", f"${savings_difference:,.2f}",
-                             delta_color="inverse" if savings_difference < 0 else "normal")
-                
-                if st.form_submit_button(f"Save {month_name} Data"):
-                    updated_data = {
-                        "income": {
-                            "salary": salary,
-                            "investment": investment,
-                            "other_income": other_income,
-                            "total": total_income
-                        },
-                        "expenses": {
-                            "rent": rent,
-                            "groceries": groceries,
-                            "transportation": transportation,
-                            "utilities": utilities,
-                            "entertainment": entertainment,
-                            "other_expenses": other_expenses,
-                            "total": total_expenses
-                        },
-                        "savings": {
-                            "target": monthly_target,
-                            "actual": cash_flow,
-                            "difference": savings_difference
-                        },
-                        "cash_flow": cash_flow,
-                        "completed": True
-                    }
-                    
-                    update_month_data(month_key, updated_data)
-                    st.success(f"{month_name} data saved successfully!")
\ No newline at end of file
+            update_month_data(month_key, updated_data)
+            st.success(f"{month_name} data saved successfully!")
+
+def build_month_grid(ledger):
+    """One row per month of a YearLedger, one column per income/expense category"""
+    grid = ledger.to_frame()[list(AMOUNT_FIELDS)]
+    grid["completed"] = ledger.completed
+    return grid
+
+def validate_grid(grid):
+    """Error messages for blank, non-numeric or negative amounts in the grid"""
+    amounts = grid[list(AMOUNT_FIELDS)].apply(pd.to_numeric, errors="coerce")
+    bad = (amounts.isna() | (amounts < 0)).stack()
+    return [
+        f"{month} {FIELD_LABELS[field]}: amounts must be numbers of zero or more"
+        for month, field in bad[bad].index
+    ]
+
+def grid_to_month_records(grid, monthly_target, year, rows=None):
+    """Month documents for a full 12-month grid; totals are computed column-wise"""
+    ledger = YearLedger.from_frame(year, grid, completed=grid["completed"], monthly_target=monthly_target)
+    months = ledger.to_months()
+    if rows is None:
+        return months
+    return {make_month_key(year, i + 1): months[make_month_key(year, i + 1)] for i in np.flatnonzero(rows)}
+
+@traced()
+def render_bulk_editor(current_year, monthly_target):
+    """Spreadsheet of months x categories, saved in one storage write"""
+    st.subheader(f"All Months {current_year}")
+    st.caption("Edit any cells, then save once. Months with changed amounts are marked completed.")
+    
+    original = build_month_grid(get_year_ledger(current_year))
+    
+    with st.form(key="bulk_editor_form"):
+        edited = st.data_editor(original, column_config=GRID_COLUMNS, num_rows="fixed",
+                                use_container_width=True, key="bulk_editor_grid")
+        submitted = st.form_submit_button("Save All Months")
+    
+    if not submitted:
+        return
+    
+    errors = validate_grid(edited)
+    if errors:
+        for error in errors:
+            st.error(error)
+        return
+    
+    fields = list(AMOUNT_FIELDS)
+    amounts_changed = (edited[fields].to_numpy(dtype=np.float64) != original[fields].to_numpy()).any(axis=1)
+    changed = amounts_changed | (edited["completed"].to_numpy(dtype=bool) != original["completed"].to_numpy())
+    if not changed.any():
+        st.info("No changes to save.")
+        return
+    
+    edited = edited.copy()
+    edited["completed"] = edited["completed"].to_numpy(dtype=bool) | amounts_changed
+    if update_months_data(grid_to_month_records(edited, monthly_target, current_year, rows=changed)):
+        st.success(f"Saved {int(changed.sum())} month(s) successfully!")
@@ -1,6 +1,26 @@
 import streamlit as st
+import pandas as pd
 from .utils.storage import get_profile, update_profile
+from .utils.retirement_sim import simulate_retirement
+from .utils.tracing import traced
 
+# Starting form values for profile fields that haven't been saved yet
+FORM_DEFAULTS = {
+    "current_age": 25,
+    "retirement_age": 65,
+    "current_income": 5000,
+    "current_savings": 10000,
+    "risk_tolerance": "Moderate",
+    "inflation_rate": 2.5
+}
+
+def _form_value(profile, name, default=None):
+    """The saved profile field, or the form's starting value if it hasn't been saved"""
+    if profile.is_set(name):
+        return getattr(profile, name)
+    return FORM_DEFAULTS[name] if default is None else default
+
+@traced()
 def render_savings_recommender():
     st.header("🎯 Recommended Monthly Savings")
     
@@ -12,33 +32,44 @@ def render_savings_recommender():
         
         with col1:
             current_age = st.number_input("Current Age", min_value=18, max_value=70, 
-                                        value=profile.get("current_age", 25))
+                                        value=_form_value(profile, "current_age"))
             retirement_age = st.number_input("Target Retirement Age", min_value=50, max_value=80, 
-                                           value=profile.get("retirement_age", 65))
+                                           value=_form_value(profile, "retirement_age"))
             current_income = st.number_input("Current Monthly Income ($)", min_value=0, 
-                                           value=profile.get("current_income", 5000), step=500)
+                                           value=_form_value(profile, "current_income"), step=500)
         
         with col2:
             current_savings = st.number_input("Current Total Savings ($)", min_value=0, 
-                                            value=profile.get("current_savings", 10000), step=1000)
+                                            value=_form_value(profile, "current_savings"), step=1000)
             risk_tolerance = st.selectbox("Risk Tolerance", 
                                         ["Conservative", "Moderate", "Aggressive"],
                                         index=["Conservative", "Moderate", "Aggressive"].index(
-                                            profile.get("risk_tolerance", "Moderate")))
+                                            _form_value(profile, "risk_tolerance")))
             inflation_rate = st.number_input("Expected Inflation Rate (%)", min_value=0.0, 
-                                           value=profile.get("inflation_rate", 2.5), step=0.1)
+                                           value=_form_value(profile, "inflation_rate"), step=0.1)
         
-        # Calculate recommended savings (simplified)
+        # Project the saved target with a local Monte Carlo simulation
         years_to_retirement = retirement_age - current_age
-        recommended_monthly = current_income * 0.20  # 20% of income
+        projection = None
+        if years_to_retirement > 0:
+            projection = simulate_retirement(
+                current_age, retirement_age, float(current_savings),
+                float(_form_value(profile, "monthly_savings_target", current_income * 0.20)),
+                risk_tolerance, float(inflation_rate), monthly_income=float(current_income)
+            )
+            recommended_monthly = projection["required_monthly"]
+        else:
+            recommended_monthly = current_income * 0.20  # 20% of income
         
-        # Button to calculate based on a simple rule of thumb
+        # Button to show the simulated minimum for the retirement goal
         if st.form_submit_button("Calculate Recommended Savings"):
-            st.metric("Recommended Monthly Savings", f"${recommended_monthly:,.2f}")
+            st.metric("Recommended Monthly Savings", f"${recommended_monthly:,.2f}",
+                      help=f"Minimum to reach ${projection['goal']:,.0f} (today's dollars) on "
+                           f"{projection['confidence']:.0%} of simulated markets" if projection else None)
         
         # User can adjust the target
         monthly_target = st.number_input("Your Monthly Savings Target ($)", min_value=0.0, 
-                                    value=profile.get("monthly_savings_target", float(recommended_monthly)), 
+                                    value=float(_form_value(profile, "monthly_savings_target", recommended_monthly)), 
                                     step=100.0)
         
         if st.form_submit_button("Save Profile & Target"):
@@ -53,4 +84,27 @@ def render_savings_recommender():
             }
         
             update_profile(updated_profile)
-            st.success("Profile and savings target updated successfully!")
\ No newline at end of file
+            st.success("Profile and savings target updated successfully!")
+    
+    if projection:
+        render_retirement_projection(projection)
+
+@traced()
+def render_retirement_projection(projection):
+    """Show the Monte Carlo projection for the saved savings target"""
+    st.subheader("📈 Retirement Projection")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Chance of Reaching Goal", f"{projection['success_probability']:.0%}")
+    with col2:
+        st.metric("Median Balance at Retirement", f"${projection['median_balance']:,.0f}")
+    with col3:
+        st.metric("Retirement Goal", f"${projection['goal']:,.0f}")
+    
+    bands = pd.DataFrame(
+        projection["bands"],
+        index=pd.Index(projection["ages"], name="Age"),
+        columns=[f"{p}th percentile" for p in projection["percentiles"]]
+    )
+    st.line_chart(bands)
+    st.caption("Balances in today's dollars across 100,000 simulated market and inflation paths.")
\ No newline at end of file
@@ -1,7 +1,11 @@
 import streamlit as st
+import logging
 import sys
 import os
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 # Add the parent directory to Python path for proper imports
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -9,9 +13,59 @@ parent_dir = os.path.dirname(current_dir)
 if parent_dir not in sys.path:
     sys.path.insert(0, parent_dir)
 
-from agent import BudgetBuddyAgent
-from .utils.storage import get_profile, get_all_months_data, update_profile
+from agent import BudgetBuddyAgent, AgentPool, warm_up
+from .utils.storage import get_user_record, get_aggregates, update_profile, get_user_id, get_data_tools
+from .utils.aggregates import RunningAggregates
+from .utils.model import Profile, completed_rows
+from .utils.analysis_cache import get_analysis_cache, make_cache_key
+from .utils.context_digest import compile_financial_digest, DIGEST_TOKEN_BUDGET
+from .utils.tracing import traced, propagate
+from .utils.recommendation import SavingsRecommendation
 
+logger = logging.getLogger(__name__)
+
+ANALYSIS_TYPES = ["Comprehensive Review", "Savings Strategy", "Expense Optimization", "Retirement Planning"]
+
+# Limits for running several analyses at once
+ANALYSIS_MAX_CONCURRENCY = int(os.getenv("BUDGETBUDDY_ANALYSIS_CONCURRENCY", 4))
+ANALYSIS_TIMEOUT_SECONDS = float(os.getenv("BUDGETBUDDY_ANALYSIS_TIMEOUT", 90))
+
+# Digest budget when the agent can look up month-level detail with its data tools
+TOOLS_DIGEST_TOKEN_BUDGET = int(os.getenv("BUDGETBUDDY_TOOLS_DIGEST_BUDGET", 120))
+
+# Monthly summary figures: RunningAggregates name -> YearLedger field
+SUMMARY_FIELDS = {
+    "income": "income_total",
+    "expenses": "expenses_total",
+    "savings_actual": "savings_actual",
+    "savings_target": "savings_target"
+}
+
+_SAVINGS_TARGET = re.compile(r'NEW SAVINGS TARGET:\s*\$([\d,]+(?:\.\d{2})?)')
+_DOLLAR_AMOUNT = re.compile(r'\$\d{1,3}(?:,\d{3})*(?:\.\d{2})?')
+
+# Follow-up after a streamed answer that didn't state a parseable target
+RECOVER_RECOMMENDATION_PROMPT = (
+    "State the new monthly savings target you just recommended, as an exact dollar amount, "
+    "with a one-sentence rationale."
+)
+
+TEXT_INSTRUCTIONS = """CRITICAL: When suggesting savings target changes, ALWAYS provide:
+    - Exact dollar amount (e.g., $1,250 instead of "increase by 25%")
+    - Clear rationale for the change
+    - Specific implementation steps
+    - Follow a strict format for easy extraction: NEW SAVINGS TARGET: $<amount>"""
+
+STRUCTURED_INSTRUCTIONS = """CRITICAL: Answer through the structured output fields:
+    - analysis: the analysis itself, in Markdown
+    - recommended_monthly_savings: the exact new monthly savings target in dollars (e.g., 1250, not "increase by 25%")
+    - rationale: a clear rationale for that target
+    - action_items: specific implementation steps, one per item"""
+
+TOOLS_INSTRUCTIONS = """The summary above is brief. Use the month_breakdown, category_trend and savings_gap
+    tools to look up the months and categories your advice depends on before answering."""
+
+@traced()
 def render_tips_review():
     st.header("💡 AI-Powered Financial Analysis")
     
@@ -23,34 +77,31 @@ def render_tips_review():
     if 'show_adjustment' not in st.session_state:
         st.session_state.show_adjustment = False
     
-    # Initialize agent
-    @st.cache_resource
-    def load_agent():
-        try:
-            return BudgetBuddyAgent()
-        except Exception as e:
-            st.error(f"❌ Failed to initialize AI agent: {str(e)}")
-            return None
+    start_agent_warm_up()
     
-    agent = load_agent()
+    # Initialize agent: one per session, so conversations never mix
+    try:
+        agent = load_agent_pool().get(get_session_key())
+    except Exception as e:
+        st.error(f"❌ Failed to initialize AI agent: {str(e)}")
+        agent = None
     
     # Get available data
     try:
-        profile = get_profile() or {}
-        all_months = get_all_months_data() or {}
+        record = get_user_record()
+        profile, years = record.profile, record.years
+        aggregates = get_aggregates()
     except Exception as e:
         st.error(f"❌ Error loading data: {str(e)}")
-        profile = {}
-        all_months = {}
+        profile, years = Profile(), {}
+        aggregates = RunningAggregates()
     
     # Check what data we have
-    has_profile = bool(profile and any(profile.values()))
-    has_monthly_data = bool(all_months and any(
-        month.get('completed', False) for month in all_months.values()
-    ))
+    has_profile = any(profile.to_dict().values())
+    has_monthly_data = aggregates.completed > 0
     
     # Display current target
-    current_target = profile.get('monthly_savings_target', 0)
+    current_target = profile.monthly_savings_target
     if current_target > 0:
         st.metric("Current Monthly Savings Target", f"${current_target:,.2f}")
     
@@ -67,7 +118,7 @@ def render_tips_review():
     st.subheader("🔍 Select Analysis Type")
     analysis_type = st.radio(
         "Choose analysis focus:",
-        ["Comprehensive Review", "Savings Strategy", "Expense Optimization", "Retirement Planning"],
+        ANALYSIS_TYPES,
         horizontal=True,
         key="analysis_type_selector"
     )
@@ -75,12 +126,42 @@ def render_tips_review():
     # Generate analysis button
     if st.button("🚀 Generate AI Analysis", type="primary", use_container_width=True, key="generate_analysis_btn"):
         with st.spinner("🧠 Analyzing your financial situation..."):
-            analysis_result = generate_analysis_content(agent, analysis_type, profile, all_months)
+            # Render the response as it streams in rather than after the last token
+            stream_placeholder = st.empty()
+            user_id = get_user_id()
+            analysis_result = generate_analysis_content(
+                attach_data_tools(agent, user_id), analysis_type, profile, years, aggregates,
+                user_id=user_id,
+                on_chunk=lambda text: stream_placeholder.markdown(highlight_dollar_amounts(text))
+            )
             st.session_state.analysis_generated = True
             st.session_state.current_analysis = analysis_result
             st.session_state.show_adjustment = analysis_result.get('has_recommendation', False)
             st.rerun()
     
+    # Full report: every analysis type at once, shown as each one finishes
+    if st.button("📑 Generate Full Report", use_container_width=True, key="generate_full_report_btn"):
+        placeholders = {}
+        for report_type in ANALYSIS_TYPES:
+            placeholders[report_type] = st.empty()
+            placeholders[report_type].info(f"⏳ {report_type}: waiting...")
+        
+        report = {}
+        user_id = get_user_id()
+        for result in generate_analyses_concurrently(
+            lambda: attach_data_tools(BudgetBuddyAgent(), user_id) if agent else None,
+            ANALYSIS_TYPES, profile, years, aggregates, user_id=user_id
+        ):
+            report[result['type']] = result
+            with placeholders[result['type']].container():
+                display_analysis_results(result)
+        st.session_state.full_report = report
+    elif st.session_state.get('full_report'):
+        st.subheader("📑 Full Report")
+        for report_type, result in st.session_state.full_report.items():
+            with st.expander(report_type):
+                display_analysis_results(result)
+    
     # Display analysis results if they exist
     if st.session_state.analysis_generated and st.session_state.current_analysis:
         display_analysis_results(st.session_state.current_analysis)
@@ -92,11 +173,56 @@ def render_tips_review():
                 profile
             )
 
-def generate_analysis_content(agent, analysis_type, profile, all_months):
-    """Generate analysis content and return as dictionary"""
+@st.cache_resource
+def start_agent_warm_up():
+    """
+    Build the shared Bedrock client in the background, once per server process.
+
+    Started when this page is first opened rather than at server start, so
+    the SDK imports don't compete with the first render of the app.
+    """
+    if os.getenv("BUDGETBUDDY_WARM_UP", "1") == "1":
+        threading.Thread(target=warm_up, name="agent-warm-up", daemon=True).start()
+    return True
+
+@st.cache_resource
+def load_agent_pool():
+    """Process-wide pool of per-session agents"""
+    return AgentPool()
+
+def get_session_key():
+    """Pool key for the current browser session and user"""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    session_id = ctx.session_id if ctx is not None else "default"
+    return f"{get_user_id()}:{session_id}"
+
+def attach_data_tools(agent, user_id):
+    """Let the agent query the user's stored months rather than relying on the prompt alone"""
+    if agent is not None and hasattr(agent, 'set_tools'):
+        agent.set_tools(get_data_tools(user_id).as_strands_tools(), user_id=user_id)
+    return agent
+
+def generate_analysis_content(agent, analysis_type, profile, years, aggregates=None, user_id=None,
+                              on_chunk=None):
+    """
+    Generate analysis content and return as dictionary.
+
+    Results are cached per user when user_id is given. When on_chunk is given
+    the response is streamed and on_chunk is called with the text so far;
+    otherwise agents that support it answer with a validated AnalysisReport.
+    Agents with data tools get a shorter digest and look up the rest.
+    """
+    cache_key = None
     try:
-        context = build_financial_context(profile, all_months)
-        prompt = create_analysis_prompt(context, analysis_type)
+        has_tools = bool(getattr(agent, 'tools', None))
+        context = build_financial_context(
+            profile, years, aggregates,
+            token_budget=TOOLS_DIGEST_TOKEN_BUDGET if has_tools else DIGEST_TOKEN_BUDGET
+        )
+        streaming = on_chunk is not None and hasattr(agent, 'stream')
+        structured = not streaming and hasattr(agent, 'run_structured')
+        prompt = create_analysis_prompt(context, analysis_type, structured=structured, tools=has_tools)
         
         if not agent:
             return {
@@ -106,14 +232,36 @@ def generate_analysis_content(agent, analysis_type, profile, all_months):
                 'recommended_amount': None
             }
         
-        response = agent.run(prompt)
-        recommended_amount = extract_savings_recommendation(response)
+        if user_id is not None:
+            cache_key = make_cache_key(context, analysis_type, agent.system_prompt, agent.model_id)
+            cached = get_analysis_cache().get(user_id, cache_key)
+            if cached is not None:
+                return dict(cached, cached=True)
         
-        return {
+        extras = {}
+        if streaming:
+            response = ""
+            for chunk in agent.stream(prompt):
+                response += chunk
+                on_chunk(response)
+            recommended_amount = extract_savings_recommendation(response)
+            if recommended_amount is None and hasattr(agent, 'run_structured'):
+                recommended_amount = recover_recommendation(agent)
+        elif structured:
+            report = agent.run_structured(prompt)
+            response = report.analysis
+            recommended_amount = report.recommended_monthly_savings
+            extras = {'rationale': report.rationale, 'action_items': report.action_items}
+        else:
+            response = str(agent.run(prompt))
+            recommended_amount = extract_savings_recommendation(response)
+        
+        result = {
             'type': analysis_type,
             'response': response,
             'has_recommendation': recommended_amount is not None,
-            'recommended_amount': recommended_amount
+            'recommended_amount': recommended_amount,
+            **extras
         }
         
     except Exception as e:
@@ -123,38 +271,110 @@ def generate_analysis_content(agent, analysis_type, profile, all_months):
             'has_recommendation': False,
             'recommended_amount': None
         }
+    
+    if cache_key is not None:
+        try:
+            get_analysis_cache().put(user_id, cache_key, result)
+        except Exception:
+            # The analysis itself succeeded; it just won't be reused
+            logger.warning("Could not cache the %s analysis", analysis_type, exc_info=True)
+    return result
+
+def generate_analyses_concurrently(agent_factory, analysis_types, profile, years, aggregates=None,
+                                   user_id=None, max_concurrency=ANALYSIS_MAX_CONCURRENCY,
+                                   timeout=ANALYSIS_TIMEOUT_SECONDS, cancel_event=None):
+    """
+    Run several analyses in parallel and yield each result as it finishes.
+
+    Each analysis gets its own agent from agent_factory because an agent's
+    conversation can't be shared between concurrent calls. At most
+    max_concurrency calls run at once, and a call still running timeout
+    seconds after it started is reported as timed out. Setting cancel_event,
+    or closing the generator, drops every analysis that hasn't started.
+    """
+    started = {}
+    
+    def run(analysis_type):
+        started[analysis_type] = time.monotonic()
+        return generate_analysis_content(agent_factory(), analysis_type, profile, years,
+                                         aggregates, user_id=user_id)
+    
+    executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="analysis")
+    try:
+        pending = {executor.submit(propagate(run), analysis_type): analysis_type for analysis_type in analysis_types}
+        while pending:
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            done, _ = wait(pending, timeout=0.25, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.pop(future)
+                yield future.result()
+            
+            now = time.monotonic()
+            for future, analysis_type in list(pending.items()):
+                if analysis_type in started and now - started[analysis_type] > timeout:
+                    # The worker thread can't be interrupted; abandon its result
+                    pending.pop(future)
+                    yield {
+                        'type': analysis_type,
+                        'response': f"Analysis timed out after {timeout:.0f} seconds. Please try again.",
+                        'has_recommendation': False,
+                        'recommended_amount': None,
+                        'timed_out': True
+                    }
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def _or_not_set(value):
+    return "Not set" if value is None else value
 
-def build_financial_context(profile, all_months):
-    """Build context string from available data"""
+def _summary_totals(years, aggregates):
+    """(completed months, {summary figure: total}) from the aggregates, or from the ledgers without them"""
+    if aggregates is not None:
+        return aggregates.completed, {name: aggregates.total(name) for name in SUMMARY_FIELDS}
+    keys, matrix = completed_rows(years, tuple(SUMMARY_FIELDS.values()))
+    return len(keys), dict(zip(SUMMARY_FIELDS, matrix.sum(axis=0).tolist()))
+
+@traced()
+def build_financial_context(profile, years, aggregates=None, token_budget=DIGEST_TOKEN_BUDGET):
+    """
+    Build context string from a Profile and {year: YearLedger}, preferring precomputed aggregates.
+
+    When years is given, a statistical digest of the history is appended,
+    capped at token_budget estimated tokens however many months there are.
+    """
     context = "USER'S FINANCIAL CONTEXT:\n\n"
     
-    if profile:
+    if profile.to_dict():
         context += "👤 PROFILE:\n"
-        context += f"- Age: {profile.get('current_age', 'Not set')}\n"
-        context += f"- Retirement Goal: {profile.get('retirement_age', 'Not set')}\n"
-        context += f"- Monthly Income: ${profile.get('current_income', 0):,.2f}\n"
-        context += f"- Risk Tolerance: {profile.get('risk_tolerance', 'Not set')}\n"
-        context += f"- Monthly Savings Target: ${profile.get('monthly_savings_target', 0):,.2f}\n\n"
+        context += f"- Age: {_or_not_set(profile.current_age)}\n"
+        context += f"- Retirement Goal: {_or_not_set(profile.retirement_age)}\n"
+        context += f"- Monthly Income: ${profile.current_income:,.2f}\n"
+        context += f"- Risk Tolerance: {_or_not_set(profile.risk_tolerance)}\n"
+        context += f"- Monthly Savings Target: ${profile.monthly_savings_target:,.2f}\n\n"
     
-    if all_months:
-        completed_months = [month for month in all_months.values() if month.get('completed')]
-        if completed_months:
-            context += "📊 MONTHLY SUMMARY:\n"
-            total_actual = sum(month.get('savings', {}).get('actual', 0) for month in completed_months)
-            total_target = sum(month.get('savings', {}).get('target', 0) for month in completed_months)
-            avg_income = sum(month.get('income', {}).get('total', 0) for month in completed_months) / len(completed_months)
-            avg_expenses = sum(month.get('expenses', {}).get('total', 0) for month in completed_months) / len(completed_months)
-            
-            context += f"- Tracked Months: {len(completed_months)}\n"
-            context += f"- Total Savings: ${total_actual:,.2f} of ${total_target:,.2f} target\n"
-            context += f"- Avg Monthly Income: ${avg_income:,.2f}\n"
-            context += f"- Avg Monthly Expenses: ${avg_expenses:,.2f}\n"
-            context += f"- Avg Monthly Savings: ${(total_actual/len(completed_months)):,.2f}\n\n"
+    completed, totals = _summary_totals(years or {}, aggregates)
+    if completed:
+        context += "📊 MONTHLY SUMMARY:\n"
+        context += f"- Tracked Months: {completed}\n"
+        context += f"- Total Savings: ${totals['savings_actual']:,.2f} of ${totals['savings_target']:,.2f} target\n"
+        context += f"- Avg Monthly Income: ${totals['income'] / completed:,.2f}\n"
+        context += f"- Avg Monthly Expenses: ${totals['expenses'] / completed:,.2f}\n"
+        context += f"- Avg Monthly Savings: ${totals['savings_actual'] / completed:,.2f}\n\n"
+    
+    if years:
+        context += compile_financial_digest(years, token_budget)
     
     return context
 
-def create_analysis_prompt(context, analysis_type):
-    """Create prompt for specific analysis type with explicit savings target request"""
+def create_analysis_prompt(context, analysis_type, structured=False, tools=False):
+    """
+    Create prompt for specific analysis type with explicit savings target request.
+
+    With structured=True the target, rationale and steps go in the report
+    fields instead of a NEW SAVINGS TARGET line in the text; with tools=True
+    the model is told to look up detail with its data tools.
+    """
     prompts = {
         "Comprehensive Review": """
         Provide a complete financial health assessment. Include:
@@ -199,12 +419,8 @@ def create_analysis_prompt(context, analysis_type):
     ANALYSIS REQUEST: {analysis_type}
     
     {prompts.get(analysis_type, 'Provide comprehensive financial advice')}
-    
-    CRITICAL: When suggesting savings target changes, ALWAYS provide:
-    - Exact dollar amount (e.g., $1,250 instead of "increase by 25%")
-    - Clear rationale for the change
-    - Specific implementation steps
-    - Follow a strict format for easy extraction: NEW SAVINGS TARGET: $<amount>
+    {TOOLS_INSTRUCTIONS if tools else ""}
+    {STRUCTURED_INSTRUCTIONS if structured else TEXT_INSTRUCTIONS}
     
     Please provide:
     - Specific, actionable recommendations with examples
@@ -216,7 +432,7 @@ def create_analysis_prompt(context, analysis_type):
 
 def extract_savings_recommendation(response):
     """Extract savings target recommendation from AI response"""
-    match = re.search(r'NEW SAVINGS TARGET:\s*\$([\d,]+(?:\.\d{2})?)', str(response))
+    match = _SAVINGS_TARGET.search(str(response))
     if match:
         amount_str = match.group(1).replace(',', '')
         try:
@@ -225,30 +441,48 @@ def extract_savings_recommendation(response):
             return None
     return None
 
+def recover_recommendation(agent):
+    """
+    Ask for just the target, as structured output, when a streamed answer
+    didn't include one in the expected format. Much cheaper than generating
+    the whole analysis again; None if that fails too.
+    """
+    try:
+        return agent.run_structured(RECOVER_RECOMMENDATION_PROMPT, SavingsRecommendation).recommended_monthly_savings
+    except Exception:
+        return None
+
+def highlight_dollar_amounts(response):
+    """Bold dollar amounts in the response, in one pass over the text"""
+    return _DOLLAR_AMOUNT.sub(r"**\g<0>**", str(response))
+
 def display_analysis_results(analysis_data):
     """Display analysis results from session state"""
     st.subheader(f"📋 {analysis_data['type']} Analysis")
+    if analysis_data.get('cached'):
+        st.caption("⚡ Loaded from cache - your data hasn't changed since this analysis was generated")
     st.markdown("---")
     
-    # Highlight dollar amounts in the response
-    highlighted_response = str(analysis_data['response'])
-    dollar_matches = re.findall(r'\$\d{1,3}(?:,\d{3})*(?:\.\d{2})?', highlighted_response)
-    for match in dollar_matches:
-        highlighted_response = highlighted_response.replace(
-            match, f"**{match}**"
-        )
+    highlighted_response = highlight_dollar_amounts(analysis_data['response'])
     
     with st.container():
         st.markdown(highlighted_response)
+        if analysis_data.get('action_items'):
+            st.markdown("**Action items**\n" + "\n".join(
+                f"- {highlight_dollar_amounts(item)}" for item in analysis_data['action_items']
+            ))
+        if analysis_data.get('rationale') and analysis_data.get('recommended_amount') is not None:
+            st.caption(f"Why ${analysis_data['recommended_amount']:,.2f}: {analysis_data['rationale']}")
     
     st.success("✅ AI analysis completed!")
 
+@traced()
 def render_savings_adjustment_section(recommended_amount, current_profile):
     """Render savings adjustment section"""
     st.markdown("---")
     st.subheader("🎯 Savings Target Adjustment")
     
-    current_target = current_profile.get('monthly_savings_target', 0)
+    current_target = current_profile.monthly_savings_target
     
     # Show comparison
     col1, col2, col3 = st.columns(3)
@@ -291,7 +525,7 @@ def render_savings_adjustment_section(recommended_amount, current_profile):
         
         if submitted:
             # Update the profile
-            updated_profile = current_profile.copy()
+            updated_profile = current_profile.to_dict()
             updated_profile['monthly_savings_target'] = new_target
             update_profile(updated_profile)
             
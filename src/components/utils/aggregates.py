@@ -0,0 +1,143 @@
+import copy
+from .schema import INCOME_FIELDS, EXPENSE_FIELDS
+
+# Per-month figures tracked for min/max over completed months
+EXTREME_FIELDS = ("income", "expenses", "savings_actual")
+
+
+def _month_values(month):
+    """Pull the figures the aggregates track out of one month document"""
+    income = month.get("income", {})
+    expenses = month.get("expenses", {})
+    savings = month.get("savings", {})
+    return {
+        "income": income.get("total", 0),
+        "expenses": expenses.get("total", 0),
+        "savings_actual": savings.get("actual", 0),
+        "savings_target": savings.get("target", 0),
+        "categories": {
+            "income": {field: income.get(field, 0) for field in INCOME_FIELDS},
+            "expenses": {field: expenses.get(field, 0) for field in EXPENSE_FIELDS}
+        }
+    }
+
+
+def _year_of(month_key):
+    return month_key.rpartition("_")[2]
+
+
+def _empty_state():
+    return {
+        "months": 0,
+        "completed": 0,
+        "totals": {"income": 0.0, "expenses": 0.0, "savings_actual": 0.0, "savings_target": 0.0},
+        "categories": {
+            "income": {field: 0.0 for field in INCOME_FIELDS},
+            "expenses": {field: 0.0 for field in EXPENSE_FIELDS}
+        },
+        "min": {field: None for field in EXTREME_FIELDS},
+        "max": {field: None for field in EXTREME_FIELDS},
+        "extremes_stale": False,
+        "years": {}
+    }
+
+
+class RunningAggregates:
+    """
+    Running totals over a user's months, updated in O(1) per month change.
+
+    Totals, averages, per-category sums and min/max cover completed months,
+    matching what the Tips tab summarizes. Per-year sums of savings target and
+    actual plus completion counts cover every stored month, matching the
+    Visualization tab's yearly cards.
+
+    Removing the month that currently holds a min or max can't be undone
+    incrementally, so it only marks the extremes stale; they are recomputed
+    from the months on the next read.
+    """
+    def __init__(self, state=None):
+        self.state = state if state is not None else _empty_state()
+
+    @classmethod
+    def from_months(cls, all_months):
+        """Build aggregates with one pass over all months"""
+        aggregates = cls()
+        for month_key, month in all_months.items():
+            aggregates._add(month_key, month, 1)
+        return aggregates
+
+    def to_dict(self):
+        return copy.deepcopy(self.state)
+
+    def apply(self, month_key, old_month, new_month):
+        """Replace one month's contribution with its new data"""
+        if old_month:
+            self._add(month_key, old_month, -1)
+        if new_month:
+            self._add(month_key, new_month, 1)
+
+    def _add(self, month_key, month, sign):
+        state = self.state
+        year = state["years"].setdefault(
+            _year_of(month_key), {"months": 0, "completed": 0, "target": 0.0, "actual": 0.0}
+        )
+        values = _month_values(month)
+        completed = bool(month.get("completed"))
+
+        state["months"] += sign
+        year["months"] += sign
+        year["target"] += sign * values["savings_target"]
+        year["actual"] += sign * values["savings_actual"]
+        if not completed:
+            return
+
+        state["completed"] += sign
+        year["completed"] += sign
+        for field in state["totals"]:
+            state["totals"][field] += sign * values[field]
+        for group, fields in values["categories"].items():
+            for field, amount in fields.items():
+                state["categories"][group][field] += sign * amount
+
+        for field in EXTREME_FIELDS:
+            value = values[field]
+            low, high = state["min"][field], state["max"][field]
+            if sign > 0:
+                state["min"][field] = value if low is None else min(low, value)
+                state["max"][field] = value if high is None else max(high, value)
+            elif value == low or value == high:
+                state["extremes_stale"] = True
+
+    @property
+    def extremes_stale(self):
+        return self.state["extremes_stale"]
+
+    def refresh_extremes(self, all_months):
+        """Recompute min/max after a month holding an extreme was replaced"""
+        completed = [_month_values(month) for month in all_months.values() if month.get("completed")]
+        for field in EXTREME_FIELDS:
+            values = [month[field] for month in completed]
+            self.state["min"][field] = min(values) if values else None
+            self.state["max"][field] = max(values) if values else None
+        self.state["extremes_stale"] = False
+
+    @property
+    def completed(self):
+        """Number of completed months"""
+        return self.state["completed"]
+
+    def total(self, field):
+        """Sum of a figure over completed months"""
+        return self.state["totals"][field]
+
+    def average(self, field):
+        """Average of a figure over completed months"""
+        return self.state["totals"][field] / self.completed if self.completed else 0.0
+
+    def category_totals(self, group):
+        """Per-category sums over completed months ('income' or 'expenses')"""
+        return dict(self.state["categories"][group])
+
+    def year(self, year):
+        """Stored months, completed months and savings sums for one year"""
+        return dict(self.state["years"].get(str(year), {"months": 0, "completed": 0, "target": 0.0, "actual": 0.0}))
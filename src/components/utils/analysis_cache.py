@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from .files import atomic_write_json
+
+CACHE_DIR = os.getenv("BUDGETBUDDY_ANALYSIS_CACHE_DIR", "data/cache/analysis")
+CACHE_TTL_SECONDS = float(os.getenv("BUDGETBUDDY_ANALYSIS_CACHE_TTL", 24 * 3600))
+CACHE_MAX_ENTRIES = int(os.getenv("BUDGETBUDDY_ANALYSIS_CACHE_MAX_ENTRIES", 512))
+CACHE_MAX_BYTES = int(os.getenv("BUDGETBUDDY_ANALYSIS_CACHE_MAX_BYTES", 20 * 1024 * 1024))
+
+
+def make_cache_key(context, analysis_type, system_prompt, model_id):
+    """Content address for one analysis request"""
+    payload = json.dumps([context, analysis_type, system_prompt, model_id], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _user_tag(user_id):
+    return hashlib.sha1(str(user_id).encode("utf-8")).hexdigest()[:16]
+
+
+class AnalysisCache:
+    """
+    Persistent cache of AI analysis results, addressed by a hash of the inputs.
+
+    Entries live in one directory per user so a data change can drop all of a
+    user's entries at once. File modification times double as last-access
+    times, which keeps LRU order consistent across processes without a shared
+    index. Entries expire after ttl seconds, and the cache is trimmed to
+    max_entries / max_bytes, least recently used first.
+    """
+    def __init__(self, cache_dir=CACHE_DIR, ttl=CACHE_TTL_SECONDS,
+                 max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _path(self, user_id, key):
+        return os.path.join(self.cache_dir, _user_tag(user_id), f"{key}.json")
+
+    def get(self, user_id, key):
+        """Return the cached result for key, or None"""
+        path = self._path(user_id, key)
+        try:
+            with open(path, 'r', encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return self._miss()
+
+        if time.time() - entry.get("created", 0) > self.ttl:
+            self._remove(path)
+            return self._miss()
+
+        # Touch the file to mark it recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return entry["result"]
+
+    def _miss(self):
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, user_id, key, result):
+        """Store a JSON-serializable result under key"""
+        atomic_write_json(self._path(user_id, key), {"created": time.time(), "result": result})
+        self._evict()
+
+    def invalidate_user(self, user_id):
+        """Drop every cached result for a user"""
+        shutil.rmtree(os.path.join(self.cache_dir, _user_tag(user_id)), ignore_errors=True)
+
+    def clear(self):
+        """Drop every cached result"""
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def _entries(self):
+        """(last access time, size, path) for every entry on disk"""
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for user_dir in os.scandir(self.cache_dir):
+            if not user_dir.is_dir():
+                continue
+            for entry in os.scandir(user_dir.path):
+                if entry.name.endswith(".json"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self):
+        """Remove expired entries, then least recently used ones until within limits"""
+        now = time.time()
+        entries = sorted(self._entries())
+        # mtime is refreshed on every hit, so it is at least the creation time
+        live = []
+        for accessed, size, path in entries:
+            if now - accessed > self.ttl:
+                self._remove(path)
+            else:
+                live.append((accessed, size, path))
+
+        total_bytes = sum(size for _, size, _ in live)
+        while live and (len(live) > self.max_entries or total_bytes > self.max_bytes):
+            _, size, path = live.pop(0)
+            self._remove(path)
+            total_bytes -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries)
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_analysis_cache():
+    """Get the process-wide analysis cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnalysisCache()
+        return _cache
@@ -0,0 +1,611 @@
+import atexit
+import calendar
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from .journal import UserJournal, apply_record
+from .files import FileLock, StorageError, atomic_write_json
+
+MONTH_NUMBERS = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+
+# Buffered saves are written this long after the last one in a burst, and
+# never later than WRITE_MAX_DELAY_SECONDS after the first. 0 (the default)
+# writes every save through before it returns.
+WRITE_DELAY_SECONDS = float(os.getenv("BUDGETBUDDY_WRITE_DELAY", 0))
+WRITE_MAX_DELAY_SECONDS = float(os.getenv("BUDGETBUDDY_WRITE_MAX_DELAY", 5))
+
+logger = logging.getLogger(__name__)
+
+
+def month_sort_key(month_key):
+    """Chronological sort key for keys like 'january_2024'"""
+    name, _, year = month_key.rpartition("_")
+    return (int(year) if year.isdigit() else 0, MONTH_NUMBERS.get(name, 0), month_key)
+
+
+def _empty_document():
+    return {"profile": {}, "months": {}}
+
+
+class StorageBackend:
+    """
+    Interface for user data storage.
+
+    A user document is {"profile": {...}, "months": {month_key: {...}}}.
+    Backends return the document built by default_factory for users that have
+    nothing stored yet, matching the original single-file behaviour.
+    """
+    def __init__(self, data_dir="data", default_factory=None):
+        self.data_dir = data_dir
+        self.default_factory = default_factory or _empty_document
+
+    def load_user(self, user_id):
+        """Load the full user document"""
+        raise NotImplementedError
+
+    def load_profile(self, user_id):
+        """Load only the profile"""
+        raise NotImplementedError
+
+    def load_month(self, user_id, month_key):
+        """Load a single month, or None when it doesn't exist"""
+        raise NotImplementedError
+
+    def load_months(self, user_id):
+        """Load all months in chronological order"""
+        raise NotImplementedError
+
+    def save_user(self, user_id, document):
+        """Replace the full user document"""
+        raise NotImplementedError
+
+    def save_profile(self, user_id, profile):
+        """Replace the profile"""
+        raise NotImplementedError
+
+    def save_month(self, user_id, month_key, data):
+        """Replace a single month"""
+        raise NotImplementedError
+
+    def save_months(self, user_id, months):
+        """Replace several months ({month_key: data}) in one write"""
+        for month_key, data in months.items():
+            self.save_month(user_id, month_key, data)
+
+    def list_users(self):
+        """Ids of every user with stored data"""
+        raise NotImplementedError
+
+    def _list_files(self, *suffixes):
+        """User ids from files named <user_id><suffix> in data_dir"""
+        if not os.path.isdir(self.data_dir):
+            return []
+        users = set()
+        for name in os.listdir(self.data_dir):
+            for suffix in suffixes:
+                user_id = name[:-len(suffix)]
+                # Sidecars look like <user_id>.<name>.json and are skipped
+                if name.endswith(suffix) and user_id and "." not in user_id:
+                    users.add(user_id)
+        return sorted(users)
+
+    def load_meta(self, user_id, name):
+        """Load a small derived JSON document stored next to the user data"""
+        path = os.path.join(self.data_dir, f"{user_id}.{name}.json")
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save_meta(self, user_id, name, data):
+        """Store a small derived JSON document next to the user data"""
+        atomic_write_json(os.path.join(self.data_dir, f"{user_id}.{name}.json"), data)
+
+    def flush(self, user_id=None):
+        """Write out anything buffered; backends that write through have nothing to do"""
+
+
+class JsonFileBackend(StorageBackend):
+    """
+    One JSON file per user, rewritten in full on every save.
+
+    Saves go through a temp file and an atomic rename while holding a
+    cross-process lock on the user's file, and partial updates re-read the
+    file under that lock, so concurrent sessions and processes never clobber
+    each other's months or leave a half-written file behind.
+    """
+    def __init__(self, data_dir="data", default_factory=None):
+        super().__init__(data_dir, default_factory)
+        self._lock = threading.Lock()
+        # user_id -> (file stamp, parsed document); avoids re-parsing an unchanged file
+        self._cache = {}
+
+    def _path(self, user_id):
+        return os.path.join(self.data_dir, f"{user_id}.json")
+
+    def load_user(self, user_id):
+        path = self._path(user_id)
+        with self._lock:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                return self.default_factory()
+            stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            cached = self._cache.get(user_id)
+            if cached and cached[0] == stamp:
+                return cached[1]
+            try:
+                with open(path, 'r', encoding="utf-8") as f:
+                    document = json.load(f)
+            except ValueError as e:
+                # Never fall back to an empty document here: the next save
+                # would overwrite whatever is recoverable in the file
+                raise StorageError(f"{path} is not valid JSON ({e}); fix or restore it before continuing")
+            self._cache[user_id] = (stamp, document)
+            return document
+
+    def load_profile(self, user_id):
+        return self.load_user(user_id).get("profile", {})
+
+    def load_month(self, user_id, month_key):
+        return self.load_user(user_id).get("months", {}).get(month_key)
+
+    def load_months(self, user_id):
+        return self.load_user(user_id).get("months", {})
+
+    def list_users(self):
+        return self._list_files(".json")
+
+    def save_user(self, user_id, document):
+        with FileLock(self._path(user_id)):
+            self._write(user_id, document)
+
+    def _write(self, user_id, document):
+        path = self._path(user_id)
+        atomic_write_json(path, document, indent=2)
+        stat = os.stat(path)
+        with self._lock:
+            self._cache[user_id] = ((stat.st_ino, stat.st_mtime_ns, stat.st_size), document)
+
+    def _update(self, user_id, change):
+        """Read-modify-write one user's document under the file lock"""
+        with FileLock(self._path(user_id)):
+            # Copy so documents already handed out stay unchanged
+            document = dict(self.load_user(user_id))
+            change(document)
+            self._write(user_id, document)
+
+    def save_profile(self, user_id, profile):
+        self._update(user_id, lambda document: document.update(profile=profile))
+
+    def save_month(self, user_id, month_key, data):
+        self.save_months(user_id, {month_key: data})
+
+    def save_months(self, user_id, months):
+        self._update(user_id, lambda document: document.update(
+            months={**document.get("months", {}), **months}
+        ))
+
+
+class JournalBackend(StorageBackend):
+    """JSON snapshot plus an append-only journal of updates per user"""
+    def __init__(self, data_dir="data", default_factory=None):
+        super().__init__(data_dir, default_factory)
+        self._lock = threading.Lock()
+        self._journals = {}
+        # Replayed documents, kept current as records are appended
+        self._documents = {}
+        # Bumped on every append so a replay racing a write isn't cached
+        self._generation = 0
+
+    def journal(self, user_id):
+        """Get the shared journal for a user"""
+        with self._lock:
+            if user_id not in self._journals:
+                self._journals[user_id] = UserJournal(
+                    user_id, data_dir=self.data_dir, default_factory=self.default_factory
+                )
+            return self._journals[user_id]
+
+    def load_user(self, user_id):
+        with self._lock:
+            document = self._documents.get(user_id)
+            generation = self._generation
+        if document is None:
+            document = self.journal(user_id).load()
+            with self._lock:
+                if generation == self._generation:
+                    document = self._documents.setdefault(user_id, document)
+        return document
+
+    def load_profile(self, user_id):
+        return self.load_user(user_id).get("profile", {})
+
+    def load_month(self, user_id, month_key):
+        return self.load_user(user_id).get("months", {}).get(month_key)
+
+    def load_months(self, user_id):
+        return self.load_user(user_id).get("months", {})
+
+    def list_users(self):
+        return self._list_files(".json", ".journal")
+
+    def _append(self, user_id, op, data, key=None):
+        self.journal(user_id).append(op, data, key=key)
+        with self._lock:
+            self._generation += 1
+            document = self._documents.get(user_id)
+            if document is not None:
+                # Copy before applying so documents already handed out stay unchanged
+                document = dict(document)
+                document["months"] = dict(document.get("months", {}))
+                apply_record(document, {"op": op, "key": key, "data": data})
+                self._documents[user_id] = document
+
+    def save_user(self, user_id, document):
+        self._append(user_id, "document", document)
+
+    def save_profile(self, user_id, profile):
+        self._append(user_id, "profile", profile)
+
+    def save_month(self, user_id, month_key, data):
+        self._append(user_id, "month", data, key=month_key)
+
+    def save_months(self, user_id, months):
+        self._append(user_id, "months", months)
+
+
+class SqliteBackend(StorageBackend):
+    """
+    SQLite storage with one row per profile and per (user_id, month_key).
+
+    Reads are primary-key lookups and writes are single-row upserts, so the
+    cost of a request doesn't depend on how much history a user has.
+    Connections run in WAL mode and are shared through a small pool.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS profiles (
+            user_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS months (
+            user_id TEXT NOT NULL,
+            month_key TEXT NOT NULL,
+            data TEXT NOT NULL,
+            completed INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (user_id, month_key)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_months_user_completed ON months (user_id, completed);
+        CREATE TABLE IF NOT EXISTS meta (
+            user_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (user_id, name)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path="data/budgetbuddy.db", pool_size=4, default_factory=None):
+        super().__init__(os.path.dirname(path) or ".", default_factory)
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+        with self._connection() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                               isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def _transaction(self):
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def close(self):
+        """Close every pooled connection"""
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
+    def load_user(self, user_id):
+        return {"profile": self.load_profile(user_id), "months": self.load_months(user_id)}
+
+    def load_profile(self, user_id):
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT data FROM profiles WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if row is None:
+            return self.default_factory().get("profile", {})
+        return json.loads(row[0])
+
+    def load_month(self, user_id, month_key):
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT data FROM months WHERE user_id = ? AND month_key = ?",
+                (user_id, month_key)
+            ).fetchone()
+        if row is None:
+            return self.default_factory().get("months", {}).get(month_key)
+        return json.loads(row[0])
+
+    def load_months(self, user_id):
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT month_key, data FROM months WHERE user_id = ?", (user_id,)
+            ).fetchall()
+        # Stored rows override the default months, as in the single-file layout
+        months = self.default_factory().get("months", {})
+        months.update((month_key, json.loads(data)) for month_key, data in rows)
+        return dict(sorted(months.items(), key=lambda item: month_sort_key(item[0])))
+
+    def list_users(self):
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT user_id FROM profiles UNION SELECT DISTINCT user_id FROM months ORDER BY 1"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def save_user(self, user_id, document):
+        now = time.time()
+        with self._transaction() as conn:
+            self._upsert_profile(conn, user_id, document.get("profile", {}), now)
+            conn.execute("DELETE FROM months WHERE user_id = ?", (user_id,))
+            for month_key, data in document.get("months", {}).items():
+                self._upsert_month(conn, user_id, month_key, data, now)
+
+    def save_profile(self, user_id, profile):
+        with self._transaction() as conn:
+            self._upsert_profile(conn, user_id, profile, time.time())
+
+    def save_month(self, user_id, month_key, data):
+        with self._transaction() as conn:
+            self._upsert_month(conn, user_id, month_key, data, time.time())
+
+    def save_months(self, user_id, months):
+        now = time.time()
+        with self._transaction() as conn:
+            for month_key, data in months.items():
+                self._upsert_month(conn, user_id, month_key, data, now)
+
+    def load_meta(self, user_id, name):
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT data FROM meta WHERE user_id = ? AND name = ?", (user_id, name)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_meta(self, user_id, name, data):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO meta (user_id, name, data) VALUES (?, ?, ?) "
+                "ON CONFLICT (user_id, name) DO UPDATE SET data = excluded.data",
+                (user_id, name, json.dumps(data))
+            )
+
+    @staticmethod
+    def _upsert_profile(conn, user_id, profile, now):
+        conn.execute(
+            "INSERT INTO profiles (user_id, data, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+            (user_id, json.dumps(profile), now)
+        )
+
+    @staticmethod
+    def _upsert_month(conn, user_id, month_key, data, now):
+        conn.execute(
+            "INSERT INTO months (user_id, month_key, data, completed, updated_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (user_id, month_key) DO UPDATE SET data = excluded.data, "
+            "completed = excluded.completed, updated_at = excluded.updated_at",
+            (user_id, month_key, json.dumps(data), int(bool(data.get("completed"))), now)
+        )
+
+
+class CoalescingBackend(StorageBackend):
+    """
+    Buffers saves in memory and writes each user's burst in one flush.
+
+    Month, profile and meta saves are merged per user and written by a timer
+    WRITE_DELAY_SECONDS after the last save of a burst (at most
+    WRITE_MAX_DELAY_SECONDS after the first), when flush() is called, or at
+    interpreter exit. Reads see buffered saves immediately. Buffered entries
+    are only dropped once written, so a failed flush is retried by the next one.
+    """
+    def __init__(self, inner, delay=WRITE_DELAY_SECONDS, max_delay=WRITE_MAX_DELAY_SECONDS):
+        super().__init__(inner.data_dir, inner.default_factory)
+        self.inner = inner
+        self.delay = delay
+        self.max_delay = max_delay
+        # user_id -> {"months": {...}, "profile": {...}, "meta": {...}, "since": first save}
+        self._pending = {}
+        self._timers = {}
+        self._lock = threading.Lock()
+        # Serializes writes to the inner backend so flushes land in order
+        self._write_lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def _buffer(self, user_id, update):
+        with self._lock:
+            entry = self._pending.setdefault(
+                user_id, {"months": {}, "meta": {}, "since": time.monotonic()}
+            )
+            update(entry)
+            due = min(time.monotonic() + self.delay, entry["since"] + self.max_delay)
+            timer = self._timers.pop(user_id, None)
+            if timer is not None:
+                timer.cancel()
+            timer = threading.Timer(max(0.0, due - time.monotonic()), self._flush_in_background, (user_id,))
+            timer.daemon = True
+            self._timers[user_id] = timer
+            timer.start()
+
+    def _flush_in_background(self, user_id):
+        try:
+            self.flush(user_id)
+        except Exception:
+            logger.exception("Buffered save for %s failed; it will be retried on the next flush", user_id)
+
+    def flush(self, user_id=None):
+        """Write buffered saves for one user, or for everyone"""
+        with self._lock:
+            users = [user_id] if user_id is not None else list(self._pending)
+        for user in users:
+            with self._write_lock:
+                with self._lock:
+                    timer = self._timers.pop(user, None)
+                    if timer is not None:
+                        timer.cancel()
+                    entry = self._pending.get(user)
+                    if entry is None:
+                        continue
+                    snapshot = {"months": dict(entry["months"]), "meta": dict(entry["meta"]),
+                                "profile": entry.get("profile")}
+
+                if snapshot["months"]:
+                    self.inner.save_months(user, snapshot["months"])
+                if snapshot["profile"] is not None:
+                    self.inner.save_profile(user, snapshot["profile"])
+                for name, data in snapshot["meta"].items():
+                    self.inner.save_meta(user, name, data)
+
+                with self._lock:
+                    # Keep anything saved again while we were writing
+                    for group in ("months", "meta"):
+                        for key, value in snapshot[group].items():
+                            if entry[group].get(key) is value:
+                                del entry[group][key]
+                    if entry.get("profile") is snapshot["profile"]:
+                        entry.pop("profile", None)
+                    if not entry["months"] and not entry["meta"] and "profile" not in entry:
+                        self._pending.pop(user, None)
+
+    def _entry(self, user_id):
+        with self._lock:
+            entry = self._pending.get(user_id)
+            if entry is None:
+                return None
+            return {"months": dict(entry["months"]), "meta": dict(entry["meta"]),
+                    "profile": entry.get("profile")}
+
+    def load_user(self, user_id):
+        document = self.inner.load_user(user_id)
+        entry = self._entry(user_id)
+        if entry is None:
+            return document
+        document = dict(document)
+        document["months"] = self._merge_months(document.get("months", {}), entry["months"])
+        if entry["profile"] is not None:
+            document["profile"] = entry["profile"]
+        return document
+
+    def load_profile(self, user_id):
+        entry = self._entry(user_id)
+        if entry is not None and entry["profile"] is not None:
+            return entry["profile"]
+        return self.inner.load_profile(user_id)
+
+    def load_month(self, user_id, month_key):
+        entry = self._entry(user_id)
+        if entry is not None and month_key in entry["months"]:
+            return entry["months"][month_key]
+        return self.inner.load_month(user_id, month_key)
+
+    def load_months(self, user_id):
+        months = self.inner.load_months(user_id)
+        entry = self._entry(user_id)
+        return months if entry is None else self._merge_months(months, entry["months"])
+
+    @staticmethod
+    def _merge_months(stored, pending):
+        if not pending:
+            return stored
+        merged = {**stored, **pending}
+        if pending.keys() - stored.keys():
+            merged = dict(sorted(merged.items(), key=lambda item: month_sort_key(item[0])))
+        return merged
+
+    def list_users(self):
+        with self._lock:
+            pending = set(self._pending)
+        return sorted(set(self.inner.list_users()) | pending)
+
+    def save_user(self, user_id, document):
+        # A full document replaces anything buffered for the user
+        with self._write_lock:
+            with self._lock:
+                timer = self._timers.pop(user_id, None)
+                if timer is not None:
+                    timer.cancel()
+                entry = self._pending.pop(user_id, None)
+            self.inner.save_user(user_id, document)
+            for name, data in (entry or {}).get("meta", {}).items():
+                self.inner.save_meta(user_id, name, data)
+
+    def save_profile(self, user_id, profile):
+        self._buffer(user_id, lambda entry: entry.update(profile=profile))
+
+    def save_month(self, user_id, month_key, data):
+        self.save_months(user_id, {month_key: data})
+
+    def save_months(self, user_id, months):
+        self._buffer(user_id, lambda entry: entry["months"].update(months))
+
+    def load_meta(self, user_id, name):
+        entry = self._entry(user_id)
+        if entry is not None and name in entry["meta"]:
+            return entry["meta"][name]
+        return self.inner.load_meta(user_id, name)
+
+    def save_meta(self, user_id, name, data):
+        self._buffer(user_id, lambda entry: entry["meta"].update({name: data}))
+
+
+def migrate_user(source, target, user_id):
+    """Copy one user's document from one backend to another"""
+    target.save_user(user_id, source.load_user(user_id))
+
+
+BACKENDS = {
+    "json": JsonFileBackend,
+    "journal": JournalBackend,
+    "sqlite": SqliteBackend,
+}
+
+
+def create_backend(mode, default_factory=None, data_dir=None):
+    """Create the storage backend registered under mode"""
+    try:
+        backend_cls = BACKENDS[mode]
+    except KeyError:
+        raise ValueError(f"Unknown storage mode '{mode}', expected one of {sorted(BACKENDS)}")
+    if data_dir is None:
+        return backend_cls(default_factory=default_factory)
+    if backend_cls is SqliteBackend:
+        return SqliteBackend(os.path.join(data_dir, "budgetbuddy.db"), default_factory=default_factory)
+    return backend_cls(data_dir, default_factory=default_factory)
@@ -0,0 +1,246 @@
+import re
+import threading
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from .ledger import CATEGORIES, CATEGORY_CODES
+from .schema import INCOME_FIELDS, EXPENSE_FIELDS
+
+# Merchant keywords per category; matched as whole words in normalized descriptions
+DEFAULT_KEYWORDS = {
+    "salary": ["PAYROLL", "SALARY", "DIRECT DEP", "DIRECT DEPOSIT", "WAGES"],
+    "investment": ["DIVIDEND", "INTEREST PAID", "INTEREST CREDIT", "BROKERAGE", "VANGUARD", "FIDELITY"],
+    "rent": ["RENT", "MORTGAGE", "LANDLORD", "PROPERTY MGMT", "APARTMENTS", "HOA"],
+    "groceries": ["GROCERY", "GROCERIES", "SUPERMARKET", "WHOLE FOODS", "TRADER JOE", "KROGER", "SAFEWAY",
+                  "ALDI", "LIDL", "PUBLIX", "COSTCO", "WALMART SUPERCENTER", "INSTACART", "FOOD LION"],
+    "transportation": ["UBER", "LYFT", "SHELL", "CHEVRON", "EXXON", "MOBIL", "BP", "GAS STATION", "PARKING",
+                       "TRANSIT", "METRO", "TOLL", "AMTRAK", "TAXI", "AUTO INSURANCE"],
+    "utilities": ["ELECTRIC", "ENERGY", "WATER", "GAS CO", "COMCAST", "XFINITY", "VERIZON", "AT T",
+                  "T MOBILE", "INTERNET", "SPECTRUM", "UTILITY", "POWER"],
+    "entertainment": ["NETFLIX", "SPOTIFY", "HULU", "DISNEY PLUS", "HBO", "STEAM", "PLAYSTATION", "XBOX",
+                      "CINEMA", "THEATER", "THEATRE", "TICKETMASTER", "RESTAURANT", "BAR", "STARBUCKS",
+                      "UBER EATS", "DOORDASH", "GRUBHUB"],
+}
+
+# Unmatched outgoing payments seen in this many distinct months with nearly
+# the same amount are treated as bills: rent above RENT_MIN, utilities below
+RECURRING_MIN_MONTHS = 3
+RECURRING_MAX_VARIATION = 0.10
+RENT_MIN = 500.0
+
+MEMO_SIZE = 65536
+
+_NON_WORD = re.compile(r"[^A-Z0-9]+")
+_DIGITS = re.compile(r"\d+")
+_INCOME_CODES = np.array([CATEGORY_CODES[name] for name in INCOME_FIELDS], dtype=np.int16)
+_OTHER_INCOME = CATEGORY_CODES["other_income"]
+_OTHER_EXPENSES = CATEGORY_CODES["other_expenses"]
+
+
+def normalize_description(text):
+    """Uppercase words separated by single spaces, e.g. 'Whole Foods #12' -> 'WHOLE FOODS 12'"""
+    return _NON_WORD.sub(" ", str(text).upper()).strip()
+
+
+def merchant_key(text):
+    """Normalized description without store numbers, used to spot recurring payments"""
+    return " ".join(_DIGITS.sub(" ", normalize_description(text)).split())
+
+
+def _trie_pattern(node):
+    """Regex for a character trie; alternatives share prefixes and prefer the longest match"""
+    branches = []
+    for char, child in sorted(node.items()):
+        if char == "":
+            continue
+        branches.append(re.escape(char) + _trie_pattern(child))
+    if not branches:
+        return ""
+    body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    # A keyword ends here, so the longer continuations are optional
+    return f"(?:{body})?" if "" in node else body
+
+
+class Categorizer:
+    """
+    Maps raw transaction descriptions to the income/expense buckets.
+
+    Keywords are kept in a character trie that is compiled into a single
+    regular expression, so one search per description finds the longest
+    keyword at the leftmost position. Results are memoized per distinct
+    normalized description, and batches only classify each distinct
+    description once. User overrides get a trie and pattern of their own
+    that is searched first, so an override anywhere in a description wins
+    over a default keyword, even one earlier in it. Patterns are recompiled
+    lazily on the next lookup after an override is added.
+    """
+    def __init__(self, keywords=DEFAULT_KEYWORDS, overrides=None, memo_size=MEMO_SIZE):
+        self._trie = {}
+        self._override_trie = {}
+        self._categories = {}  # default keyword -> category
+        self._overrides = {}  # override keyword -> category
+        self._lock = threading.Lock()
+        self._patterns = None  # (override pattern or None, default pattern)
+        self._match = lru_cache(maxsize=memo_size)(self._match_uncached)
+        for category, words in keywords.items():
+            for word in words:
+                keyword = self._insert(self._trie, word, category)
+                if keyword:
+                    self._categories[keyword] = category
+        for word, category in (overrides or {}).items():
+            self.add_override(word, category)
+
+    @property
+    def overrides(self):
+        return dict(self._overrides)
+
+    @staticmethod
+    def _insert(trie, keyword, category):
+        """Add a keyword to a trie; returns it normalized, or None if nothing is left of it"""
+        keyword = normalize_description(keyword)
+        if not keyword:
+            return None
+        if category not in CATEGORY_CODES:
+            raise ValueError(f"Unknown category '{category}'")
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = True
+        return keyword
+
+    def add_override(self, keyword, category):
+        """Always put descriptions containing keyword into category"""
+        with self._lock:
+            keyword = self._insert(self._override_trie, keyword, category)
+            if keyword:
+                self._overrides[keyword] = category
+                self._patterns = None
+                self._match.cache_clear()
+
+    @staticmethod
+    def _compile(trie):
+        return re.compile(r"(?<![A-Z0-9])(" + _trie_pattern(trie) + r")(?![A-Z0-9])")
+
+    def _compiled(self):
+        patterns = self._patterns
+        if patterns is None:
+            with self._lock:
+                if self._patterns is None:
+                    overrides = self._compile(self._override_trie) if self._override_trie else None
+                    self._patterns = (overrides, self._compile(self._trie))
+                patterns = self._patterns
+        return patterns
+
+    def _match_uncached(self, normalized):
+        overrides, defaults = self._compiled()
+        if overrides is not None:
+            match = overrides.search(normalized)
+            if match is not None:
+                return CATEGORY_CODES[self._overrides[match.group(1)]]
+        match = defaults.search(normalized)
+        if match is None:
+            return -1
+        return CATEGORY_CODES[self._categories[match.group(1)]]
+
+    def match(self, description):
+        """Category code of the keyword found in description, or -1"""
+        return self._match(normalize_description(description))
+
+    def classify_batch(self, descriptions, amounts, dates=None):
+        """
+        Category codes for a batch of transactions, plus a mask of ambiguous ones.
+
+        Incoming money is income unless a keyword says otherwise (a refund
+        from a known shop stays in that shop's category). Outgoing payments
+        without a keyword are checked for monthly recurrence when dates are
+        given; whatever is left is other_expenses and flagged ambiguous.
+        """
+        descriptions = pd.Series(descriptions, dtype=object).fillna("").astype(str)
+        amounts = np.asarray(amounts, dtype=np.float64)
+        codes, uniques = pd.factorize(descriptions)
+        matched = np.fromiter((self.match(text) for text in uniques), dtype=np.int16,
+                              count=len(uniques))[codes] if len(uniques) else np.empty(0, dtype=np.int16)
+
+        incoming = amounts > 0
+        income_keyword = np.isin(matched, _INCOME_CODES)
+        result = np.where(
+            incoming,
+            np.where(matched >= 0, matched, _OTHER_INCOME),
+            np.where((matched >= 0) & ~income_keyword, matched, _OTHER_EXPENSES)
+        ).astype(np.int16)
+
+        unmatched = ~incoming & ((matched < 0) | income_keyword)
+        if dates is not None and unmatched.any():
+            recurring = self._recurring(descriptions[unmatched], amounts[unmatched], np.asarray(dates)[unmatched])
+            rows = np.flatnonzero(unmatched)
+            result[rows[recurring >= 0]] = recurring[recurring >= 0]
+            unmatched[rows[recurring >= 0]] = False
+        return result, unmatched
+
+    @staticmethod
+    def _recurring(descriptions, amounts, dates):
+        """Bill category for recurring outgoing payments, -1 for everything else"""
+        frame = pd.DataFrame({
+            "merchant": descriptions.map(merchant_key).to_numpy(),
+            "month": dates.astype("datetime64[M]"),
+            "amount": np.abs(amounts),
+        })
+        stats = frame.groupby("merchant").agg(months=("month", "nunique"),
+                                              mean=("amount", "mean"), std=("amount", "std"))
+        bills = stats[(stats["months"] >= RECURRING_MIN_MONTHS) &
+                      (stats["std"].fillna(0) <= stats["mean"] * RECURRING_MAX_VARIATION)]
+        category = pd.Series(np.where(bills["mean"] >= RENT_MIN, CATEGORY_CODES["rent"],
+                                      CATEGORY_CODES["utilities"]), index=bills.index)
+        return frame["merchant"].map(category).fillna(-1).to_numpy(dtype=np.int16)
+
+    def categorize(self, chunk, resolver=None):
+        """
+        Importer hook: category codes for a normalized statement chunk.
+
+        When a resolver is given, the distinct ambiguous merchants are passed
+        to it in one call; its answers become overrides and are applied here.
+        """
+        result, ambiguous = self.classify_batch(chunk["description"], chunk["amount"], chunk["date"])
+        if resolver is not None and ambiguous.any():
+            merchants = sorted(set(chunk["description"][ambiguous].map(merchant_key)) - {""})
+            for merchant, category in resolver(merchants).items():
+                if category in EXPENSE_FIELDS and merchant:
+                    self.add_override(merchant, category)
+            if merchants:
+                rows = np.flatnonzero(ambiguous)
+                retried = np.array([self.match(text) for text in chunk["description"].iloc[rows]], dtype=np.int16)
+                result[rows[retried >= 0]] = retried[retried >= 0]
+        return result
+
+
+def build_resolver_prompt(merchants):
+    """Prompt asking the model to bucket a list of merchants"""
+    lines = "\n".join(f"- {merchant}" for merchant in merchants)
+    return f"""Categorize each merchant below into exactly one of these expense categories:
+{", ".join(EXPENSE_FIELDS)}
+
+Merchants:
+{lines}
+
+Answer with one line per merchant in the form "MERCHANT => category" and nothing else."""
+
+
+def parse_resolver_response(response, merchants):
+    """{merchant: category} from 'MERCHANT => category' lines, ignoring anything unexpected"""
+    known = {merchant.upper(): merchant for merchant in merchants}
+    answers = {}
+    for line in str(response).splitlines():
+        name, sep, category = line.strip().lstrip("-* ").partition("=>")
+        merchant = known.get(name.strip().upper())
+        category = category.strip().strip(".").lower().replace(" ", "_")
+        if sep and merchant and category in EXPENSE_FIELDS:
+            answers[merchant] = category
+    return answers
+
+
+def resolve_with_agent(agent, merchants, max_merchants=100):
+    """Ask the agent to categorize ambiguous merchants in one batched prompt"""
+    merchants = list(merchants)[:max_merchants]
+    if not merchants:
+        return {}
+    return parse_resolver_response(agent.run(build_resolver_prompt(merchants)), merchants)
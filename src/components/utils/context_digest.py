@@ -0,0 +1,159 @@
+import re
+import numpy as np
+from .backends import month_sort_key
+from .schema import INCOME_FIELDS, EXPENSE_FIELDS
+from .model import FIELD_PATHS, completed_rows
+
+# Default prompt budget for the statistical digest
+DIGEST_TOKEN_BUDGET = 350
+
+# Monthly series summarized in the digest
+SERIES_FIELDS = INCOME_FIELDS + EXPENSE_FIELDS + ("savings_actual",)
+
+# Per-month totals quoted for the most recent months
+TOTAL_FIELDS = ("income_total", "expenses_total")
+
+# BPE tokenizers split long digit runs into groups of up to three digits and
+# give most short words and punctuation marks a token each
+_TOKEN_PATTERN = re.compile(r"\d{1,3}|[A-Za-z]+|[^\sA-Za-z\d]")
+
+
+def estimate_tokens(text):
+    """Fast local estimate of how many model tokens text will use"""
+    tokens = 0
+    for match in _TOKEN_PATTERN.finditer(text):
+        # Long words usually split into several tokens
+        tokens += 1 + len(match.group()) // 8
+    return tokens
+
+
+def series_stats(values):
+    """Summary statistics for one monthly series"""
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if not n:
+        return dict.fromkeys(("mean", "p10", "p50", "p90", "stdev", "volatility", "trend", "total"), 0.0)
+    mean = values.mean()
+    stdev = values.std()
+    p10, p50, p90 = np.percentile(values, [10, 50, 90])
+    # Least-squares change per month
+    x = np.arange(n) - (n - 1) / 2
+    trend = (x @ (values - mean)) / (x @ x) if n >= 2 else 0.0
+    return {
+        "mean": float(mean),
+        "p10": float(p10),
+        "p50": float(p50),
+        "p90": float(p90),
+        "stdev": float(stdev),
+        "volatility": float(stdev / mean) if mean else 0.0,
+        "trend": float(trend),
+        "total": float(values.sum())
+    }
+
+
+def _completed_series(years):
+    """Chronological (month keys, {series name: values}, {total name: values}) over completed months"""
+    keys, matrix = completed_rows(years, SERIES_FIELDS + TOTAL_FIELDS)
+    series = {}
+    for i, field in enumerate(SERIES_FIELDS):
+        group, name = FIELD_PATHS[field]
+        series[(group, "actual" if group == "savings" else name)] = matrix[:, i]
+    totals = {field: matrix[:, len(SERIES_FIELDS) + i] for i, field in enumerate(TOTAL_FIELDS)}
+    return keys, series, totals
+
+
+def _signed(value):
+    """Whole-dollar change with an explicit sign and no '-0'"""
+    return f"{round(value) + 0:+,}"
+
+
+def _label(key):
+    return key.replace("_", " ").title()
+
+
+def compile_financial_digest(years, token_budget=DIGEST_TOKEN_BUDGET, max_outliers=5):
+    """
+    Statistical digest of a {year: YearLedger} history within token_budget.
+
+    Sections are filled in priority order: savings trend, per-category
+    statistics (largest categories first), notable outliers, then the most
+    recent months. Filling stops at the first line that would exceed the
+    budget, so lower-priority sections are dropped first and the prompt size
+    is bounded no matter how long the history is. Output is deterministic
+    for the same data, which keeps downstream caches effective.
+    """
+    keys, series, totals = _completed_series(years)
+    if not keys:
+        return ""
+
+    sections = []
+
+    savings = series_stats(series[("savings", "actual")])
+    sections.append(("📈 TRENDS:", [
+        f"- History: {len(keys)} months ({_label(keys[0])} to {_label(keys[-1])})",
+        f"- Savings: median ${savings['p50']:,.0f}/mo, p10-p90 ${savings['p10']:,.0f}-${savings['p90']:,.0f}, "
+        f"trend {_signed(savings['trend'])}/mo"
+    ]))
+
+    category_lines = []
+    stats = {name: series_stats(values) for name, values in series.items() if name[0] != "savings"}
+    # Largest categories first; name breaks ties so ordering is stable
+    for (group, field), stat in sorted(stats.items(), key=lambda item: (-item[1]["total"], item[0])):
+        if not stat["total"]:
+            continue
+        category_lines.append(
+            f"- {field.replace('_', ' ')} ({group}): avg ${stat['mean']:,.0f}, "
+            f"p10-p90 ${stat['p10']:,.0f}-${stat['p90']:,.0f}, "
+            f"trend {_signed(stat['trend'])}/mo, volatility {stat['volatility']:.0%}"
+        )
+    sections.append(("🧾 CATEGORIES:", category_lines))
+
+    outliers = []
+    if len(keys) >= 6:
+        for (group, field), values in series.items():
+            stat = stats.get((group, field)) or series_stats(values)
+            if not stat["stdev"]:
+                continue
+            for key, value in zip(keys, values):
+                z = (value - stat["mean"]) / stat["stdev"]
+                if abs(z) >= 2:
+                    outliers.append((-abs(z), key, field, value, z))
+    outliers.sort(key=lambda item: (item[0], month_sort_key(item[1]), item[2]))
+    sections.append(("⚠️ OUTLIERS:", [
+        f"- {_label(key)} {field.replace('_', ' ')}: ${value:,.0f} ({z:+.1f}σ)"
+        for _, key, field, value, z in outliers[:max_outliers]
+    ]))
+
+    recent_lines = []
+    for i in reversed(range(len(keys))[-3:]):
+        recent_lines.append(
+            f"- {_label(keys[i])}: income ${totals['income_total'][i]:,.0f}, "
+            f"expenses ${totals['expenses_total'][i]:,.0f}, "
+            f"saved ${series[('savings', 'actual')][i]:,.0f}"
+        )
+    sections.append(("🗓️ RECENT MONTHS:", recent_lines))
+
+    lines = []
+    used = 0
+    full = False
+    for header, section_lines in sections:
+        if not section_lines:
+            continue
+        cost = estimate_tokens(header)
+        if used + cost + estimate_tokens(section_lines[0]) > token_budget:
+            break
+        lines.append(header)
+        used += cost
+        for line in section_lines:
+            cost = estimate_tokens(line)
+            if used + cost > token_budget:
+                full = True
+                break
+            lines.append(line)
+            used += cost
+        lines.append("")
+        # A cut-short section leaves no room for lower-priority ones
+        if full:
+            break
+
+    return "\n".join(lines)
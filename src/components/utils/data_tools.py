@@ -0,0 +1,208 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from .schema import INCOME_FIELDS, EXPENSE_FIELDS, MONTH_NAMES
+from .model import completed_rows, split_years
+from .context_digest import series_stats
+
+# Memoized tool results kept per user, and the most months one call returns
+TOOL_CACHE_SIZE = int(os.getenv("BUDGETBUDDY_TOOL_CACHE_SIZE", 128))
+TOOL_MAX_MONTHS = int(os.getenv("BUDGETBUDDY_TOOL_MAX_MONTHS", 36))
+
+BREAKDOWN_FIELDS = INCOME_FIELDS + EXPENSE_FIELDS + ("savings_target", "savings_actual")
+TREND_FIELDS = INCOME_FIELDS + EXPENSE_FIELDS + ("income_total", "expenses_total", "savings_actual")
+
+_MONTH_NUMBERS = {name.lower(): i + 1 for i, name in enumerate(MONTH_NAMES)}
+
+
+def _period(month_key):
+    """'january_2024' -> '2024-01'"""
+    name, _, year = month_key.rpartition("_")
+    return f"{year}-{_MONTH_NUMBERS[name]:02d}"
+
+
+def _check_period(value, argument):
+    if value is None:
+        return None
+    year, _, month = str(value).partition("-")
+    if not (len(year) == 4 and year.isdigit() and month.isdigit() and 1 <= int(month) <= 12):
+        raise ValueError(f"{argument} must be a month like '2024-03', got '{value}'")
+    return f"{year}-{int(month):02d}"
+
+
+def _compact(result):
+    """JSON with no whitespace, which is what the model reads"""
+    return json.dumps(result, separators=(",", ":"))
+
+
+def _money(values):
+    return [round(float(value), 2) for value in values]
+
+
+class FinancialDataTools:
+    """
+    Read-only queries over one user's completed months, for the model to call.
+
+    Instead of pasting every month into the prompt, the agent is given these
+    as tools and asks for the slices it needs. Results are compact JSON
+    strings, memoized until version() changes; pass storage's data version so
+    a write drops them, or leave the default for data that doesn't change
+    (e.g. a batch run).
+    """
+    def __init__(self, backend, user_id, version=None, max_entries=TOOL_CACHE_SIZE, max_months=TOOL_MAX_MONTHS):
+        self.backend = backend
+        self.user_id = user_id
+        self.version = version or (lambda: 0)
+        self.max_entries = max_entries
+        self.max_months = max_months
+        self._results = OrderedDict()
+        self._results_version = None
+        self._tools = None
+        self._lock = threading.Lock()
+
+    def _memo(self, name, args, compute):
+        version = self.version()
+        key = (name, args)
+        with self._lock:
+            if version != self._results_version:
+                self._results.clear()
+                self._results_version = version
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+        result = compute()
+        with self._lock:
+            if version == self._results_version:
+                self._results[key] = result
+                while len(self._results) > self.max_entries:
+                    self._results.popitem(last=False)
+        return result
+
+    def _rows(self, start, end):
+        """(periods, matrix over TREND_FIELDS + savings_target) of completed months in range"""
+        def load():
+            years, _ = split_years(self.backend.load_months(self.user_id))
+            keys, matrix = completed_rows(years, TREND_FIELDS + ("savings_target",))
+            return np.array([_period(key) for key in keys], dtype=object), matrix
+        periods, matrix = self._memo("rows", (), load)
+        mask = np.ones(len(periods), dtype=bool)
+        if start is not None:
+            mask &= periods >= start
+        if end is not None:
+            mask &= periods <= end
+        return list(periods[mask]), matrix[mask]
+
+    def _column(self, matrix, field):
+        return matrix[:, (TREND_FIELDS + ("savings_target",)).index(field)]
+
+    def month_breakdown(self, start=None, end=None):
+        """Per-category income, expenses and savings for each completed month in range"""
+        start, end = _check_period(start, "start"), _check_period(end, "end")
+
+        def compute():
+            periods, matrix = self._rows(start, end)
+            result = {"columns": ["month", *BREAKDOWN_FIELDS], "rows": []}
+            if len(periods) > self.max_months:
+                # Keep the most recent months and say how many were left out
+                result["omitted_months"] = len(periods) - self.max_months
+                periods, matrix = periods[-self.max_months:], matrix[-self.max_months:]
+            columns = [self._column(matrix, field) for field in BREAKDOWN_FIELDS]
+            for i, period in enumerate(periods):
+                result["rows"].append([period, *_money(column[i] for column in columns)])
+            return _compact(result)
+        return self._memo("month_breakdown", (start, end), compute)
+
+    def category_trend(self, category, start=None, end=None):
+        """Monthly values and summary statistics for one category in range"""
+        if category not in TREND_FIELDS:
+            raise ValueError(f"category must be one of {', '.join(TREND_FIELDS)}, got '{category}'")
+        start, end = _check_period(start, "start"), _check_period(end, "end")
+
+        def compute():
+            periods, matrix = self._rows(start, end)
+            values = self._column(matrix, category)
+            stats = series_stats(values)
+            result = {
+                "category": category,
+                "months": len(periods),
+                "stats": {name: round(value, 4 if name == "volatility" else 2) for name, value in stats.items()},
+            }
+            recent = slice(-self.max_months, None)
+            if periods:
+                result["from"] = periods[recent][0]
+                result["values"] = _money(values[recent])
+            return _compact(result)
+        return self._memo("category_trend", (category, start, end), compute)
+
+    def savings_gap(self, start=None, end=None):
+        """Savings target vs actual over completed months in range, with the worst months"""
+        start, end = _check_period(start, "start"), _check_period(end, "end")
+
+        def compute():
+            periods, matrix = self._rows(start, end)
+            # Positive gap = saved less than the target
+            gap = self._column(matrix, "savings_target") - self._column(matrix, "savings_actual")
+            worst = np.argsort(-gap, kind="stable")[:3]
+            by_year = {}
+            for period, month_gap in zip(periods, gap):
+                by_year[period[:4]] = by_year.get(period[:4], 0.0) + float(month_gap)
+            return _compact({
+                "months": len(periods),
+                "target_total": round(float(self._column(matrix, "savings_target").sum()), 2),
+                "actual_total": round(float(self._column(matrix, "savings_actual").sum()), 2),
+                "gap_total": round(float(gap.sum()), 2),
+                "months_below_target": int((gap > 0).sum()),
+                "gap_by_year": {year: round(value, 2) for year, value in by_year.items()},
+                "largest_gaps": [[periods[i], round(float(gap[i]), 2)] for i in worst if gap[i] > 0],
+            })
+        return self._memo("savings_gap", (start, end), compute)
+
+    def as_strands_tools(self):
+        """The queries as strands tools, built once per instance"""
+        if self._tools is None:
+            from strands import tool
+            queries = self
+
+            @tool
+            def month_breakdown(start: str = None, end: str = None) -> str:
+                """
+                Income by source, expenses by category and savings target/actual for each
+                completed month, as {"columns": [...], "rows": [[month, ...], ...]}.
+
+                Args:
+                    start: first month to include, like "2024-01"; omit for the earliest
+                    end: last month to include, like "2024-12"; omit for the latest
+                """
+                return queries.month_breakdown(start, end)
+
+            @tool
+            def category_trend(category: str, start: str = None, end: str = None) -> str:
+                """
+                Monthly values of one income source or expense category with mean,
+                percentiles, volatility and least-squares trend per month.
+
+                Args:
+                    category: one of salary, investment, other_income, rent, groceries,
+                        transportation, utilities, entertainment, other_expenses,
+                        income_total, expenses_total, savings_actual
+                    start: first month to include, like "2024-01"; omit for the earliest
+                    end: last month to include, like "2024-12"; omit for the latest
+                """
+                return queries.category_trend(category, start, end)
+
+            @tool
+            def savings_gap(start: str = None, end: str = None) -> str:
+                """
+                Savings target vs actual savings: totals, shortfall per year, months below
+                target and the months with the largest shortfall.
+
+                Args:
+                    start: first month to include, like "2024-01"; omit for the earliest
+                    end: last month to include, like "2024-12"; omit for the latest
+                """
+                return queries.savings_gap(start, end)
+
+            self._tools = [month_breakdown, category_trend, savings_gap]
+        return self._tools
@@ -0,0 +1,157 @@
+import copy
+import os
+import sys
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+# Memory allowed for user documents shared by every session in the process
+USER_CACHE_MAX_BYTES = int(os.getenv("BUDGETBUDDY_USER_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+
+def estimate_size(value):
+    """Approximate memory held by a JSON-like value, in bytes"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += sys.getsizeof(key) + estimate_size(item)
+    elif isinstance(value, list):
+        size += sum(estimate_size(item) for item in value)
+    return size
+
+
+class CopyOnWriteDict(MutableMapping):
+    """
+    A session's private view of a shared document.
+
+    Reads go to the shared dict, which is never modified. Writing a key keeps
+    the new value in the view only; nested dicts are wrapped in views of
+    their own when first read, so changing one month copies nothing but the
+    keys actually written. to_dict() builds the plain document to save.
+    """
+    __slots__ = ("_base", "_own", "_deleted", "_changed")
+
+    def __init__(self, base):
+        self._base = base
+        self._own = {}
+        self._deleted = set()
+        self._changed = False
+
+    def __getitem__(self, key):
+        if key in self._own:
+            return self._own[key]
+        if key in self._deleted:
+            raise KeyError(key)
+        value = self._base[key]
+        if isinstance(value, dict):
+            value = self._own[key] = CopyOnWriteDict(value)
+        elif isinstance(value, list):
+            value = self._own[key] = copy.deepcopy(value)
+        return value
+
+    def __setitem__(self, key, value):
+        self._own[key] = value
+        self._deleted.discard(key)
+        self._changed = True
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._own.pop(key, None)
+        if key in self._base:
+            self._deleted.add(key)
+        self._changed = True
+
+    def __contains__(self, key):
+        return key in self._own or (key in self._base and key not in self._deleted)
+
+    def __iter__(self):
+        for key in self._base:
+            if key not in self._deleted:
+                yield key
+        for key in self._own:
+            if key not in self._base:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    @property
+    def changed(self):
+        """Whether anything in this view (at any depth) was written"""
+        return self._changed or any(
+            value.changed for value in self._own.values() if isinstance(value, CopyOnWriteDict)
+        )
+
+    def to_dict(self):
+        return {key: value.to_dict() if isinstance(value, CopyOnWriteDict) else value
+                for key, value in self.items()}
+
+    def __repr__(self):
+        return f"CopyOnWriteDict({self.to_dict()!r})"
+
+
+def materialize(document):
+    """Plain dict for a document that may be a CopyOnWriteDict view"""
+    return document.to_dict() if isinstance(document, CopyOnWriteDict) else document
+
+
+class UserDocumentCache:
+    """
+    Process-wide read-through cache of user documents.
+
+    Entries are stored with the data version they were read at and are
+    reloaded once the version moves on, so a save in one session is seen by
+    every other session on its next read without touching the others'
+    state. Documents are shared and must be treated as read-only; hand
+    sessions a CopyOnWriteDict when they need to change one. size measures
+    an entry in bytes, and the least recently used documents are dropped to
+    stay under max_bytes.
+    """
+    def __init__(self, load, version, max_bytes=USER_CACHE_MAX_BYTES, size=estimate_size):
+        self.load = load
+        self.version = version
+        self.max_bytes = max_bytes
+        self.size = size
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # user_id -> (version, document, size)
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """The user's current document"""
+        version = self.version(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        # Read outside the lock; a write landing meanwhile bumps the version,
+        # so this entry is simply reloaded on the next read
+        document = self.load(user_id)
+        size = self.size(document)
+        with self._lock:
+            self._drop(user_id)
+            if size <= self.max_bytes:
+                self._entries[user_id] = (version, document, size)
+                self.bytes += size
+                while self.bytes > self.max_bytes:
+                    self._drop(next(iter(self._entries)))
+        return document
+
+    def invalidate(self, user_id=None):
+        """Forget one user's document, or everyone's"""
+        with self._lock:
+            for user in [user_id] if user_id is not None else list(self._entries):
+                self._drop(user)
+
+    def _drop(self, user_id):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def __len__(self):
+        return len(self._entries)
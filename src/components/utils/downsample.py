@@ -0,0 +1,44 @@
+import numpy as np
+
+# Points kept per plotted series; more than a chart can show at typical widths
+MAX_CHART_POINTS = 1000
+
+
+def lttb(x, y, threshold=MAX_CHART_POINTS):
+    """
+    Largest-Triangle-Three-Buckets downsampling of a series to threshold points.
+
+    The first and last points are always kept. The remaining points are split
+    into equal buckets and each bucket keeps the point forming the largest
+    triangle with the previously kept point and the next bucket's average, so
+    peaks and troughs survive. Returns (x, y) as numpy arrays.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+
+    # Work on numeric x so dates and integers are handled the same way
+    xs = x.astype("datetime64[D]").astype(np.float64) if x.dtype.kind == "M" else x.astype(np.float64)
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+
+    # Average point of every bucket, used as the third triangle vertex
+    counts = np.diff(edges)
+    sums_x = np.add.reduceat(xs[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    avg_x = np.append(sums_x / counts, xs[-1])
+    avg_y = np.append(sums_y / counts, y[-1])
+
+    previous = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = xs[previous], y[previous]
+        areas = np.abs((ax - avg_x[i + 1]) * (y[lo:hi] - ay) - (ax - xs[lo:hi]) * (avg_y[i + 1] - ay))
+        previous = lo + int(np.argmax(areas))
+        selected[i + 1] = previous
+
+    return x[selected], y[selected]
@@ -0,0 +1,121 @@
+import json
+import os
+import tempfile
+import time
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+LOCK_TIMEOUT_SECONDS = float(os.getenv("BUDGETBUDDY_LOCK_TIMEOUT", 10))
+
+
+class StorageError(Exception):
+    """Stored user data exists but can't be read"""
+
+
+class LockTimeout(TimeoutError):
+    """Raised when a file lock can't be acquired in time"""
+
+
+class FileLock:
+    """
+    Exclusive lock shared by every process and thread using the same path.
+
+    Uses flock on POSIX and msvcrt.locking on Windows, on a separate
+    <path>.lock file so the data file itself can be replaced while locked.
+
+        with FileLock("data/test_user.json"):
+            ...
+    """
+    def __init__(self, path, timeout=LOCK_TIMEOUT_SECONDS, poll_interval=0.01):
+        self.lock_path = path + ".lock"
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._file = None
+
+    def acquire(self):
+        os.makedirs(os.path.dirname(self.lock_path) or ".", exist_ok=True)
+        lock_file = open(self.lock_path, 'a+b')
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                self._try_lock(lock_file)
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    lock_file.close()
+                    raise LockTimeout(f"Timed out waiting for {self.lock_path}")
+                time.sleep(self.poll_interval)
+        self._file = lock_file
+
+    def release(self):
+        if self._file is None:
+            return
+        try:
+            if os.name == "nt":
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._file.close()
+            self._file = None
+
+    @staticmethod
+    def _try_lock(lock_file):
+        if os.name == "nt":
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def atomic_write_json(path, data, indent=None):
+    """
+    Write JSON to path so readers see either the old or the new file, never
+    a partial one: write a temp file in the same directory, fsync it, then
+    rename it over the target.
+    """
+    atomic_write_text(path, json.dumps(data, indent=indent))
+
+
+def atomic_write_text(path, text, mode=None):
+    """Replace path with text atomically, as atomic_write_json does; mode sets permissions"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        if mode is not None:
+            os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    _fsync_directory(directory)
+
+
+def _fsync_directory(directory):
+    """Persist a rename; directories can't be opened for fsync on Windows"""
+    if os.name == "nt":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
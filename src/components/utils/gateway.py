@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from .ratelimit import (
+    AdaptiveTokenBucket, call_with_retries, is_throttling_error, PRIORITY_INTERACTIVE
+)
+from .tracing import propagate
+
+# Process-wide limits for upstream model calls
+MODEL_RATE = float(os.getenv("BUDGETBUDDY_MODEL_RATE", 5))
+MODEL_MIN_RATE = float(os.getenv("BUDGETBUDDY_MODEL_MIN_RATE", 0.2))
+MODEL_BURST = float(os.getenv("BUDGETBUDDY_MODEL_BURST", 10))
+MODEL_MAX_RETRIES = int(os.getenv("BUDGETBUDDY_MODEL_MAX_RETRIES", 4))
+MODEL_RETRY_DELAY = float(os.getenv("BUDGETBUDDY_MODEL_RETRY_DELAY", 0.5))
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def request_key(kind, agent, prompt, *extra):
+    """
+    Identity of one model request. Requests only share an answer when
+    everything it depends on matches: model, system prompt, tools and the
+    user whose data they read, the conversation so far and the prompt.
+    """
+    tools = [getattr(tool, "tool_name", str(tool)) for tool in getattr(agent, "tools", ())]
+    payload = json.dumps([kind, agent.model_id, agent.system_prompt, getattr(agent, "user_id", None), tools,
+                          getattr(agent, "messages", []), prompt, *extra],
+                         ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Broadcast:
+    """Chunks of one upstream stream, replayed to every reader from the start"""
+    def __init__(self):
+        self.chunks = []
+        self.finished = False
+        self.error = None
+        self._changed = threading.Condition()
+
+    def put(self, chunk):
+        with self._changed:
+            self.chunks.append(chunk)
+            self._changed.notify_all()
+
+    def close(self, error=None):
+        with self._changed:
+            self.finished = True
+            self.error = error
+            self._changed.notify_all()
+
+    def __iter__(self):
+        seen = 0
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: len(self.chunks) > seen or self.finished)
+                chunks, finished, error = self.chunks[seen:], self.finished, self.error
+            seen += len(chunks)
+            yield from chunks
+            if finished:
+                if error is not None:
+                    raise error
+                return
+
+
+class ModelGateway:
+    """
+    Single entry point for upstream model calls in the process.
+
+    Identical requests in flight at the same time share one upstream call
+    (single flight): later callers wait for the first one's result, or
+    replay its stream. Every upstream call first takes a token from an
+    AdaptiveTokenBucket, which slows down when the endpoint throttles and
+    lets interactive requests ahead of batch ones; throttled calls are
+    retried with jittered backoff.
+    """
+    def __init__(self, rate=MODEL_RATE, min_rate=MODEL_MIN_RATE, burst=MODEL_BURST,
+                 max_retries=MODEL_MAX_RETRIES, base_delay=MODEL_RETRY_DELAY):
+        self.limiter = AdaptiveTokenBucket(rate, burst, min_rate=min_rate)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.upstream_calls = 0
+        self.coalesced = 0
+        self._flights = {}
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def _upstream(self, fn, priority, is_retryable=is_throttling_error):
+        def attempt():
+            self.limiter.acquire(priority=priority)
+            with self._lock:
+                self.upstream_calls += 1
+            try:
+                result = fn()
+            except Exception as e:
+                if is_throttling_error(e):
+                    self.limiter.on_throttle()
+                raise
+            self.limiter.on_success()
+            return result
+        result, _ = call_with_retries(attempt, max_retries=self.max_retries,
+                                      base_delay=self.base_delay, is_retryable=is_retryable)
+        return result
+
+    def call(self, key, fn, priority=PRIORITY_INTERACTIVE, on_shared=None):
+        """
+        fn()'s result, sharing one upstream call with identical requests in
+        flight. Callers handed another caller's result get on_shared(result)
+        first, e.g. to record the exchange in their own history.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.done.wait()
+        else:
+            try:
+                flight.result = self._upstream(fn, priority)
+            except Exception as e:
+                flight.error = e
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+        if flight.error is not None:
+            raise flight.error
+        if not leader and on_shared is not None:
+            on_shared(flight.result)
+        return flight.result
+
+    def stream(self, key, make_chunks, priority=PRIORITY_INTERACTIVE, on_shared=None):
+        """
+        Iterator over the chunks of make_chunks(), sharing one upstream stream
+        with identical requests in flight. The upstream stream is read on its
+        own thread, so it finishes for the others if one reader stops early.
+        Readers of another caller's stream get on_shared(chunks) once they
+        have read all of it.
+        """
+        with self._lock:
+            broadcast = self._streams.get(key)
+            leader = broadcast is None
+            if leader:
+                broadcast = self._streams[key] = _Broadcast()
+                threading.Thread(target=propagate(self._pump), args=(key, broadcast, make_chunks, priority),
+                                 name="model-stream", daemon=True).start()
+            else:
+                self.coalesced += 1
+        if leader or on_shared is None:
+            return iter(broadcast)
+        return self._replay(broadcast, on_shared)
+
+    @staticmethod
+    def _replay(broadcast, on_shared):
+        chunks = []
+        for chunk in broadcast:
+            chunks.append(chunk)
+            yield chunk
+        on_shared(chunks)
+
+    def _pump(self, key, broadcast, make_chunks, priority):
+        def produce():
+            for chunk in make_chunks():
+                broadcast.put(chunk)
+
+        error = None
+        try:
+            # A throttled stream can only be retried before any chunk went out
+            self._upstream(produce, priority,
+                           is_retryable=lambda e: is_throttling_error(e) and not broadcast.chunks)
+        except Exception as e:
+            error = e
+        finally:
+            with self._lock:
+                del self._streams[key]
+            broadcast.close(error)
+
+    def stats(self):
+        return {
+            "rate": round(self.limiter.rate, 3),
+            "max_rate": self.limiter.max_rate,
+            "waiting": self.limiter.waiting,
+            "in_flight": len(self._flights) + len(self._streams),
+            "upstream_calls": self.upstream_calls,
+            "coalesced": self.coalesced,
+            "throttled": self.limiter.throttled,
+        }
+
+
+def get_model_gateway():
+    """The process-wide ModelGateway, created on first use"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = ModelGateway()
+    return _gateway
+
+
+def peek_model_gateway():
+    """The process-wide ModelGateway if anything has used it yet, else None"""
+    return _gateway
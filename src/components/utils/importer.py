@@ -0,0 +1,410 @@
+import io
+import os
+import re
+import numpy as np
+import pandas as pd
+from .files import FileLock
+from .ledger import CATEGORIES, CATEGORY_CODES
+from .schema import INCOME_FIELDS, EXPENSE_FIELDS, build_month_record, month_key
+
+# Rows parsed per chunk; memory use is bounded by this, not by file size
+CHUNK_ROWS = 100_000
+
+SUPPORTED_FORMATS = ("csv", "ofx", "qif")
+
+# Header names recognised in CSV exports, compared lowercased
+CSV_COLUMNS = {
+    "date": ("date", "transaction date", "posted date", "posting date", "booking date"),
+    "amount": ("amount", "transaction amount", "value"),
+    "debit": ("debit", "withdrawal", "withdrawals", "money out"),
+    "credit": ("credit", "deposit", "deposits", "money in"),
+    "description": ("description", "payee", "name", "merchant", "details", "memo"),
+    "category": ("category",),
+}
+
+_EXPENSE_CODES = np.array([CATEGORY_CODES[name] for name in EXPENSE_FIELDS], dtype=np.int16)
+_OFX_TRANSACTION = re.compile(r"<STMTTRN>(.*?)</STMTTRN>", re.S | re.I)
+_OFX_FIELD = re.compile(r"<(DTPOSTED|TRNAMT|NAME|MEMO|FITID)>([^<\r\n]*)", re.I)
+
+
+def detect_format(filename):
+    """Statement format from a file name"""
+    extension = os.path.splitext(filename)[1].lower().lstrip(".")
+    fmt = "ofx" if extension == "qfx" else extension
+    if fmt not in SUPPORTED_FORMATS:
+        raise ValueError(f"Unsupported statement format '{extension}', expected CSV, OFX/QFX or QIF")
+    return fmt
+
+
+def _text_stream(source):
+    """Text file object for a path or a binary/text file object"""
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, 'r', encoding="utf-8", errors="replace")
+    if isinstance(source, io.TextIOBase):
+        return source
+    return io.TextIOWrapper(source, encoding="utf-8", errors="replace")
+
+
+def parse_amounts(values):
+    """Vectorized amount parsing: '$1,234.50', '(12.00)' and '-12' all work"""
+    if values.dtype.kind in "if":
+        return values.astype(np.float64)
+    text = values.astype(str).str.strip()
+    negative = text.str.startswith("(") & text.str.endswith(")")
+    cleaned = text.str.replace(r"[^\d.\-]", "", regex=True)
+    amounts = pd.to_numeric(cleaned, errors="coerce")
+    return amounts.where(~negative, -amounts.abs())
+
+
+def _on_unique(values, transform):
+    """
+    Apply a vectorized transform to the distinct values only.
+
+    Statements repeat the same dates and merchants over and over, so this
+    turns per-row string work into per-distinct-value work.
+    """
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    return np.asarray(transform(pd.Series(uniques)))[codes]
+
+
+def _parse_dates(values, dayfirst=False):
+    # Only distinct dates get here, so per-value format detection is cheap
+    text = values.astype(str).str.strip().str.replace("'", "/", regex=False)
+    return pd.to_datetime(text, errors="coerce", dayfirst=dayfirst, format="mixed").to_numpy(dtype="datetime64[D]")
+
+
+def _normalize(frame, dayfirst=False):
+    """Common chunk shape: date (datetime64[D]), amount (signed), description, category, fitid"""
+    dates = _on_unique(frame["date"], lambda values: _parse_dates(values, dayfirst))
+    description = frame["description"].fillna("").astype(str) if "description" in frame else ""
+    return pd.DataFrame({
+        "date": dates,
+        "amount": parse_amounts(frame["amount"]).to_numpy(),
+        "description": description,
+        "category": frame["category"] if "category" in frame else None,
+        "fitid": frame["fitid"] if "fitid" in frame else None,
+    })
+
+
+def read_csv_chunks(source, chunk_rows=CHUNK_ROWS, dayfirst=False):
+    """Normalized chunks of a CSV statement"""
+    reader = pd.read_csv(source, chunksize=chunk_rows, dtype=str, skipinitialspace=True)
+    columns = None
+    for chunk in reader:
+        if columns is None:
+            headers = {name.strip().lower(): name for name in chunk.columns}
+            columns = {}
+            for field, names in CSV_COLUMNS.items():
+                match = next((headers[name] for name in names if name in headers), None)
+                if match is not None:
+                    columns[field] = match
+            if "date" not in columns or not ({"amount"} <= columns.keys() or
+                                             {"debit", "credit"} & columns.keys()):
+                raise ValueError("CSV needs a date column and an amount or debit/credit columns")
+
+        frame = pd.DataFrame({field: chunk[name] for field, name in columns.items()})
+        if "amount" not in frame:
+            credit = parse_amounts(frame["credit"]).fillna(0) if "credit" in frame else 0
+            debit = parse_amounts(frame["debit"]).fillna(0).abs() if "debit" in frame else 0
+            frame["amount"] = credit - debit
+        yield _normalize(frame, dayfirst)
+
+
+def read_ofx_chunks(source, chunk_rows=CHUNK_ROWS, block_size=1 << 20):
+    """Normalized chunks of an OFX/QFX statement, read in fixed-size blocks"""
+    stream = _text_stream(source)
+    buffer = ""
+    rows = []
+    while True:
+        block = stream.read(block_size)
+        buffer += block
+        last_end = 0
+        for match in _OFX_TRANSACTION.finditer(buffer):
+            fields = {name.upper(): value.strip() for name, value in _OFX_FIELD.findall(match.group(1))}
+            rows.append((
+                fields.get("DTPOSTED", "")[:8],
+                fields.get("TRNAMT", ""),
+                fields.get("NAME") or fields.get("MEMO", ""),
+                fields.get("FITID", ""),
+            ))
+            last_end = match.end()
+        buffer = buffer[last_end:]
+        if len(rows) >= chunk_rows or (not block and rows):
+            frame = pd.DataFrame(rows, columns=["date", "amount", "description", "fitid"])
+            rows = []
+            yield _normalize(frame)
+        if not block:
+            break
+
+
+def read_qif_chunks(source, chunk_rows=CHUNK_ROWS, dayfirst=False):
+    """Normalized chunks of a QIF statement"""
+    rows = []
+    record = {}
+    for line in _text_stream(source):
+        code, value = line[:1], line[1:].strip()
+        if code == "^":
+            if record:
+                rows.append((record.get("D", ""), record.get("T", ""),
+                             record.get("P") or record.get("M", ""), record.get("L")))
+                record = {}
+            if len(rows) >= chunk_rows:
+                yield _normalize(pd.DataFrame(rows, columns=["date", "amount", "description", "category"]),
+                                 dayfirst)
+                rows = []
+        elif code in "DTUPML" and code:
+            # U is the full-precision amount some exporters add next to T
+            record.setdefault("T" if code == "U" else code, value)
+    if rows:
+        yield _normalize(pd.DataFrame(rows, columns=["date", "amount", "description", "category"]), dayfirst)
+
+
+READERS = {
+    "csv": read_csv_chunks,
+    "ofx": read_ofx_chunks,
+    "qif": read_qif_chunks,
+}
+
+
+def default_categories(chunk):
+    """
+    Category codes for a chunk: a recognised category column wins, otherwise
+    money in is other_income and money out is other_expenses.
+    """
+    codes = np.where(chunk["amount"].to_numpy() > 0,
+                     CATEGORY_CODES["other_income"], CATEGORY_CODES["other_expenses"]).astype(np.int16)
+    if chunk["category"].notna().any():
+        names = chunk["category"].fillna("").astype(str).str.strip().str.lower().str.replace(" ", "_")
+        named = names.map(CATEGORY_CODES)
+        codes = np.where(named.notna(), named.fillna(0).astype(np.int16), codes)
+    return codes
+
+
+def _account_hash(account):
+    return pd.util.hash_pandas_object(pd.Series([str(account).strip().upper()]), index=False).iloc[0]
+
+
+class OccurrenceCounter:
+    """Running count of how often each key has been seen, kept as sorted arrays"""
+    def __init__(self):
+        self.keys = np.empty(0, dtype=np.uint64)
+        self.counts = np.empty(0, dtype=np.int64)
+
+    def ordinals(self, keys):
+        """0 for the first occurrence of a key, 1 for the second, and so on"""
+        series = pd.Series(keys)
+        within = series.groupby(series, sort=False).cumcount().to_numpy()
+        position = np.searchsorted(self.keys, keys)
+        position = np.minimum(position, max(len(self.keys) - 1, 0))
+        prior = np.zeros(len(keys), dtype=np.int64)
+        if len(self.keys):
+            found = self.keys[position] == keys
+            prior[found] = self.counts[position[found]]
+
+        unique, counts = np.unique(keys, return_counts=True)
+        merged, inverse = np.unique(np.concatenate([self.keys, unique]), return_inverse=True)
+        self.counts = np.bincount(inverse, weights=np.concatenate([self.counts, counts]),
+                                  minlength=len(merged)).astype(np.int64)
+        self.keys = merged
+        return within + prior
+
+
+def fingerprint(chunk, counter, account=None):
+    """
+    64-bit fingerprint per transaction.
+
+    Bank transaction ids (OFX FITID) are used when present. Otherwise the
+    fingerprint covers date, amount in cents and the normalized description,
+    plus the occurrence number, so two identical coffees on the same day stay
+    two transactions and re-importing the same file maps onto the same set.
+
+    The counter is per statement file, so a later statement from the same
+    account that overlaps an earlier one skips the overlap: the same day's
+    coffees are numbered 0, 1, ... in both. Statements from different
+    accounts need their own account name, otherwise the same purchase on two
+    cards would be taken for a duplicate.
+    """
+    description = _on_unique(chunk["description"], lambda values: pd.util.hash_pandas_object(
+        values.astype(str).str.upper().str.replace(r"\s+", " ", regex=True).str.strip(), index=False
+    ))
+    columns = {
+        "date": chunk["date"].to_numpy().astype(np.int64),
+        "cents": np.round(chunk["amount"].to_numpy() * 100).astype(np.int64),
+        "description": description,
+    }
+    if account:
+        # Left out for the unnamed account so earlier imports keep their fingerprints
+        columns["account"] = np.full(len(chunk), _account_hash(account), dtype=np.uint64)
+    base = pd.util.hash_pandas_object(pd.DataFrame(columns), index=False).to_numpy()
+    keyed = pd.util.hash_pandas_object(pd.DataFrame({
+        "base": base, "occurrence": counter.ordinals(base)
+    }), index=False).to_numpy()
+
+    if chunk["fitid"].notna().any():
+        fitid = chunk["fitid"].fillna("").astype(str)
+        prefix = f"FITID:{account}:" if account else "FITID:"
+        by_id = pd.util.hash_pandas_object(prefix + fitid, index=False).to_numpy()
+        keyed = np.where(fitid.str.len().to_numpy() > 0, by_id, keyed)
+    return keyed
+
+
+class FingerprintIndex:
+    """Sorted set of imported transaction fingerprints, persisted as one .npy file"""
+    def __init__(self, path):
+        self.path = path
+        try:
+            self.fingerprints = np.load(path)
+        except FileNotFoundError:
+            self.fingerprints = np.empty(0, dtype=np.uint64)
+        self._pending = []
+        self._saved = self.fingerprints
+
+    def __len__(self):
+        return len(self.fingerprints) + sum(len(chunk) for chunk in self._pending)
+
+    def contains(self, fingerprints):
+        """Boolean mask of fingerprints already in the index"""
+        if not len(self.fingerprints):
+            return np.zeros(len(fingerprints), dtype=bool)
+        position = np.minimum(np.searchsorted(self.fingerprints, fingerprints), len(self.fingerprints) - 1)
+        return self.fingerprints[position] == fingerprints
+
+    def add(self, fingerprints):
+        self._pending.append(np.asarray(fingerprints, dtype=np.uint64))
+
+    def save(self):
+        self._saved = self.fingerprints
+        if self._pending:
+            self.fingerprints = np.unique(np.concatenate([self.fingerprints, *self._pending]))
+            self._pending = []
+        self._write()
+
+    def rollback(self):
+        """Put back the fingerprints the last save() replaced"""
+        self.fingerprints = self._saved
+        self._pending = []
+        self._write()
+
+    def _write(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp.npy"
+        np.save(tmp_path, self.fingerprints)
+        os.replace(tmp_path, self.path)
+
+
+class StatementImporter:
+    """
+    Streams bank statements into a user's monthly income/expense buckets.
+
+    Files are parsed chunk by chunk, so memory stays flat whatever the file
+    size. Transactions already imported are skipped using the fingerprint
+    index, new ones are summed per month and category, and each touched month
+    is written back in one save_months call. New rows also go to the
+    transaction ledger, when one is given, chunk by chunk.
+
+    Imports for a user hold a lock on the index file, so two imports can't
+    both take the same rows as new or interleave their month writes. The
+    index is saved before the months and put back if the month write fails,
+    so a failed import can simply be run again.
+    """
+    def __init__(self, backend, user_id, ledger=None, categorize=default_categories,
+                 index_path=None, chunk_rows=CHUNK_ROWS):
+        self.backend = backend
+        self.user_id = user_id
+        self.ledger = ledger
+        self.categorize = categorize
+        self.chunk_rows = chunk_rows
+        self.index_path = index_path or os.path.join(
+            backend.data_dir, "ledger", user_id, "fingerprints.npy"
+        )
+
+    def import_file(self, source, fmt=None, dayfirst=False, account=None):
+        """
+        Import one statement; returns counts and the month keys written.
+
+        Name the account when statements come from more than one, so a
+        purchase that shows up on two of them isn't skipped (see fingerprint).
+        """
+        if fmt is None:
+            fmt = detect_format(getattr(source, "name", str(source)))
+        reader = READERS[fmt]
+        kwargs = {"chunk_rows": self.chunk_rows}
+        if fmt != "ofx":
+            kwargs["dayfirst"] = dayfirst
+
+        totals = {}  # month number since 1970 -> per-category signed totals
+        result = {"rows": 0, "imported": 0, "duplicates": 0, "invalid": 0, "months": []}
+        with FileLock(self.index_path):
+            index = FingerprintIndex(self.index_path)
+            try:
+                self._read_new(reader(source, **kwargs), index, account, totals, result)
+            finally:
+                # Rows read before a failure are already in the ledger; record them in
+                # the index and months too, so a rerun picks up from where this stopped
+                self._commit(index, totals, result)
+        return result
+
+    def _read_new(self, chunks, index, account, totals, result):
+        """Skip rows already in the index and sum the rest into totals, writing each chunk to the ledger"""
+        counter = OccurrenceCounter()
+        for chunk in chunks:
+            result["rows"] += len(chunk)
+            valid = chunk["date"].notna().to_numpy() & chunk["amount"].notna().to_numpy()
+            result["invalid"] += int((~valid).sum())
+            chunk = chunk[valid].reset_index(drop=True)
+            if chunk.empty:
+                continue
+
+            fingerprints = fingerprint(chunk, counter, account)
+            fresh = ~index.contains(fingerprints)
+            result["duplicates"] += int((~fresh).sum())
+            chunk = chunk[fresh].reset_index(drop=True)
+            if chunk.empty:
+                continue
+
+            codes = np.asarray(self.categorize(chunk), dtype=np.int16)
+            amounts = chunk["amount"].to_numpy()
+            # Money out adds to expense buckets; refunds in an expense category reduce them
+            signed = np.where(np.isin(codes, _EXPENSE_CODES), -amounts, amounts)
+            if self.ledger is not None:
+                self.ledger.append(chunk["date"].to_numpy(), signed, codes)
+
+            months = chunk["date"].to_numpy().astype("datetime64[M]").astype(np.int64)
+            first = months.min()
+            span = int(months.max() - first) + 1
+            sums = np.bincount((months - first) * len(CATEGORIES) + codes, weights=signed,
+                               minlength=span * len(CATEGORIES)).reshape(span, len(CATEGORIES))
+            for offset in np.flatnonzero(sums.any(axis=1)):
+                month = int(first + offset)
+                totals[month] = totals.get(month, 0) + sums[offset]
+            index.add(fingerprints[fresh])
+            result["imported"] += len(chunk)
+
+    def _commit(self, index, totals, result):
+        """Save the index, then the months; the index is put back if the months can't be written"""
+        index.save()
+        try:
+            result["months"] = self._write_months(totals)
+            self.backend.flush(self.user_id)
+        except Exception:
+            index.rollback()
+            raise
+
+    def _write_months(self, totals):
+        """Add imported totals to the stored months in one batched write"""
+        if not totals:
+            return []
+        monthly_target = self.backend.load_profile(self.user_id).get("monthly_savings_target", 0)
+        updates = {}
+        for month_number, row in sorted(totals.items()):
+            key = month_key(1970 + month_number // 12, month_number % 12 + 1)
+            existing = self.backend.load_month(self.user_id, key) or {}
+            amounts = dict(zip(CATEGORIES, row.tolist()))
+            income = {field: existing.get("income", {}).get(field, 0.0) + amounts[field]
+                      for field in INCOME_FIELDS}
+            expenses = {field: existing.get("expenses", {}).get(field, 0.0) + amounts[field]
+                        for field in EXPENSE_FIELDS}
+            target = existing.get("savings", {}).get("target", monthly_target)
+            updates[key] = build_month_record(income, expenses, target, completed=True)
+        self.backend.save_months(self.user_id, updates)
+        return list(updates)
@@ -0,0 +1,160 @@
+import json
+import os
+import threading
+from .files import FileLock, StorageError, atomic_write_json
+
+# Compact once the journal passes either threshold
+JOURNAL_MAX_RECORDS = 200
+JOURNAL_MAX_BYTES = 256 * 1024
+
+
+class UserJournal:
+    """
+    Append-only journal of month/profile updates layered on a JSON snapshot.
+
+    Every update is written as one small JSON line, so a save costs the same
+    no matter how much history the user has. Loading replays the snapshot plus
+    the journal tail, and once the journal grows past a threshold it is folded
+    into a fresh snapshot on a background thread.
+    """
+    def __init__(self, user_id, data_dir="data", default_factory=None,
+                 max_records=JOURNAL_MAX_RECORDS, max_bytes=JOURNAL_MAX_BYTES):
+        self.user_id = user_id
+        # Builds the starting document when no snapshot exists yet
+        self.default_factory = default_factory or _empty_document
+        self.snapshot_path = os.path.join(data_dir, f"{user_id}.json")
+        self.journal_path = os.path.join(data_dir, f"{user_id}.journal")
+        # Journal segment being folded into the snapshot by the compactor
+        self.compacting_path = self.journal_path + ".compacting"
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._compactor = None
+        self._records, self._bytes, self._torn = self._measure(self.journal_path)
+
+    @staticmethod
+    def _measure(path):
+        """Count records and bytes in an existing journal file"""
+        if not os.path.exists(path):
+            return 0, 0, False
+        with open(path, 'rb') as f:
+            data = f.read()
+        # A missing trailing newline means the last write was cut short
+        return data.count(b"\n"), len(data), bool(data) and not data.endswith(b"\n")
+
+    def append(self, op, data, key=None):
+        """Append one update record and schedule compaction if needed"""
+        record = json.dumps({"op": op, "key": key, "data": data}, separators=(",", ":")) + "\n"
+        encoded = record.encode("utf-8")
+
+        with self._lock:
+            if self._torn:
+                # Terminate the torn record so it can't swallow this one
+                encoded = b"\n" + encoded
+                self._torn = False
+            os.makedirs(os.path.dirname(self.journal_path) or ".", exist_ok=True)
+            # Other processes may be rotating the journal for compaction
+            with FileLock(self.journal_path), open(self.journal_path, 'ab') as f:
+                f.write(encoded)
+                f.flush()
+                os.fsync(f.fileno())
+            self._records += 1
+            self._bytes += len(encoded)
+            needs_compaction = self._records >= self.max_records or self._bytes >= self.max_bytes
+
+        if needs_compaction:
+            self.compact_async()
+
+    def load(self):
+        """Replay snapshot + journal tail into a full user document"""
+        # The file lock keeps another process from rotating the journal mid-replay
+        with self._lock, FileLock(self.journal_path):
+            document = self._read_snapshot()
+            # Older segment first so newer records win
+            for path in (self.compacting_path, self.journal_path):
+                self._replay(path, document)
+            return document
+
+    def _read_snapshot(self):
+        if not os.path.exists(self.snapshot_path):
+            return self.default_factory()
+        try:
+            with open(self.snapshot_path, 'r', encoding="utf-8") as f:
+                return json.load(f)
+        except ValueError as e:
+            raise StorageError(f"{self.snapshot_path} is not valid JSON ({e}); fix or restore it before continuing")
+
+    @staticmethod
+    def _replay(path, document):
+        """Apply journal records from path onto document in place"""
+        if not os.path.exists(path):
+            return
+        with open(path, 'r', encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn write from a crash; the records around it are intact
+                    continue
+                apply_record(document, record)
+
+    def compact_async(self):
+        """Fold the journal into a new snapshot on a background thread"""
+        with self._lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                return
+            self._compactor = threading.Thread(
+                target=self.compact, name=f"journal-compactor-{self.user_id}", daemon=True
+            )
+            self._compactor.start()
+
+    def compact(self):
+        """Fold the journal into a fresh snapshot"""
+        # Only one thread, and one process, compacts a user at a time
+        with self._compact_lock, FileLock(self.compacting_path):
+            self._compact()
+
+    def _compact(self):
+        with self._lock, FileLock(self.journal_path):
+            # Rotate the live journal so appends can continue while we fold.
+            # A leftover segment from an interrupted compaction is folded first.
+            if not os.path.exists(self.compacting_path):
+                if not os.path.exists(self.journal_path):
+                    return
+                os.replace(self.journal_path, self.compacting_path)
+                self._records, self._bytes, self._torn = 0, 0, False
+
+        document = self._read_snapshot()
+        self._replay(self.compacting_path, document)
+
+        # Records are full-value writes, so replaying the segment again after
+        # a crash between these two steps (or in a load racing them) is harmless
+        atomic_write_json(self.snapshot_path, document, indent=2)
+        with self._lock:
+            os.remove(self.compacting_path)
+
+    def wait(self):
+        """Block until a running background compaction finishes"""
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+
+
+def apply_record(document, record):
+    """Apply a single journal record to a user document"""
+    op = record.get("op")
+    if op == "month":
+        document.setdefault("months", {})[record["key"]] = record["data"]
+    elif op == "months":
+        document.setdefault("months", {}).update(record["data"])
+    elif op == "profile":
+        document["profile"] = record["data"]
+    elif op == "document":
+        document.clear()
+        document.update(record["data"])
+
+
+def _empty_document():
+    return {"profile": {}, "months": {}}
@@ -0,0 +1,267 @@
+import datetime
+import glob
+import os
+import shutil
+import tempfile
+import numpy as np
+from .files import FileLock
+from .schema import INCOME_FIELDS, EXPENSE_FIELDS, build_month_record, month_key
+
+# Category codes stored in the "category" column
+CATEGORIES = INCOME_FIELDS + EXPENSE_FIELDS
+CATEGORY_CODES = {name: code for code, name in enumerate(CATEGORIES)}
+
+# Column name -> on-disk dtype. Dates are days since 1970-01-01. The category
+# decides whether a row is income or expense and amounts are signed in its
+# direction: positive adds to the category's total, negative (a refund, a
+# reversed payment) takes away from it, the same as the stored months.
+COLUMNS = {
+    "date": np.int32,
+    "amount": np.float64,
+    "category": np.int16,
+}
+
+_EPOCH = datetime.date(1970, 1, 1)
+
+
+def to_day(value):
+    """Convert a date, datetime, ISO string or day number to days since the epoch"""
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.date.fromisoformat(value[:10])
+    if isinstance(value, datetime.datetime):
+        value = value.date()
+    return (value - _EPOCH).days
+
+
+def to_days(values):
+    """Vectorized to_day for arrays of dates or ISO strings"""
+    array = np.asarray(values)
+    if array.dtype.kind in "iu":
+        return array.astype(np.int32)
+    return array.astype("datetime64[D]").astype(np.int64).astype(np.int32)
+
+
+class TransactionLedger:
+    """
+    Transaction-level ledger stored column-wise, partitioned by user and year.
+
+    Each partition is a directory of memory-mapped .npy files, one per
+    column, sorted by date:
+
+        data/ledger/<user_id>/<year>/{date,amount,category}.npy
+
+    Queries open only the partitions that overlap the requested date range
+    and only the columns they ask for, so "last 36 months of groceries" reads
+    three or four small files regardless of total history.
+
+    Writers hold a FileLock per user and year, so any number of instances,
+    threads and processes can append to the same ledger.
+    """
+    def __init__(self, user_id, data_dir="data/ledger"):
+        self.user_id = user_id
+        self.root = os.path.join(data_dir, user_id)
+
+    def years(self):
+        """Years that have a partition on disk"""
+        if not os.path.isdir(self.root):
+            return []
+        names = set(os.listdir(self.root))
+        for name in names:
+            year, _, suffix = name.partition(".")
+            if suffix == "old" and year.isdigit() and year not in names:
+                self._recover(int(year))
+        return sorted(int(name) for name in os.listdir(self.root) if name.isdigit())
+
+    def _partition(self, year):
+        return os.path.join(self.root, str(year))
+
+    def _recover(self, year):
+        """Put back a partition a writer moved aside and didn't replace before it stopped"""
+        path = self._partition(year)
+        with FileLock(path):
+            _restore_old(path)
+
+    def _read_partition(self, year, columns, mmap_mode="r"):
+        path = self._partition(year)
+        if not os.path.isdir(path) and os.path.isdir(path + ".old"):
+            self._recover(year)
+        if not os.path.isdir(path):
+            return {name: np.empty(0, dtype=COLUMNS[name]) for name in columns}
+        return {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in columns
+        }
+
+    def append(self, dates, amounts, categories):
+        """
+        Add transactions. Categories are names from CATEGORIES or their codes;
+        amounts are signed in the category's direction (see COLUMNS).
+        """
+        days = to_days(dates)
+        amounts = np.asarray(amounts, dtype=np.float64)
+        categories = np.asarray(categories)
+        if categories.dtype.kind in "US" or categories.dtype == object:
+            categories = np.array([CATEGORY_CODES[name] for name in categories], dtype=np.int16)
+        else:
+            categories = categories.astype(np.int16)
+        if not (len(days) == len(amounts) == len(categories)):
+            raise ValueError("dates, amounts and categories must have the same length")
+
+        years = days.astype("datetime64[D]").astype("datetime64[Y]").astype(int) + 1970
+        touched = []
+        for year in np.unique(years):
+            mask = years == year
+            self._merge_partition(int(year), {
+                "date": days[mask], "amount": amounts[mask], "category": categories[mask]
+            })
+            touched.append(int(year))
+        return touched
+
+    def _merge_partition(self, year, new_columns):
+        """Rewrite one year partition with new rows merged in date order"""
+        path = self._partition(year)
+        with FileLock(path):
+            _restore_old(path)
+            # Staging directories left by writers that stopped; none can be live under the lock
+            for stale in glob.glob(path + ".*.tmp"):
+                shutil.rmtree(stale, ignore_errors=True)
+
+            existing = self._read_partition(year, COLUMNS, mmap_mode=None)
+            merged = {
+                name: np.concatenate([existing[name], new_columns[name].astype(dtype)])
+                for name, dtype in COLUMNS.items()
+            }
+            order = np.argsort(merged["date"], kind="stable")
+
+            tmp_path = tempfile.mkdtemp(prefix=f"{year}.", suffix=".tmp", dir=self.root)
+            try:
+                for name in COLUMNS:
+                    np.save(os.path.join(tmp_path, f"{name}.npy"), merged[name][order])
+                # Swap the whole partition so readers never see a mix of old and new columns
+                old_path = path + ".old"
+                shutil.rmtree(old_path, ignore_errors=True)
+                if os.path.isdir(path):
+                    os.replace(path, old_path)
+                os.replace(tmp_path, path)
+            except BaseException:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                raise
+            shutil.rmtree(old_path, ignore_errors=True)
+
+    def query(self, start, end, columns=("date", "amount", "category"), categories=None):
+        """
+        Return the requested columns for transactions with start <= date < end.
+
+        Only partitions for the years in range are opened, and the date range
+        inside each sorted partition is found by binary search.
+        """
+        start_day, end_day = to_day(start), to_day(end)
+        codes = None
+        if categories is not None:
+            codes = np.array([CATEGORY_CODES[name] for name in categories], dtype=np.int16)
+
+        needed = set(columns) | {"date"} | ({"category"} if codes is not None else set())
+        start_year = (_EPOCH + datetime.timedelta(days=start_day)).year
+        end_year = (_EPOCH + datetime.timedelta(days=end_day - 1)).year
+
+        parts = {name: [] for name in columns}
+        for year in self.years():
+            if year < start_year or year > end_year:
+                continue
+            partition = self._read_partition(year, needed)
+            date = partition["date"]
+            lo, hi = np.searchsorted(date, [start_day, end_day])
+            mask = None
+            if codes is not None:
+                mask = np.isin(partition["category"][lo:hi], codes)
+            for name in columns:
+                values = partition[name][lo:hi]
+                parts[name].append(np.asarray(values if mask is None else values[mask]))
+
+        return {
+            name: np.concatenate(chunks) if chunks else np.empty(0, dtype=COLUMNS[name])
+            for name, chunks in parts.items()
+        }
+
+    def monthly_totals(self, start, end, categories=None):
+        """
+        Sum amounts per (month, category) for start <= date < end.
+
+        Returns (month_starts, totals) where totals has one row per month in
+        range and one column per entry of CATEGORIES.
+        """
+        rows = self.query(start, end, columns=("date", "category", "amount"), categories=categories)
+        first = np.datetime64(datetime.date.fromordinal(_EPOCH.toordinal() + to_day(start)), "M")
+        last = np.datetime64(datetime.date.fromordinal(_EPOCH.toordinal() + to_day(end) - 1), "M")
+        month_starts = np.arange(first, last + 1, dtype="datetime64[M]")
+
+        month_index = (rows["date"].astype("datetime64[D]").astype("datetime64[M]") - first).astype(np.int64)
+        flat = month_index * len(CATEGORIES) + rows["category"]
+        totals = np.bincount(flat, weights=rows["amount"],
+                             minlength=len(month_starts) * len(CATEGORIES))
+        return month_starts, totals.reshape(len(month_starts), len(CATEGORIES))
+
+    def category_series(self, category, start, end):
+        """Monthly totals for one category, e.g. the last 36 months of groceries"""
+        month_starts, totals = self.monthly_totals(start, end, categories=[category])
+        return month_starts, totals[:, CATEGORY_CODES[category]]
+
+    def daily_net(self, start=None, end=None):
+        """
+        Net cash flow (income minus expenses) per day for start <= date < end.
+
+        Defaults to the full history. Returns (days, net) with one entry per
+        calendar day in range, zero on days without transactions.
+        """
+        years = self.years()
+        if not years:
+            return np.empty(0, dtype="datetime64[D]"), np.empty(0)
+        start_day = to_day(start if start is not None else f"{years[0]}-01-01")
+        end_day = to_day(end if end is not None else f"{years[-1] + 1}-01-01")
+        rows = self.query(start_day, end_day)
+        signs = np.where(rows["category"] < len(INCOME_FIELDS), 1.0, -1.0)
+        net = np.bincount(rows["date"] - start_day, weights=rows["amount"] * signs,
+                          minlength=end_day - start_day)
+        return np.arange(start_day, end_day).astype("datetime64[D]"), net
+
+    def rollup(self, year, monthly_target=0.0):
+        """Derive monthly income/expenses/savings documents for one year"""
+        month_starts, totals = self.monthly_totals(f"{year}-01-01", f"{year + 1}-01-01")
+        counts = self.monthly_counts(year)
+        months = {}
+        for i, month_start in enumerate(month_starts):
+            if counts[i] == 0:
+                continue
+            month = int(str(month_start)[5:7])
+            amounts = dict(zip(CATEGORIES, totals[i].tolist()))
+            months[month_key(year, month)] = build_month_record(
+                amounts, amounts, monthly_target, completed=True
+            )
+        return months
+
+    def monthly_counts(self, year):
+        """Number of transactions in each month of a year"""
+        date = self._read_partition(year, ["date"])["date"]
+        month_index = (np.asarray(date).astype("datetime64[D]").astype("datetime64[M]")
+                       - np.datetime64(f"{year}-01", "M")).astype(np.int64)
+        return np.bincount(month_index, minlength=12)
+
+
+def _restore_old(path):
+    """Move <path>.old back to path if the swap in _merge_partition stopped between its two renames"""
+    if not os.path.isdir(path) and os.path.isdir(path + ".old"):
+        os.replace(path + ".old", path)
+
+
+def materialize_rollups(ledger, backend, years=None):
+    """Write ledger-derived month documents through a storage backend"""
+    profile = backend.load_profile(ledger.user_id)
+    monthly_target = profile.get("monthly_savings_target", 0)
+    written = []
+    for year in years if years is not None else ledger.years():
+        for key, record in ledger.rollup(year, monthly_target).items():
+            backend.save_month(ledger.user_id, key, record)
+            written.append(key)
+    return written
@@ -0,0 +1,342 @@
+import copy
+import sys
+import numpy as np
+import pandas as pd
+from .document_cache import estimate_size
+from .schema import INCOME_FIELDS, EXPENSE_FIELDS, MONTH_NAMES, month_key
+
+# Column layout of a YearLedger: field name -> path inside a month document
+FIELD_PATHS = {
+    **{field: ("income", field) for field in INCOME_FIELDS},
+    "income_total": ("income", "total"),
+    **{field: ("expenses", field) for field in EXPENSE_FIELDS},
+    "expenses_total": ("expenses", "total"),
+    "savings_target": ("savings", "target"),
+    "savings_actual": ("savings", "actual"),
+    "savings_difference": ("savings", "difference"),
+    "cash_flow": ("cash_flow",),
+}
+FIELDS = tuple(FIELD_PATHS)
+FIELD_INDEX = {field: i for i, field in enumerate(FIELDS)}
+GROUPS = ("income", "expenses", "savings")
+
+_MONTH_NUMBERS = {name.lower(): i for i, name in enumerate(MONTH_NAMES)}
+_KNOWN_PATHS = set(FIELD_PATHS.values())
+
+# Profile fields and the values the app shows when they aren't set
+PROFILE_DEFAULTS = {
+    "name": None,
+    "current_age": None,
+    "retirement_age": None,
+    "current_income": 0,
+    "current_savings": 0,
+    "risk_tolerance": None,
+    "inflation_rate": None,
+    "monthly_savings_target": 0,
+}
+
+_MISSING = object()
+
+
+class Profile:
+    """
+    A user's profile as a fixed-slot record.
+
+    Fields that weren't in the stored profile read as their PROFILE_DEFAULTS
+    value but are left out again by to_dict(); keys the model doesn't know
+    about are carried along untouched, so from_dict/to_dict round-trips.
+    """
+    __slots__ = tuple(PROFILE_DEFAULTS) + ("_extra",)
+
+    def __init__(self, **fields):
+        self._extra = {}
+        for name in PROFILE_DEFAULTS:
+            object.__setattr__(self, name, fields.pop(name, _MISSING))
+        self._extra.update(fields)
+
+    @classmethod
+    def from_dict(cls, data):
+        if isinstance(data, cls):
+            return data
+        return cls(**(data or {}))
+
+    def __getattribute__(self, name):
+        value = object.__getattribute__(self, name)
+        if value is _MISSING:
+            return PROFILE_DEFAULTS[name]
+        return value
+
+    def is_set(self, name):
+        """Whether the field was stored (as opposed to falling back to its default)"""
+        return object.__getattribute__(self, name) is not _MISSING
+
+    def get(self, name, default=None):
+        """Dict-style access, so code written against profile dicts keeps working"""
+        if name in PROFILE_DEFAULTS:
+            return getattr(self, name) if self.is_set(name) else default
+        return self._extra.get(name, default)
+
+    def to_dict(self):
+        data = {name: getattr(self, name) for name in PROFILE_DEFAULTS if self.is_set(name)}
+        data.update(self._extra)
+        return data
+
+    def __eq__(self, other):
+        return isinstance(other, Profile) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"Profile({self.to_dict()!r})"
+
+
+class YearLedger:
+    """
+    One year of monthly figures as a 12 x len(FIELDS) float matrix.
+
+    Rows are months and columns are FIELDS. ledger["groceries"] is a view of
+    one column, so aggregations are array operations.
+
+    to_months() reproduces the document from_months() read: masks record
+    months and fields that weren't stored and fields that were stored as
+    ints, and keys outside the schema are kept per month.
+    """
+    __slots__ = ("year", "values", "present", "missing", "integral", "_completed", "extras")
+
+    def __init__(self, year, values=None, completed=None):
+        self.year = str(year)
+        self.values = np.zeros((12, len(FIELDS))) if values is None else np.asarray(values, dtype=np.float64)
+        self.present = np.ones(12, dtype=bool) if values is not None else np.zeros(12, dtype=bool)
+        self.missing = np.zeros((12, len(FIELDS)), dtype=bool)
+        self.integral = np.zeros((12, len(FIELDS)), dtype=bool)
+        # -1 when a month has no "completed" key
+        self._completed = np.zeros(12, dtype=np.int8)
+        if completed is not None:
+            self._completed[:] = np.asarray(completed, dtype=bool)
+        self.extras = {}  # month index -> {path: value} for keys outside the schema
+
+    @classmethod
+    def from_months(cls, months, year):
+        """Read one year out of a {month_key: month document} mapping"""
+        ledger = cls(year)
+        for i in range(12):
+            month = months.get(month_key(ledger.year, i + 1))
+            if isinstance(month, dict):
+                ledger._read_month(i, month)
+        return ledger
+
+    def _read_month(self, i, month):
+        self.present[i] = True
+        row = self.values[i]
+        for field, path in FIELD_PATHS.items():
+            value = month
+            for part in path:
+                value = value.get(part, _MISSING) if isinstance(value, dict) else _MISSING
+            if value is _MISSING or isinstance(value, bool) or not isinstance(value, (int, float)):
+                self.missing[i, FIELD_INDEX[field]] = True
+                if value is not _MISSING:
+                    self.extras.setdefault(i, {})[path] = value
+            else:
+                row[FIELD_INDEX[field]] = value
+                self.integral[i, FIELD_INDEX[field]] = isinstance(value, int)
+
+        if "completed" in month:
+            self._completed[i] = bool(month["completed"])
+        else:
+            self._completed[i] = -1
+
+        for key, value in month.items():
+            if key in GROUPS and value == {}:
+                self.extras.setdefault(i, {})[(key,)] = {}
+            elif key in GROUPS and isinstance(value, dict):
+                for inner, inner_value in value.items():
+                    if (key, inner) not in _KNOWN_PATHS:
+                        self.extras.setdefault(i, {})[(key, inner)] = inner_value
+            elif key != "completed" and (key,) not in _KNOWN_PATHS:
+                self.extras.setdefault(i, {})[(key,)] = value
+
+    def to_months(self):
+        """Month documents for every month present, in the stored JSON schema"""
+        return {month_key(self.year, i + 1): self.month(i) for i in np.flatnonzero(self.present)}
+
+    def month(self, i):
+        """Month document for month index i (0 = January), or None if it isn't stored"""
+        if not self.present[i]:
+            return None
+        month = {}
+        row = self.values[i].tolist()
+        for field, path in FIELD_PATHS.items():
+            column = FIELD_INDEX[field]
+            if not self.missing[i, column]:
+                target = month
+                for part in path[:-1]:
+                    target = target.setdefault(part, {})
+                value = row[column]
+                if self.integral[i, column] and value.is_integer():
+                    value = int(value)
+                target[path[-1]] = value
+        if self._completed[i] >= 0:
+            month["completed"] = bool(self._completed[i])
+        for path, value in self.extras.get(i, {}).items():
+            target = month
+            for part in path[:-1]:
+                target = target.setdefault(part, {})
+            # Copied, so callers can't change the ledger through the document
+            target[path[-1]] = copy.deepcopy(value)
+        return month
+
+    @property
+    def completed(self):
+        """Boolean mask of completed months"""
+        return self._completed == 1
+
+    def __getitem__(self, field):
+        """Column view for one field across all 12 months"""
+        return self.values[:, FIELD_INDEX[field]]
+
+    def filled(self, field, default):
+        """Column values, with default for months or fields that aren't stored"""
+        has_value = self.present & ~self.missing[:, FIELD_INDEX[field]]
+        return np.where(has_value, self[field], default)
+
+    def to_frame(self):
+        """DataFrame over the same memory as values, one row per month"""
+        return pd.DataFrame(self.values, index=pd.Index(MONTH_NAMES, name="Month"),
+                            columns=list(FIELDS), copy=False)
+
+    @classmethod
+    def from_frame(cls, year, frame, completed=None, monthly_target=0.0):
+        """
+        Build a ledger from a frame with one row per month (in calendar order)
+        and any of the income/expense category columns; totals are recomputed.
+        """
+        ledger = cls(year)
+        for field in INCOME_FIELDS + EXPENSE_FIELDS:
+            if field in frame:
+                ledger[field][:] = frame[field].to_numpy(dtype=np.float64)
+        ledger.present[:] = True
+        if completed is not None:
+            ledger._completed[:] = np.asarray(completed, dtype=bool)
+        ledger.recompute(monthly_target)
+        return ledger
+
+    def recompute(self, monthly_target=None):
+        """Derive totals, cash flow and savings from the category columns"""
+        income = [FIELD_INDEX[field] for field in INCOME_FIELDS]
+        expenses = [FIELD_INDEX[field] for field in EXPENSE_FIELDS]
+        self["income_total"][:] = self.values[:, income].sum(axis=1)
+        self["expenses_total"][:] = self.values[:, expenses].sum(axis=1)
+        self["cash_flow"][:] = self["income_total"] - self["expenses_total"]
+        if monthly_target is not None:
+            self["savings_target"][:] = monthly_target
+        self["savings_actual"][:] = self["cash_flow"]
+        self["savings_difference"][:] = self["savings_actual"] - self["savings_target"]
+        self.missing[self.present] = False
+        self.integral[:] = False
+
+    def total(self, field, completed_only=True):
+        """Sum of a field over completed (or all present) months"""
+        mask = self.completed if completed_only else self.present
+        return float(self[field][mask].sum())
+
+    def mean(self, field, completed_only=True):
+        """Average of a field over completed (or all present) months"""
+        mask = self.completed if completed_only else self.present
+        return float(self[field][mask].mean()) if mask.any() else 0.0
+
+    @property
+    def nbytes(self):
+        masks = self.present.nbytes + self.missing.nbytes + self.integral.nbytes + self._completed.nbytes
+        return self.values.nbytes + masks
+
+
+def split_years(all_months):
+    """
+    {year: YearLedger} for every year in a months mapping, plus a dict of any
+    entries whose keys aren't month keys, so nothing is lost converting back.
+    """
+    years = set()
+    other = {}
+    for key, month in all_months.items():
+        name, _, year = key.rpartition("_")
+        if name in _MONTH_NUMBERS and year.isdigit() and isinstance(month, dict):
+            years.add(year)
+        else:
+            other[key] = month
+    return {year: YearLedger.from_months(all_months, year) for year in sorted(years)}, other
+
+
+def join_years(ledgers, other=None):
+    """Inverse of split_years"""
+    months = {}
+    for ledger in ledgers.values():
+        months.update(ledger.to_months())
+    months.update(other or {})
+    return months
+
+
+def completed_rows(ledgers, fields=FIELDS):
+    """
+    (month keys, matrix) of completed months in chronological order, with
+    one column per requested field, from a {year: YearLedger} mapping.
+    """
+    keys, blocks = [], []
+    columns = [FIELD_INDEX[field] for field in fields]
+    for year in sorted(ledgers, key=int):
+        ledger = ledgers[year]
+        rows = np.flatnonzero(ledger.completed)
+        keys.extend(month_key(year, i + 1) for i in rows)
+        blocks.append(ledger.values[np.ix_(rows, columns)])
+    matrix = np.vstack(blocks) if blocks else np.empty((0, len(columns)))
+    return keys, matrix
+
+
+class UserRecord:
+    """
+    A user document held as a Profile and one YearLedger per year.
+
+    This is what the document cache keeps for each user: a year of months
+    is a few small arrays instead of a dict per month and category. Month
+    entries that aren't month keys and other top-level keys are kept as they
+    were, so to_document() returns the document from_document() read.
+    """
+    __slots__ = ("profile", "years", "other_months", "extra")
+
+    def __init__(self, profile=None, years=None, other_months=None, extra=None):
+        self.profile = Profile.from_dict(profile)
+        self.years = years or {}
+        self.other_months = other_months or {}
+        self.extra = extra or {}
+
+    @classmethod
+    def from_document(cls, document):
+        years, other_months = split_years(document.get("months") or {})
+        extra = {key: value for key, value in document.items() if key not in ("profile", "months")}
+        return cls(document.get("profile"), years, other_months, extra)
+
+    def to_document(self):
+        """The plain user document, safe for the caller to change"""
+        document = copy.deepcopy(self.extra)
+        document["profile"] = self.profile.to_dict()
+        document["months"] = self.months()
+        return document
+
+    def months(self):
+        """{month_key: month document} for every stored month, safe for the caller to change"""
+        return join_years(self.years, copy.deepcopy(self.other_months))
+
+    def month(self, key):
+        """One month document, or None if it isn't stored"""
+        name, _, year = key.rpartition("_")
+        if year in self.years and name in _MONTH_NUMBERS:
+            return self.years[year].month(_MONTH_NUMBERS[name])
+        return copy.deepcopy(self.other_months.get(key))
+
+    def year(self, year):
+        """YearLedger for one year, empty if nothing is stored for it (shared; don't modify it)"""
+        return self.years.get(str(year)) or YearLedger(year)
+
+    @property
+    def nbytes(self):
+        size = sys.getsizeof(self.years) + sum(ledger.nbytes + estimate_size(ledger.extras)
+                                               for ledger in self.years.values())
+        return size + estimate_size(self.profile.to_dict()) + estimate_size(self.other_months) \
+            + estimate_size(self.extra)
@@ -0,0 +1,139 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+
+# Error codes/class names Bedrock and strands use when a request is throttled
+THROTTLING_NAMES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "ModelThrottledException",
+}
+
+# Lower values are served first by AdaptiveTokenBucket
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+
+class ThrottledError(Exception):
+    """Raised by local models to simulate upstream throttling"""
+
+
+def is_throttling_error(error):
+    """Whether an exception means the model endpoint asked us to slow down"""
+    if isinstance(error, ThrottledError) or type(error).__name__ in THROTTLING_NAMES:
+        return True
+    # botocore ClientError carries the service error code in its response
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        return response.get("Error", {}).get("Code") in THROTTLING_NAMES
+    return False
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` calls per second with bursts up to `capacity`"""
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens=1.0):
+        """Block until tokens are available, then take them"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait_for = (tokens - self._tokens) / self.rate
+            time.sleep(wait_for)
+
+
+class AdaptiveTokenBucket(TokenBucket):
+    """
+    Token bucket whose rate backs off on throttling, serving waiters by priority.
+
+    Each throttling response multiplies the rate by `decrease` (not below
+    min_rate) and empties the bucket; each success adds `increase` back, up
+    to the starting rate. Callers waiting for a token are served lowest
+    priority value first, then in arrival order, so interactive requests
+    overtake queued batch ones.
+    """
+    def __init__(self, rate, capacity=None, min_rate=None, decrease=0.5, increase=None):
+        super().__init__(rate, capacity)
+        self.max_rate = self.rate
+        self.min_rate = float(min_rate if min_rate is not None else self.rate / 20)
+        self.decrease = decrease
+        self.increase = float(increase if increase is not None else self.max_rate / 20)
+        self.throttled = 0
+        self._waiters = []  # heap of (priority, arrival) tickets
+        self._arrivals = itertools.count()
+        self._changed = threading.Condition(self._lock)
+
+    def acquire(self, tokens=1.0, priority=PRIORITY_INTERACTIVE):
+        """Block until this caller is first in line and tokens are available, then take them"""
+        ticket = (priority, next(self._arrivals))
+        with self._changed:
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    wait_for = None
+                    if self._waiters[0] == ticket:
+                        self._refill(time.monotonic())
+                        if self._tokens >= tokens:
+                            self._tokens -= tokens
+                            return
+                        wait_for = (tokens - self._tokens) / self.rate
+                    self._changed.wait(wait_for)
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._changed.notify_all()
+
+    def on_success(self):
+        with self._changed:
+            self._refill(time.monotonic())
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self):
+        with self._changed:
+            self._refill(time.monotonic())
+            self.throttled += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self._tokens = min(self._tokens, 0.0)
+            self._changed.notify_all()
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+
+def backoff_delay(attempt, base=0.5, cap=30.0):
+    """Full-jitter exponential backoff delay for a 0-based retry attempt"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def call_with_retries(fn, max_retries=5, base_delay=0.5, max_delay=30.0,
+                      is_retryable=is_throttling_error, sleep=time.sleep):
+    """
+    Call fn, retrying with jittered exponential backoff while it raises a
+    retryable error. Returns (result, attempts).
+    """
+    attempt = 0
+    while True:
+        try:
+            return fn(), attempt + 1
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            sleep(backoff_delay(attempt, base_delay, max_delay))
+            attempt += 1
@@ -0,0 +1,47 @@
+from typing import List, Optional
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+
+class SavingsRecommendation(BaseModel):
+    """A recommended monthly savings target and the reason for it"""
+    recommended_monthly_savings: Optional[float] = Field(
+        None, ge=0, le=1_000_000,
+        description="Exact new monthly savings target in dollars, e.g. 1250.0; null only if no target applies"
+    )
+    rationale: str = Field("", max_length=1000, description="One or two sentences explaining the target")
+
+
+class AnalysisReport(SavingsRecommendation):
+    """
+    Structured result of one financial analysis.
+
+    Used as the output schema of BudgetBuddyAgent.run_structured: the model
+    fills these fields through a tool call and pydantic validates them, so
+    the recommendation never has to be scraped out of free text.
+    """
+    analysis: str = Field(min_length=1, description="The analysis itself in Markdown, within 200 words")
+    action_items: List[str] = Field(default_factory=list, max_length=10,
+                                    description="Specific steps for the next 30 days, one per item")
+
+    @field_validator("action_items")
+    @classmethod
+    def _drop_blank_items(cls, items):
+        return [item.strip() for item in items if item and item.strip()]
+
+
+def describe_validation_error(error):
+    """Short, model-readable list of what failed validation"""
+    if isinstance(error, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(part) for part in detail['loc']) or 'output'}: {detail['msg']}"
+            for detail in error.errors()
+        )
+    return str(error)
+
+
+def build_repair_prompt(prompt, error):
+    """Ask again for a structured answer, telling the model what was wrong the first time"""
+    return f"""{prompt}
+
+Your previous structured answer was rejected: {describe_validation_error(error)}.
+Answer again with every field filled in and these problems fixed."""
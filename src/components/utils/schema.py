@@ -0,0 +1,33 @@
+import calendar
+
+# Category buckets of the monthly document, in display order
+INCOME_FIELDS = ("salary", "investment", "other_income")
+EXPENSE_FIELDS = ("rent", "groceries", "transportation", "utilities", "entertainment", "other_expenses")
+
+MONTH_NAMES = tuple(calendar.month_name[1:])
+
+
+def month_key(year, month):
+    """Storage key for a month number, e.g. (2024, 1) -> 'january_2024'"""
+    return f"{MONTH_NAMES[month - 1].lower()}_{year}"
+
+
+def build_month_record(income, expenses, monthly_target, completed=True):
+    """Build a month document from per-category income and expense amounts"""
+    income = {field: float(income.get(field, 0.0)) for field in INCOME_FIELDS}
+    expenses = {field: float(expenses.get(field, 0.0)) for field in EXPENSE_FIELDS}
+    income["total"] = sum(income.values())
+    expenses["total"] = sum(expenses.values())
+    cash_flow = income["total"] - expenses["total"]
+
+    return {
+        "income": income,
+        "expenses": expenses,
+        "savings": {
+            "target": float(monthly_target),
+            "actual": cash_flow,
+            "difference": cash_flow - monthly_target
+        },
+        "cash_flow": cash_flow,
+        "completed": completed
+    }
@@ -1,7 +1,49 @@
-import json
+import copy
 import os
+import threading
+import weakref
 import streamlit as st
 import calendar
+from .backends import create_backend, CoalescingBackend, WRITE_DELAY_SECONDS
+from .aggregates import RunningAggregates
+from .analysis_cache import get_analysis_cache
+from .document_cache import UserDocumentCache, CopyOnWriteDict, materialize
+from .model import UserRecord
+from .tracing import traced
+
+# "json" rewrites the whole document on every save, "journal" appends small
+# update records and compacts them into the JSON snapshot in the background,
+# "sqlite" stores one row per profile and per month in data/budgetbuddy.db
+STORAGE_MODE = os.getenv("BUDGETBUDDY_STORAGE_MODE", "json")
+DEFAULT_USER_ID = "test_user"  # Fixed single user for demo
+
+_backend = None
+_backend_lock = threading.Lock()
+
+# user_id -> RunningAggregates, shared by every session in the process
+_aggregates = {}
+
+# user_id -> lock held across a month write and its aggregate update, so
+# concurrent saves for a user can't interleave between reading the old month
+# and applying the change; other users' saves don't wait on it
+_user_locks = {}
+_user_locks_lock = threading.Lock()
+
+# user_id -> Categorizer with that user's overrides
+_categorizers = {}
+_categorizers_lock = threading.Lock()
+
+# user_id -> counter bumped on every write; derived views key their caches on it
+_data_versions = {}
+_data_versions_lock = threading.Lock()
+
+# UserRecords shared by every session, reloaded when the data version changes
+_documents = None
+_documents_lock = threading.Lock()
+
+# user_id -> FinancialDataTools the agent queries, memoized per data version
+_data_tools = {}
+_data_tools_lock = threading.Lock()
 
 def initialize_test_user():
     """Initialize a test user with empty data for all months"""
@@ -49,34 +91,87 @@ def initialize_test_user():
         "months": months_data
     }
 
+def _user_lock(user_id):
+    """The lock serializing one user's writes"""
+    with _user_locks_lock:
+        lock = _user_locks.get(user_id)
+        if lock is None:
+            lock = _user_locks[user_id] = threading.RLock()
+        return lock
+
+def get_backend():
+    """Get the process-wide storage backend"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                backend = create_backend(STORAGE_MODE, default_factory=initialize_test_user)
+                # Opt-in: bursts of saves from the UI are buffered and written together
+                if WRITE_DELAY_SECONDS > 0:
+                    backend = CoalescingBackend(backend)
+                _backend = backend
+    return _backend
+
+def get_document_cache():
+    """Process-wide cache of user documents, held as UserRecords"""
+    global _documents
+    if _documents is None:
+        with _documents_lock:
+            if _documents is None:
+                _documents = UserDocumentCache(
+                    lambda user_id: UserRecord.from_document(get_backend().load_user(user_id)),
+                    get_data_version, size=lambda record: record.nbytes)
+    return _documents
+
+def flush_user_data(user_id=None):
+    """Write any buffered saves now (all users when user_id is None)"""
+    get_backend().flush(user_id)
+
+class _SessionFlush:
+    """Kept in session_state; flushes the user's buffered saves when the session is dropped"""
+    def __init__(self, user_id):
+        self.user_id = user_id
+        weakref.finalize(self, flush_user_data, user_id)
+
+def register_session_flush():
+    """Flush the current user's buffered saves when this browser session ends"""
+    user_id = get_user_id()
+    handle = st.session_state.get("_session_flush")
+    if handle is None or handle.user_id != user_id:
+        st.session_state["_session_flush"] = _SessionFlush(user_id)
+
+def get_user_id():
+    """Get the user id for the current session"""
+    return st.session_state.get("user_id", DEFAULT_USER_ID)
+
+@traced()
 def get_user_data():
-    """Get or initialize user data"""
-    user_id = "test_user"  # Fixed single user for demo
-    
-    if 'user_data' not in st.session_state:
-        # Try to load from file
-        filename = f"data/{user_id}.json"
-        if os.path.exists(filename):
-            try:
-                with open(filename, 'r') as f:
-                    st.session_state.user_data = json.load(f)
-            except:
-                st.session_state.user_data = initialize_test_user()
-        else:
-            st.session_state.user_data = initialize_test_user()
+    """
+    Get or initialize user data.
+
+    Each session gets a copy-on-write view of a document built from the
+    shared cached record. The view is replaced by a fresh one once the data changes, unless it holds
+    edits that save_user_data() hasn't written yet.
+    """
+    user_id = get_user_id()
+    stamp = (user_id, get_data_version(user_id))
+    view = st.session_state.get('user_data')
+    if view is None or (st.session_state.get('user_data_stamp') != stamp and not view.changed):
+        st.session_state.user_data = CopyOnWriteDict(get_document_cache().get(user_id).to_document())
+        st.session_state.user_data_stamp = stamp
     
     return st.session_state.user_data
 
+@traced()
 def save_user_data():
     """Save user data to file"""
-    user_id = "test_user"
-    os.makedirs('data', exist_ok=True)
-    filename = f"data/{user_id}.json"
-    
     if 'user_data' in st.session_state:
         try:
-            with open(filename, 'w') as f:
-                json.dump(st.session_state.user_data, f, indent=2)
+            get_backend().save_user(get_user_id(), materialize(st.session_state.user_data))
+            rebuild_aggregates()
+            _on_data_changed(get_user_id())
+            # Saved, so the next read starts from the shared record again
+            st.session_state.pop('user_data', None)
             return True
         except Exception as e:
             st.error(f"Error saving data: {e}")
@@ -85,31 +180,198 @@ def save_user_data():
 
 def get_month_data(month_key):
     """Get data for specific month"""
-    user_data = get_user_data()
-    return user_data["months"].get(month_key, {})
+    return get_document_cache().get(get_user_id()).month(month_key) or {}
+
+def _update_session_view(change):
+    """
+    Apply a change being saved to this session's view if it has unsaved
+    edits to keep; otherwise drop the view, and the next read is built from
+    the updated record.
+    """
+    view = st.session_state.get('user_data')
+    if view is not None and view.changed:
+        change(view)
+    else:
+        st.session_state.pop('user_data', None)
 
 def update_month_data(month_key, data):
     """Update data for specific month"""
-    if 'user_data' not in st.session_state:
-        get_user_data()
+    _update_session_view(lambda view: view["months"].update({month_key: copy.deepcopy(data)}))
+    
+    backend = get_backend()
+    user_id = get_user_id()
+    try:
+        with _user_lock(user_id):
+            aggregates = get_aggregates()
+            previous = backend.load_month(user_id, month_key)
+            backend.save_month(user_id, month_key, data)
+            _apply_months_to_aggregates(user_id, aggregates, {month_key: previous}, {month_key: data})
+        _on_data_changed(user_id)
+        return True
+    except Exception as e:
+        st.error(f"Error saving data: {e}")
+        return False
+
+def update_months_data(months):
+    """Update several months ({month_key: data}) in one storage write"""
+    _update_session_view(lambda view: view["months"].update(copy.deepcopy(months)))
     
-    st.session_state.user_data["months"][month_key] = data
-    save_user_data()
+    backend = get_backend()
+    user_id = get_user_id()
+    try:
+        with _user_lock(user_id):
+            aggregates = get_aggregates()
+            previous = {month_key: backend.load_month(user_id, month_key) for month_key in months}
+            backend.save_months(user_id, months)
+            _apply_months_to_aggregates(user_id, aggregates, previous, months)
+        _on_data_changed(user_id)
+        return True
+    except Exception as e:
+        st.error(f"Error saving data: {e}")
+        return False
 
 def update_profile(profile_data):
     """Update user profile"""
-    if 'user_data' not in st.session_state:
-        get_user_data()
+    _update_session_view(lambda view: view.update(profile=copy.deepcopy(profile_data)))
     
-    st.session_state.user_data["profile"] = profile_data
-    save_user_data()
+    try:
+        get_backend().save_profile(get_user_id(), profile_data)
+        _on_data_changed(get_user_id())
+        return True
+    except Exception as e:
+        st.error(f"Error saving data: {e}")
+        return False
+
+def _on_data_changed(user_id):
+    """Drop anything derived from a user's data after a write"""
+    with _data_versions_lock:
+        _data_versions[user_id] = _data_versions.get(user_id, 0) + 1
+    get_analysis_cache().invalidate_user(user_id)
+
+def get_data_version(user_id=None):
+    """Counter that changes whenever this process writes the user's data"""
+    return _data_versions.get(user_id or get_user_id(), 0)
+
+def get_data_tools(user_id=None):
+    """Agent data tools for a user; their results are dropped whenever the data version changes"""
+    from .data_tools import FinancialDataTools
+    user_id = user_id or get_user_id()
+    with _data_tools_lock:
+        if user_id not in _data_tools:
+            _data_tools[user_id] = FinancialDataTools(get_backend(), user_id,
+                                                      version=lambda: get_data_version(user_id))
+        return _data_tools[user_id]
+
+def get_user_record():
+    """Get the user's Profile and YearLedgers (shared between sessions; don't modify it)"""
+    return get_document_cache().get(get_user_id())
 
 def get_all_months_data():
     """Get data for all months"""
-    user_data = get_user_data()
-    return user_data["months"]
+    return get_user_record().months()
+
+def get_year_ledger(year):
+    """Get one year of months as a YearLedger (shared between sessions; don't modify it)"""
+    return get_user_record().year(year)
 
 def get_profile():
-    """Get user profile"""
-    user_data = get_user_data()
-    return user_data["profile"]
\ No newline at end of file
+    """Get user Profile (shared between sessions; don't modify it)"""
+    return get_user_record().profile
+
+def get_ledger():
+    """Get the transaction ledger for the current user"""
+    from .ledger import TransactionLedger
+    return TransactionLedger(get_user_id())
+
+def append_transactions(dates, amounts, categories):
+    """Add transactions to the current user's ledger"""
+    touched = get_ledger().append(dates, amounts, categories)
+    _on_data_changed(get_user_id())
+    return touched
+
+def refresh_ledger_rollups(years=None):
+    """Rebuild monthly data from the transaction ledger"""
+    from .ledger import materialize_rollups
+    written = materialize_rollups(get_ledger(), get_backend(), years)
+    rebuild_aggregates()
+    _on_data_changed(get_user_id())
+    # Drop the session copy so the next read picks up the new months
+    st.session_state.pop('user_data', None)
+    return written
+
+def get_categorizer():
+    """Get the transaction categorizer for the current user, with their overrides"""
+    from .categorizer import Categorizer
+    user_id = get_user_id()
+    with _categorizers_lock:
+        if user_id not in _categorizers:
+            overrides = get_backend().load_meta(user_id, "category_overrides") or {}
+            _categorizers[user_id] = Categorizer(overrides=overrides)
+        return _categorizers[user_id]
+
+def set_category_override(keyword, category):
+    """Always categorize transactions containing keyword as category"""
+    categorizer = get_categorizer()
+    categorizer.add_override(keyword, category)
+    get_backend().save_meta(get_user_id(), "category_overrides", categorizer.overrides)
+
+def import_statement(source, fmt=None, dayfirst=False, resolver=None, account=None):
+    """
+    Import a bank statement (CSV, OFX or QIF) into the current user's months.
+
+    account names the card or bank account the statement is from; give one
+    when importing from several so their transactions aren't deduplicated
+    against each other. resolver, if given, is called once per chunk with merchants the local
+    rules couldn't place and returns {merchant: category}; its answers are
+    kept as overrides for later imports.
+    """
+    from .importer import StatementImporter
+    categorizer = get_categorizer()
+    importer = StatementImporter(get_backend(), get_user_id(), ledger=get_ledger(),
+                                 categorize=lambda chunk: categorizer.categorize(chunk, resolver))
+    # Held so a month saved from the form can't land between the importer reading and writing it
+    with _user_lock(get_user_id()):
+        result = importer.import_file(source, fmt=fmt, dayfirst=dayfirst, account=account)
+    if resolver is not None:
+        get_backend().save_meta(get_user_id(), "category_overrides", categorizer.overrides)
+    if result["imported"]:
+        rebuild_aggregates()
+        _on_data_changed(get_user_id())
+        # Drop the session copy so the next read picks up the new months
+        st.session_state.pop('user_data', None)
+    return result
+
+def get_aggregates():
+    """Get running aggregates for the current user, building them once if missing"""
+    backend = get_backend()
+    user_id = get_user_id()
+    with _user_lock(user_id):
+        aggregates = _aggregates.get(user_id)
+        if aggregates is None:
+            state = backend.load_meta(user_id, "aggregates")
+            if state is None:
+                aggregates = RunningAggregates.from_months(backend.load_months(user_id))
+                backend.save_meta(user_id, "aggregates", aggregates.to_dict())
+            else:
+                aggregates = RunningAggregates(state)
+            _aggregates[user_id] = aggregates
+        if aggregates.extremes_stale:
+            aggregates.refresh_extremes(backend.load_months(user_id))
+            backend.save_meta(user_id, "aggregates", aggregates.to_dict())
+        return aggregates
+
+def rebuild_aggregates():
+    """Recompute aggregates from scratch after a bulk change"""
+    backend = get_backend()
+    user_id = get_user_id()
+    with _user_lock(user_id):
+        aggregates = RunningAggregates.from_months(backend.load_months(user_id))
+        _aggregates[user_id] = aggregates
+        backend.save_meta(user_id, "aggregates", aggregates.to_dict())
+    return aggregates
+
+def _apply_months_to_aggregates(user_id, aggregates, previous, months):
+    """Swap changed months' contributions in the persisted aggregates; caller holds the user's lock"""
+    for month_key, data in months.items():
+        aggregates.apply(month_key, previous.get(month_key), data)
+    get_backend().save_meta(user_id, "aggregates", aggregates.to_dict())
\ No newline at end of file
@@ -0,0 +1,253 @@
+import atexit
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+from logging.handlers import RotatingFileHandler
+from .files import atomic_write_text
+
+# Off unless BUDGETBUDDY_TRACE=1; decided at import time so that traced
+# functions are left completely unwrapped when tracing is off
+TRACE_ENABLED = os.getenv("BUDGETBUDDY_TRACE", "0") == "1"
+TRACE_DIR = os.getenv("BUDGETBUDDY_TRACE_DIR", "data/traces")
+TRACE_MAX_BYTES = int(os.getenv("BUDGETBUDDY_TRACE_MAX_BYTES", 10 * 1024 * 1024))
+TRACE_BACKUPS = int(os.getenv("BUDGETBUDDY_TRACE_BACKUPS", 5))
+
+# Spans per name kept for the rolling percentiles
+ROLLING_WINDOW = 1000
+# Minimum seconds between rewrites of the Prometheus metrics file
+METRICS_INTERVAL_SECONDS = 10
+QUANTILES = (0.5, 0.95, 0.99)
+
+_NO_SPAN = nullcontext()
+
+
+class Tracer:
+    """
+    Records timed spans and keeps rolling latency percentiles per span name.
+
+    Spans are appended as JSON lines to spans.jsonl (rotated by size) with
+    the Streamlit session and rerun they ran in; nested spans point at their
+    parent. Percentiles over the last window spans of each name, plus
+    cumulative counts and sums, are written to metrics.prom in the
+    Prometheus text format at most every metrics_interval seconds.
+    """
+    def __init__(self, trace_dir=TRACE_DIR, max_bytes=TRACE_MAX_BYTES, backups=TRACE_BACKUPS,
+                 window=ROLLING_WINDOW, metrics_interval=METRICS_INTERVAL_SECONDS):
+        self.trace_path = os.path.join(trace_dir, "spans.jsonl")
+        self.metrics_path = os.path.join(trace_dir, "metrics.prom")
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.metrics_interval = metrics_interval
+        self._durations = defaultdict(lambda: deque(maxlen=window))
+        self._counts = defaultdict(int)
+        self._sums = defaultdict(float)
+        self._recent = deque(maxlen=500)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._logger = None
+        self._metrics_written = 0.0
+
+    def _context(self):
+        local = self._local
+        if not hasattr(local, "stack"):
+            local.stack = []
+            local.session_id = None
+            local.rerun_id = None
+        return local
+
+    def _span_logger(self):
+        if self._logger is None:
+            with self._lock:
+                if self._logger is None:
+                    os.makedirs(os.path.dirname(self.trace_path) or ".", exist_ok=True)
+                    handler = RotatingFileHandler(self.trace_path, maxBytes=self.max_bytes,
+                                                  backupCount=self.backups, encoding="utf-8")
+                    handler.setFormatter(logging.Formatter("%(message)s"))
+                    # Standalone logger, so app logging configuration never sees spans
+                    logger = logging.Logger("budgetbuddy.trace")
+                    logger.addHandler(handler)
+                    self._logger = logger
+        return self._logger
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Time the enclosed block as one span"""
+        context = self._context()
+        span_id = uuid.uuid4().hex[:16]
+        parent_id = context.stack[-1] if context.stack else None
+        context.stack.append(span_id)
+        started = time.time()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            context.stack.pop()
+            self.record({
+                "name": name,
+                "span_id": span_id,
+                "parent_id": parent_id,
+                "session_id": context.session_id,
+                "rerun_id": context.rerun_id,
+                "start": started,
+                "duration_ms": round(duration * 1000, 3),
+                "thread": threading.current_thread().name,
+                "error": error,
+                **attributes
+            })
+
+    def record(self, span):
+        name = span["name"]
+        seconds = span["duration_ms"] / 1000
+        with self._lock:
+            self._durations[name].append(seconds)
+            self._counts[name] += 1
+            self._sums[name] += seconds
+            self._recent.append(span)
+        self._span_logger().info(json.dumps(span, default=str))
+
+    @contextmanager
+    def rerun(self, session_id=None):
+        """Group every span on this thread under one Streamlit rerun"""
+        context = self._context()
+        context.session_id = session_id
+        context.rerun_id = uuid.uuid4().hex[:16]
+        try:
+            with self.span("rerun"):
+                yield
+        finally:
+            context.session_id = context.rerun_id = None
+            self.write_metrics()
+
+    def propagate(self, fn):
+        """Wrap fn so spans it records on another thread join the caller's rerun"""
+        context = self._context()
+        session_id, rerun_id = context.session_id, context.rerun_id
+        parent = context.stack[-1] if context.stack else None
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            worker = self._context()
+            saved = (worker.session_id, worker.rerun_id, worker.stack)
+            worker.session_id, worker.rerun_id = session_id, rerun_id
+            worker.stack = [parent] if parent else []
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                worker.session_id, worker.rerun_id, worker.stack = saved
+        return wrapper
+
+    def summary(self):
+        """{span name: {count, p50_ms, p95_ms, p99_ms}} over the rolling window"""
+        import numpy as np
+        with self._lock:
+            windows = {name: np.array(values) for name, values in self._durations.items()}
+            counts = dict(self._counts)
+        result = {}
+        for name, values in sorted(windows.items()):
+            p50, p95, p99 = np.quantile(values, QUANTILES) * 1000
+            result[name] = {"count": counts[name], "p50_ms": p50, "p95_ms": p95, "p99_ms": p99}
+        return result
+
+    def recent_spans(self, session_id=None):
+        """Spans of the latest finished rerun, for session_id if given"""
+        with self._lock:
+            spans = list(self._recent)
+        reruns = [span for span in spans if span["name"] == "rerun"
+                  and (session_id is None or span["session_id"] == session_id)]
+        if not reruns:
+            return []
+        rerun_id = reruns[-1]["rerun_id"]
+        return [span for span in spans if span["rerun_id"] == rerun_id]
+
+    def prometheus_text(self):
+        """Span latencies in the Prometheus text exposition format"""
+        import numpy as np
+        with self._lock:
+            windows = {name: np.array(values) for name, values in self._durations.items()}
+            counts = dict(self._counts)
+            sums = dict(self._sums)
+        lines = [
+            "# HELP budgetbuddy_span_duration_seconds Duration of traced BudgetBuddy operations.",
+            "# TYPE budgetbuddy_span_duration_seconds summary",
+        ]
+        for name, values in sorted(windows.items()):
+            label = name.replace("\\", "\\\\").replace('"', '\\"')
+            for quantile, value in zip(QUANTILES, np.quantile(values, QUANTILES)):
+                lines.append(f'budgetbuddy_span_duration_seconds{{span="{label}",quantile="{quantile}"}} {value:.6f}')
+            lines.append(f'budgetbuddy_span_duration_seconds_sum{{span="{label}"}} {sums[name]:.6f}')
+            lines.append(f'budgetbuddy_span_duration_seconds_count{{span="{label}"}} {counts[name]}')
+        return "\n".join(lines) + "\n"
+
+    def write_metrics(self, force=False):
+        """Rewrite metrics.prom if metrics_interval has passed since the last write"""
+        now = time.monotonic()
+        if not force and now - self._metrics_written < self.metrics_interval:
+            return
+        self._metrics_written = now
+        # World-readable so a node exporter textfile collector can pick it up
+        atomic_write_text(self.metrics_path, self.prometheus_text(), mode=0o644)
+
+
+_tracer = None
+if TRACE_ENABLED:
+    _tracer = Tracer()
+    atexit.register(_tracer.write_metrics, force=True)
+
+
+def get_tracer():
+    """The process-wide Tracer, or None when tracing is off"""
+    return _tracer
+
+
+def span(name, **attributes):
+    """
+    Context manager timing a block:
+
+        with span("build_frame", year=year):
+            ...
+    """
+    if _tracer is None:
+        return _NO_SPAN
+    return _tracer.span(name, **attributes)
+
+
+def traced(name=None):
+    """Decorator recording each call as a span named after the function"""
+    def decorate(fn):
+        if _tracer is None:
+            return fn
+        span_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _tracer.span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def trace_rerun():
+    """Context manager around one run of the Streamlit script"""
+    if _tracer is None:
+        return _NO_SPAN
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    return _tracer.rerun(ctx.session_id if ctx is not None else None)
+
+
+def propagate(fn):
+    """fn, carrying the current rerun along when it runs on a worker thread"""
+    if _tracer is None:
+        return fn
+    return _tracer.propagate(fn)
@@ -1,47 +1,101 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import calendar
-from .utils.storage import get_all_months_data, get_profile
+from .utils.storage import get_document_cache, get_user_id, get_data_version, get_profile, get_aggregates
+from .utils.ledger import TransactionLedger
+from .utils.downsample import lttb
+from .utils.tracing import traced
 
+MONTHS = list(calendar.month_name[1:])
+
+# Amounts stay numeric in the table and are formatted by the browser
+CURRENCY_COLUMNS = {
+    name: st.column_config.NumberColumn(name, format="dollar")
+    for name in ('Target Savings', 'Actual Savings', 'Difference')
+}
+
+def build_savings_frame(ledger, monthly_target):
+    """Target vs actual savings per month of one YearLedger"""
+    target = ledger.filled("savings_target", monthly_target)
+    actual = ledger["savings_actual"]
+
+    return pd.DataFrame({
+        'Month': MONTHS,
+        'Target Savings': target,
+        'Actual Savings': actual,
+        'Difference': actual - target,
+        'Status': np.where(actual >= target, 'On Target', 'Below Target'),
+        'Completed': ledger.completed
+    })
+
+def build_display_table(df):
+    """Progress table with status icons"""
+    display_df = df.copy()
+    display_df['Status'] = np.where(df['Status'] == 'On Target', '✅ On Target', '⚠️ Below Target')
+    return display_df
+
+def build_savings_figures(df):
+    """Target vs actual and difference bar charts for a savings frame"""
+    comparison = px.bar(df, x='Month', y=['Target Savings', 'Actual Savings'],
+                        title='Monthly Savings: Target vs Actual', barmode='group')
+    difference = px.bar(df, x='Month', y='Difference', color='Status',
+                        title='Monthly Savings Difference',
+                        color_discrete_map={'On Target': 'green', 'Below Target': 'red'})
+    return comparison, difference
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def build_savings_view(user_id, data_version, year):
+    """
+    DataFrame, display table and figures for one user's year.
+
+    Cached on the data version, which only changes when storage writes, so
+    reruns triggered by widgets elsewhere in the app reuse everything here.
+    st.cache_data hands every caller its own copy, so a session changing a
+    frame or figure can't affect what other users see.
+    """
+    record = get_document_cache().get(user_id)
+    df = build_savings_frame(record.year(year), record.profile.monthly_savings_target)
+    comparison, difference = build_savings_figures(df)
+    return {
+        "df": df,
+        "display_df": build_display_table(df),
+        "comparison_fig": comparison,
+        "difference_fig": difference
+    }
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def build_history_figure(user_id, data_version):
+    """Cumulative net cash flow over the whole transaction ledger, or None if it's empty"""
+    days, net = TransactionLedger(user_id).daily_net()
+    if not len(days):
+        return None
+    # Years of daily points are downsampled to what the chart can actually show
+    x, y = lttb(days, np.cumsum(net))
+    return px.line(x=x, y=y, labels={'x': 'Date', 'y': 'Cumulative Net Cash Flow'},
+                   title='Cumulative Net Cash Flow')
+
+@traced()
 def render_visualization():
     st.header("📈 Savings Visualization & Progress Tracking")
-    
-    profile = get_profile()
-    monthly_target = profile.get("monthly_savings_target", 0)
-    all_months = get_all_months_data()
-    
-    # Prepare data for visualization
-    months = list(calendar.month_name[1:])
+
+    monthly_target = get_profile().monthly_savings_target
+
     current_year = "2024"
-    
-    data = []
-    for month in months:
-        month_key = f"{month.lower()}_{current_year}"
-        month_data = all_months.get(month_key, {})
-        savings_data = month_data.get("savings", {})
-        
-        actual = savings_data.get("actual", 0)
-        target = savings_data.get("target", monthly_target)
-        difference = actual - target
-        
-        data.append({
-            'Month': month,
-            'Target Savings': target,
-            'Actual Savings': actual,
-            'Difference': difference,
-            'Status': 'On Target' if actual >= target else 'Below Target',
-            'Completed': month_data.get("completed", False)
-        })
-    
-    df = pd.DataFrame(data)
-    
-    # Summary metrics
-    total_target = df['Target Savings'].sum()
-    total_actual = df['Actual Savings'].sum()
+    user_id = get_user_id()
+    data_version = get_data_version(user_id)
+    view = build_savings_view(user_id, data_version, current_year)
+
+    # Summary metrics come from the running aggregates; months with nothing
+    # stored count against the profile target, as in the table below
+    year_totals = get_aggregates().year(current_year)
+    missing_months = len(MONTHS) - year_totals["months"]
+    total_target = year_totals["target"] + missing_months * monthly_target
+    total_actual = year_totals["actual"]
     yearly_difference = total_actual - total_target
-    completion_rate = (df['Completed'].sum() / len(df)) * 100
-    
+    completion_rate = (year_totals["completed"] / len(MONTHS)) * 100
+
     # Display summary cards
     col1, col2, col3, col4 = st.columns(4)
     with col1:
@@ -49,33 +103,26 @@ def render_visualization():
     with col2:
         st.metric("Yearly Actual", f"${total_actual:,.2f}")
     with col3:
-        st.metric("Yearly Difference", f"${yearly_difference:,.2f}", 
+        st.metric("Yearly Difference", f"${yearly_difference:,.2f}",
                  delta_color="inverse" if yearly_difference < 0 else "normal")
     with col4:
         st.metric("Completion Rate", f"{completion_rate:.1f}%")
-    
+
     # Visualization
     col1, col2 = st.columns(2)
-    
+
     with col1:
         # Bar chart
-        fig = px.bar(df, x='Month', y=['Target Savings', 'Actual Savings'],
-                    title='Monthly Savings: Target vs Actual', barmode='group')
-        st.plotly_chart(fig, use_container_width=True)
-    
+        st.plotly_chart(view["comparison_fig"], use_container_width=True)
+
     with col2:
         # Difference chart
-        fig = px.bar(df, x='Month', y='Difference', color='Status',
-                    title='Monthly Savings Difference',
-                    color_discrete_map={'On Target': 'green', 'Below Target': 'red'})
-        st.plotly_chart(fig, use_container_width=True)
-    
+        st.plotly_chart(view["difference_fig"], use_container_width=True)
+
+    history_fig = build_history_figure(user_id, data_version)
+    if history_fig is not None:
+        st.plotly_chart(history_fig, use_container_width=True)
+
     # Progress table
     st.subheader("Monthly Progress Overview")
-    display_df = df.copy()
-    display_df['Target Savings'] = display_df['Target Savings'].apply(lambda x: f"${x:,.2f}")
-    display_df['Actual Savings'] = display_df['Actual Savings'].apply(lambda x: f"${x:,.2f}")
-    display_df['Difference'] = display_df['Difference'].apply(lambda x: f"${x:,.2f}")
-    display_df['Status'] = display_df['Status'].apply(lambda x: f"✅ {x}" if x == 'On Target' else f"⚠️ {x}")
-    
-    st.dataframe(display_df, use_container_width=True)
\ No newline at end of file
+    st.dataframe(view["display_df"], use_container_width=True, column_config=CURRENCY_COLUMNS)
\ No newline at end of file
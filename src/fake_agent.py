@@ -0,0 +1,83 @@
+import hashlib
+import random
+import re
+import time
+from components.utils.ratelimit import ThrottledError, PRIORITY_INTERACTIVE
+from components.utils.gateway import request_key
+from components.utils.recommendation import AnalysisReport
+
+
+class FakeBudgetBuddyAgent:
+    """
+    Offline stand-in for BudgetBuddyAgent with the same run()/stream()/
+    run_structured() interface.
+
+    Responses are deterministic for a given prompt and always end with a
+    NEW SAVINGS TARGET line, so the extraction path can be exercised without
+    AWS. latency (seconds) and throttle_rate (0-1) simulate a slow or
+    throttled endpoint. Given a ModelGateway, calls go through it the way
+    BudgetBuddyAgent's do, so coalescing and throttling can be tested offline.
+    """
+    def __init__(self, latency=0.0, throttle_rate=0.0, seed=None, gateway=None, priority=PRIORITY_INTERACTIVE):
+        self.system_prompt = "You are a fake BudgetBuddy used for offline runs."
+        self.model_id = "local-fake"
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.gateway = gateway
+        self.priority = priority
+        self.calls = 0
+        self._random = random.Random(seed)
+
+    def _call(self, kind, user_input, fn):
+        if self.gateway is None:
+            return fn()
+        return self.gateway.call(request_key(kind, self, user_input), fn, self.priority)
+
+    def _respond(self, user_input):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self._random.random() < self.throttle_rate:
+            raise ThrottledError("ThrottlingException: Too many requests, please wait before trying again.")
+
+        income, rate, target = self._plan(user_input)
+        return (
+            "**Summary**\n"
+            f"- Saving {rate:.0%} of a ${income:,.2f} monthly income keeps you on track.\n"
+            "- Review recurring expenses monthly.\n\n"
+            f"NEW SAVINGS TARGET: ${target:,.2f}"
+        )
+
+    @staticmethod
+    def _plan(user_input):
+        income = re.search(r'Monthly Income: \$([\d,]+(?:\.\d{2})?)', user_input)
+        income = float(income.group(1).replace(',', '')) if income else 0.0
+        # Stable pseudo-random rate per prompt so reruns produce identical output
+        digest = int(hashlib.sha256(user_input.encode("utf-8")).hexdigest()[:8], 16)
+        rate = 0.15 + (digest % 11) / 100
+        return income, rate, round(income * rate, 2)
+
+    def run(self, user_input: str) -> str:
+        return self._call("run", user_input, lambda: self._respond(user_input))
+
+    def run_structured(self, user_input: str, output_model=AnalysisReport):
+        self._call("structured", user_input, lambda: self._respond(user_input))
+        income, rate, target = self._plan(user_input)
+        fields = {
+            "analysis": f"**Summary**\n- Saving {rate:.0%} of a ${income:,.2f} monthly income keeps you on track.",
+            "recommended_monthly_savings": target,
+            "rationale": f"{rate:.0%} of monthly income.",
+            "action_items": ["Review recurring expenses monthly."],
+        }
+        return output_model.model_validate({name: fields[name] for name in output_model.model_fields})
+
+    def stream(self, user_input: str):
+        if self.gateway is None:
+            return self._stream(user_input)
+        return self.gateway.stream(request_key("stream", self, user_input),
+                                   lambda: self._stream(user_input), self.priority)
+
+    def _stream(self, user_input):
+        response = self._respond(user_input)
+        for i in range(0, len(response), 16):
+            yield response[i:i + 16]
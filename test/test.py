@@ -22,12 +22,9 @@ def test_agent_creation():
         # Mock AWS dependencies to avoid actual API calls
         import unittest.mock as mock
         
-        with mock.patch('agent.boto3.Session') as mock_session, \
-             mock.patch('agent.BedrockModel') as mock_provider:
+        with mock.patch('agent.get_bedrock_model') as mock_provider:
             
             # Setup mocks
-            mock_client = mock.Mock()
-            mock_session.return_value.client.return_value = mock_client
             mock_provider.return_value = mock.Mock()
             
             from agent import BudgetBuddyAgent
@@ -43,23 +40,726 @@ def test_agent_creation():
         print(f"❌ Agent test failed: {e}")
         return False
 
+def test_batch_review_resume():
+    """Test that the batch CLI runs offline and resumes from its checkpoint"""
+    import json
+    import tempfile
+    import batch_review
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = os.path.join(tmp, "data")
+        os.makedirs(data_dir)
+        for user_id in ["alice", "bob", "carol"]:
+            with open(os.path.join(data_dir, f"{user_id}.json"), 'w') as f:
+                json.dump({"profile": {"current_income": 4000}, "months": {}}, f)
+        output = os.path.join(tmp, "reviews.jsonl")
+        args = ["--data-dir", data_dir, "--output", output, "--model", "fake", "--rate", "100"]
+        
+        assert batch_review.main(args) == 0, "First run should succeed"
+        assert batch_review.main(args) == 0, "Resumed run should succeed"
+        
+        with open(output) as f:
+            records = [json.loads(line) for line in f]
+        assert len(records) == 3, "Resumed run should not redo finished users"
+        assert all(r["recommended_amount"] for r in records), "Every review should have a target"
+
+def test_batch_review_retries_once():
+    """Test that batch calls are limited and retried by the gateway alone"""
+    import tempfile
+    from batch_review import BatchReviewRunner
+    from components.utils.backends import create_backend
+    from fake_agent import FakeBudgetBuddyAgent
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = create_backend("json", data_dir=tmp)
+        for i in range(6):
+            backend.save_profile(f"user{i}", {"current_income": 4000 + i})
+        agents = []
+
+        def factory():
+            agents.append(FakeBudgetBuddyAgent(throttle_rate=0.4, seed=len(agents)))
+            return agents[-1]
+
+        runner = BatchReviewRunner(backend, factory, os.path.join(tmp, "reviews.jsonl"), rate=100, base_delay=0.01,
+                                   max_retries=10)
+        assert runner.run() == {"ok": 6, "error": 0}, "Throttled reviews should be retried"
+        assert runner.gateway.limiter.throttled > 0, "The fake endpoint should have throttled"
+        assert runner.gateway.upstream_calls == sum(agent.calls for agent in agents), \
+            "Every model attempt should go through the gateway exactly once"
+        assert len(agents) == 6, "Retries should reuse the job's agent rather than wrap the gateway again"
+
+def test_statement_import_idempotent():
+    """Test that importing the same statement twice doesn't double count"""
+    import tempfile
+    from components.utils.backends import create_backend
+    from components.utils.importer import StatementImporter
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        statement = os.path.join(tmp, "statement.csv")
+        with open(statement, 'w') as f:
+            f.write("Date,Description,Amount\n")
+            f.write("2024-01-05,COFFEE,-4.50\n2024-01-05,COFFEE,-4.50\n2024-01-31,PAYROLL,3000\n")
+        backend = create_backend("json", data_dir=tmp)
+        importer = StatementImporter(backend, "alice")
+        
+        first = importer.import_file(statement)
+        second = importer.import_file(statement)
+        assert first["imported"] == 3, "Identical same-day rows should both be imported"
+        assert second["imported"] == 0 and second["duplicates"] == 3, "Re-import should be skipped"
+        
+        january = backend.load_month("alice", "january_2024")
+        assert january["expenses"]["total"] == 9.0, "Expenses should be counted once"
+        assert january["income"]["total"] == 3000.0, "Income should be counted once"
+
+def test_statement_import_overlap():
+    """Test that overlapping statements dedupe per account but not across accounts"""
+    import tempfile
+    from components.utils.backends import create_backend
+    from components.utils.importer import StatementImporter
+
+    def write(path, rows):
+        with open(path, 'w') as f:
+            f.write("Date,Description,Amount\n" + "".join(f"{row}\n" for row in rows))
+        return path
+
+    with tempfile.TemporaryDirectory() as tmp:
+        january = write(os.path.join(tmp, "january.csv"),
+                        ["2024-01-05,COFFEE,-4.50", "2024-01-05,COFFEE,-4.50", "2024-01-20,LUNCH,-12"])
+        # Overlaps january from the 20th and has a third coffee on the 5th
+        late = write(os.path.join(tmp, "late.csv"),
+                     ["2024-01-05,COFFEE,-4.50", "2024-01-05,COFFEE,-4.50", "2024-01-05,COFFEE,-4.50",
+                      "2024-01-20,LUNCH,-12", "2024-02-02,LUNCH,-12"])
+        backend = create_backend("json", data_dir=tmp)
+        importer = StatementImporter(backend, "alice")
+
+        assert importer.import_file(january)["imported"] == 3, "The first statement should import in full"
+        overlap = importer.import_file(late)
+        assert overlap["imported"] == 2 and overlap["duplicates"] == 3, \
+            "Only the rows past the earlier statement should be imported"
+        card = importer.import_file(january, account="card")
+        assert card["imported"] == 3, "The same purchases on another account are new transactions"
+        assert importer.import_file(january, account="card")["imported"] == 0, \
+            "Re-importing a named account's statement should be skipped"
+        assert backend.load_month("alice", "january_2024")["expenses"]["total"] == 25.5 + 21.0, \
+            "January should hold both accounts once each"
+
+def test_statement_import_resumes_after_failure():
+    """Test that a failed import keeps the index, months and ledger in step so a rerun finishes it"""
+    import tempfile
+    import unittest.mock as mock
+    from components.utils.backends import create_backend
+    from components.utils.importer import StatementImporter, default_categories
+    from components.utils.ledger import TransactionLedger
+
+    with tempfile.TemporaryDirectory() as tmp:
+        statement = os.path.join(tmp, "statement.csv")
+        with open(statement, 'w') as f:
+            f.write("Date,Description,Amount\n" + "".join(f"2024-01-{day:02d},LUNCH,-10\n" for day in range(1, 7)))
+        backend = create_backend("json", data_dir=tmp)
+        ledger = TransactionLedger("alice", data_dir=os.path.join(tmp, "ledger"))
+        chunks = []
+
+        def fail_on_second_chunk(chunk):
+            chunks.append(len(chunk))
+            if len(chunks) == 2:
+                raise RuntimeError("categorizer down")
+            return default_categories(chunk)
+
+        importer = StatementImporter(backend, "alice", ledger=ledger, categorize=fail_on_second_chunk, chunk_rows=2)
+        try:
+            importer.import_file(statement)
+            assert False, "The categorizer error should reach the caller"
+        except RuntimeError:
+            pass
+        assert backend.load_month("alice", "january_2024")["expenses"]["total"] == 20, \
+            "Rows read before the failure should be in the months"
+        assert len(ledger.query("2024-01-01", "2025-01-01")["date"]) == 2, "...and in the ledger"
+
+        with mock.patch.object(backend, "save_months", side_effect=OSError("disk full")):
+            try:
+                importer.import_file(statement)
+                assert False, "The write error should reach the caller"
+            except OSError:
+                pass
+        importer.categorize = default_categories
+        assert importer.import_file(statement)["imported"] == 4, \
+            "A failed month write should leave the rest of the rows to import"
+        assert backend.load_month("alice", "january_2024")["expenses"]["total"] == 60, "Every row counted once"
+
+def test_ledger_matches_imported_months():
+    """Test that refunds reduce spend in the ledger just as they do in the stored months"""
+    import tempfile
+    from components.utils.backends import create_backend
+    from components.utils.importer import StatementImporter
+    from components.utils.ledger import TransactionLedger
+
+    with tempfile.TemporaryDirectory() as tmp:
+        statement = os.path.join(tmp, "statement.csv")
+        with open(statement, 'w') as f:
+            f.write("Date,Description,Amount,Category\n")
+            f.write("2024-01-03,PAYROLL,3000,salary\n2024-01-05,GROCER,-120,groceries\n")
+            f.write("2024-01-09,GROCER REFUND,20,groceries\n")
+        backend = create_backend("json", data_dir=tmp)
+        ledger = TransactionLedger("alice", data_dir=os.path.join(tmp, "ledger"))
+        StatementImporter(backend, "alice", ledger=ledger).import_file(statement)
+
+        stored = backend.load_month("alice", "january_2024")
+        rolled = ledger.rollup(2024)["january_2024"]
+        assert stored["expenses"]["groceries"] == 100.0, "The refund should reduce groceries"
+        assert rolled["expenses"] == stored["expenses"], "Ledger rollup should match the stored month"
+        assert rolled["income"] == stored["income"], "Ledger income should match the stored month"
+        _, net = ledger.daily_net("2024-01-01", "2024-02-01")
+        assert net.sum() == stored["income"]["total"] - stored["expenses"]["total"], \
+            "Daily net should add up to income minus expenses"
+        assert net[8] == 20.0, "A refund is money in on its day"
+
+def test_ledger_concurrent_appends():
+    """Test that separate ledger instances appending at once keep every row, and a half-done swap is undone"""
+    import tempfile
+    import threading
+    from components.utils.ledger import TransactionLedger
+
+    with tempfile.TemporaryDirectory() as tmp:
+        def append(worker):
+            # A new instance per call, as storage.get_ledger() does
+            for i in range(10):
+                TransactionLedger("alice", data_dir=tmp).append(["2024-03-01"], [worker * 100 + i], ["groceries"])
+
+        threads = [threading.Thread(target=append, args=(worker,)) for worker in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        ledger = TransactionLedger("alice", data_dir=tmp)
+        amounts = ledger.query("2024-01-01", "2025-01-01")["amount"]
+        assert sorted(amounts) == [worker * 100 + i for worker in range(4) for i in range(10)], \
+            "No append should be lost"
+
+        # A writer that stopped after moving the partition aside
+        os.replace(os.path.join(tmp, "alice", "2024"), os.path.join(tmp, "alice", "2024.old"))
+        assert ledger.years() == [2024], "The moved partition should be put back"
+        assert len(ledger.query("2024-01-01", "2025-01-01")["amount"]) == 40, "Its rows should be readable"
+
+def test_storage_backends_round_trip():
+    """Test that every storage backend gives back what was saved, also after reopening"""
+    import tempfile
+    from components.utils.backends import BACKENDS, create_backend
+    from components.utils.schema import build_month_record
+
+    january = build_month_record({"salary": 4000}, {"rent": 1500}, 500, completed=True)
+    february = build_month_record({"salary": 4100}, {"groceries": 320.5}, 500, completed=False)
+    for mode in BACKENDS:
+        with tempfile.TemporaryDirectory() as tmp:
+            backend = create_backend(mode, data_dir=tmp)
+            backend.save_user("alice", {"profile": {"age": 30}, "months": {"january_2024": january}})
+            backend.save_months("alice", {"february_2024": february})
+            backend.save_profile("alice", {"age": 31})
+            backend.save_meta("alice", "notes", {"seen": True})
+            backend.flush("alice")
+
+            for reader in (backend, create_backend(mode, data_dir=tmp)):
+                assert reader.load_profile("alice") == {"age": 31}, f"{mode}: profile should round-trip"
+                assert reader.load_months("alice") == {"january_2024": january, "february_2024": february}, \
+                    f"{mode}: months should round-trip"
+                assert reader.load_meta("alice", "notes") == {"seen": True}, f"{mode}: meta should round-trip"
+                assert "alice" in reader.list_users(), f"{mode}: saved users should be listed"
+            if hasattr(backend, "close"):
+                backend.close()
+
+def test_journal_compaction_recovers():
+    """Test that a compaction cut short after rotating the journal loses nothing on reload"""
+    import tempfile
+    import unittest.mock as mock
+    from components.utils.journal import UserJournal
+
+    with tempfile.TemporaryDirectory() as tmp:
+        journal = UserJournal("alice", data_dir=tmp, max_records=1000)
+        journal.append("profile", {"age": 30})
+        journal.append("month", {"income": {"salary": 4000}}, key="january_2024")
+        journal.compact()
+        assert not os.path.exists(journal.journal_path), "Compaction should fold the pending records"
+        journal.append("month", {"income": {"salary": 4100}}, key="february_2024")
+        journal.append("profile", {"age": 31})
+
+        # Crash between rotating to .journal.compacting and writing the snapshot
+        with mock.patch("components.utils.journal.atomic_write_json", side_effect=OSError("killed")):
+            try:
+                journal.compact()
+                assert False, "The interrupted compaction should raise"
+            except OSError:
+                pass
+        assert os.path.exists(journal.compacting_path), "The rotated segment should be left behind"
+        journal.append("month", {"income": {"salary": 4200}}, key="march_2024")
+
+        expected = {"profile": {"age": 31}, "months": {
+            "january_2024": {"income": {"salary": 4000}},
+            "february_2024": {"income": {"salary": 4100}},
+            "march_2024": {"income": {"salary": 4200}},
+        }}
+        reopened = UserJournal("alice", data_dir=tmp)
+        assert reopened.load() == expected, "Reload should replay the snapshot, the leftover segment and the journal"
+        reopened.compact()
+        assert not os.path.exists(reopened.compacting_path), "The next compaction should fold the leftover segment"
+        assert UserJournal("alice", data_dir=tmp).load() == expected, "Compacting again should not change the document"
+
+def test_copy_on_write_views():
+    """Test that session views never change the shared document and reloads follow the version"""
+    from components.utils.document_cache import UserDocumentCache, CopyOnWriteDict, materialize
+
+    loads = []
+    version = {"alice": 0}
+    shared = {"profile": {"age": 30}, "months": {"january_2024": {"income": {"salary": 4000}}}}
+    cache = UserDocumentCache(lambda user_id: loads.append(user_id) or shared, version.get)
+
+    view = CopyOnWriteDict(cache.get("alice"))
+    view["months"]["january_2024"]["income"]["salary"] = 4500
+    view["profile"] = {"age": 31}
+    del view["months"]["january_2024"]["income"]
+    assert shared["months"]["january_2024"]["income"]["salary"] == 4000, "Writes should stay in the view"
+    assert shared["profile"] == {"age": 30}, "Replacing a key should not touch the shared document"
+    assert view.changed and not CopyOnWriteDict(shared).changed, "Only written views count as changed"
+    assert materialize(view) == {"profile": {"age": 31}, "months": {"january_2024": {}}}, \
+        "The saved document should hold the view's changes"
+
+    cache.get("alice")
+    assert loads == ["alice"], "An unchanged version should be served from the cache"
+    version["alice"] += 1
+    cache.get("alice")
+    assert loads == ["alice", "alice"], "A new version should reload the document"
+
+def test_analysis_cache_write_failures():
+    """Test that a failed cache write leaves no temp file and doesn't turn the analysis into an error"""
+    import glob
+    import tempfile
+    import unittest.mock as mock
+    from components import tips_review
+    from components.utils.analysis_cache import AnalysisCache
+    from components.utils.model import Profile
+    from fake_agent import FakeBudgetBuddyAgent
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = AnalysisCache(cache_dir=tmp)
+        with mock.patch("os.replace", side_effect=OSError("disk full")):
+            try:
+                cache.put("alice", "key", {"response": "ok"})
+                assert False, "The write error should reach the caller"
+            except OSError:
+                pass
+        assert not glob.glob(os.path.join(tmp, "**", "*.tmp"), recursive=True), "The temp file should be removed"
+
+        with mock.patch.object(cache, "put", side_effect=OSError("disk full")), \
+                mock.patch.object(tips_review, "get_analysis_cache", return_value=cache):
+            result = tips_review.generate_analysis_content(
+                FakeBudgetBuddyAgent(), "Savings Strategy", Profile(monthly_savings_target=500), {}, user_id="alice")
+        assert not result["response"].startswith("Error"), "The analysis should survive a failed cache write"
+
+def test_financial_digest_budget():
+    """Test that the digest stays within its token budget and drops sections lowest priority first"""
+    import calendar
+    from components.utils.context_digest import compile_financial_digest, estimate_tokens
+    from components.utils.model import split_years
+    from components.utils.schema import build_month_record
+
+    months = {}
+    for i in range(24):
+        year, month = 2023 + i // 12, calendar.month_name[i % 12 + 1].lower()
+        groceries = 1900 if i == 17 else 300 + 10 * (i % 4)
+        months[f"{month}_{year}"] = build_month_record(
+            {"salary": 4000 + 25 * i, "investment": 50 * (i % 3)},
+            {"rent": 1500, "groceries": groceries, "utilities": 120 + i}, 800)
+    years, _ = split_years(months)
+
+    headers = ["📈 TRENDS:", "🧾 CATEGORIES:", "⚠️ OUTLIERS:", "🗓️ RECENT MONTHS:"]
+    kept = []
+    for budget in (5, 20, 40, 80, 120, 160, 200, 250, 350, 2000):
+        digest = compile_financial_digest(years, token_budget=budget)
+        assert estimate_tokens(digest) <= budget, f"The digest should fit a budget of {budget} tokens"
+        sections = [header for header in headers if header in digest.splitlines()]
+        assert sections == headers[:len(sections)], "Sections should only be dropped from the end of the priority order"
+        assert len(sections) >= len(kept), "A larger budget should never drop a section"
+        kept = sections
+    assert compile_financial_digest(years, token_budget=5) == "", "Nothing should fit a tiny budget"
+    assert kept == headers, "A large budget should fit every section"
+    assert "June 2024 groceries" in compile_financial_digest(years, token_budget=2000), \
+        "The grocery spike should be listed as an outlier"
+
+def test_lttb_downsampling():
+    """Test that downsampling keeps the endpoints and the peaks a chart needs"""
+    import numpy as np
+    from components.utils.downsample import lttb
+
+    days = np.arange("2000-01-01", "2030-01-01", dtype="datetime64[D]")
+    values = np.sin(np.arange(len(days)) / 50.0)
+    values[5000], values[8000] = 40.0, -40.0
+    x, y = lttb(days, values, 500)
+    assert len(x) == len(y) == 500, "Output should have the requested number of points"
+    assert x[0] == days[0] and x[-1] == days[-1], "First and last points should be kept"
+    assert np.all(np.diff(x.astype(np.int64)) > 0), "Points should stay in order"
+    assert y.max() == 40.0 and y.min() == -40.0, "Spikes should survive downsampling"
+    short_x, _ = lttb(days[:100], values[:100], 500)
+    assert len(short_x) == 100, "Short series should be returned as they are"
+
+def test_categorizer():
+    """Test keyword, refund, override and recurring-bill categorization"""
+    import numpy as np
+    from components.utils.categorizer import Categorizer
+    from components.utils.ledger import CATEGORY_CODES
+
+    categorizer = Categorizer()
+    descriptions = ["WHOLE FOODS #123", "WHOLE FOODS REFUND", "ACME PAYROLL", "GIFT FROM MOM", "MYSTERY SHOP"]
+    codes, ambiguous = categorizer.classify_batch(descriptions, [-80.0, 12.0, 3000.0, 50.0, -25.0])
+    assert list(codes) == [CATEGORY_CODES[name] for name in
+                           ("groceries", "groceries", "salary", "other_income", "other_expenses")], \
+        "Keywords should win, refunds should stay with their shop and the rest fall back by sign"
+    assert list(ambiguous) == [False, False, False, False, True], "Only unknown payments should be ambiguous"
+
+    categorizer.add_override("mystery shop", "entertainment")
+    assert categorizer.match("Mystery  Shop 42") == CATEGORY_CODES["entertainment"], "Overrides should apply"
+    categorizer.add_override("corner deli", "groceries")
+    assert categorizer.match("UBER EATS CORNER DELI") == CATEGORY_CODES["groceries"], \
+        "An override should win even when a default keyword comes first"
+
+    dates = np.array(["2024-01-01", "2024-02-01", "2024-03-01"], dtype="datetime64[D]")
+    codes, ambiguous = categorizer.classify_batch(["ACME PROPERTIES"] * 3, [-1800.0] * 3, dates)
+    assert set(codes) == {CATEGORY_CODES["rent"]} and not ambiguous.any(), \
+        "A large monthly payment of the same amount should be rent"
+
+def test_concurrent_saves_keep_aggregates():
+    """Test that concurrent month saves leave the running aggregates equal to a full rebuild"""
+    import tempfile
+    import threading
+    import unittest.mock as mock
+    from components.utils import storage
+    from components.utils.aggregates import RunningAggregates
+    from components.utils.backends import create_backend
+    from components.utils.schema import build_month_record
+
+    def save(worker):
+        for i in range(20):
+            month = ["january", "february", "march"][worker % 3]
+            record = build_month_record({"salary": 1000 + worker + i}, {"rent": 100 * worker}, 50, completed=True)
+            assert storage.update_month_data(f"{month}_2024", record), "Save should succeed"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = create_backend("json", data_dir=tmp, default_factory=storage.initialize_test_user)
+        # A plain session state, so the worker threads don't need a Streamlit script run
+        with mock.patch.object(storage, "_backend", backend), mock.patch.object(storage, "_aggregates", {}), \
+                mock.patch.object(storage, "st", mock.Mock(session_state={})):
+            threads = [threading.Thread(target=save, args=(worker,)) for worker in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            rebuilt = RunningAggregates.from_months(backend.load_months(storage.DEFAULT_USER_ID))
+            assert storage.get_aggregates().to_dict() == rebuilt.to_dict(), "Aggregates should not drift"
+
+def test_saves_lock_per_user():
+    """Test that one user's held write lock doesn't hold up another user's save"""
+    import tempfile
+    import threading
+    import unittest.mock as mock
+    from components.utils import storage
+    from components.utils.backends import create_backend
+    from components.utils.schema import build_month_record
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = create_backend("json", data_dir=tmp, default_factory=storage.initialize_test_user)
+        saved = threading.Event()
+
+        def save_as_bob():
+            if storage.update_month_data("january_2024", build_month_record({"salary": 1000}, {}, 0)):
+                saved.set()
+
+        with mock.patch.object(storage, "_backend", backend), mock.patch.object(storage, "_aggregates", {}), \
+                mock.patch.object(storage, "st", mock.Mock(session_state={"user_id": "bob"})):
+            with storage._user_lock("alice"):
+                thread = threading.Thread(target=save_as_bob)
+                thread.start()
+                assert saved.wait(10), "Bob's save should not wait for Alice's lock"
+            thread.join()
+
+def test_data_tools_follow_data_version():
+    """Test that memoized tool results are reused until a save changes the data version"""
+    import json
+    import tempfile
+    import unittest.mock as mock
+    from components.utils import storage
+    from components.utils.backends import create_backend
+    from components.utils.schema import build_month_record
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = create_backend("json", data_dir=tmp)
+        backend.save_months("dana", {"january_2024": build_month_record({"salary": 4000}, {"rent": 1500}, 1000)})
+        with mock.patch.object(storage, "_backend", backend), mock.patch.object(storage, "_aggregates", {}), \
+                mock.patch.object(storage, "_data_tools", {}), mock.patch.object(storage, "_data_versions", {}), \
+                mock.patch.object(storage, "st", mock.Mock(session_state={"user_id": "dana"})):
+            tools = storage.get_data_tools()
+            first = tools.savings_gap()
+            assert json.loads(first)["months"] == 1, "The saved month should be counted"
+
+            backend.save_months("dana", {"february_2024": build_month_record({"salary": 4000}, {}, 1000)})
+            assert tools.savings_gap() == first, "Writes behind storage's back shouldn't drop the memoized result"
+
+            storage.update_month_data("march_2024", build_month_record({"salary": 4000}, {"rent": 3500}, 1000))
+            gap = json.loads(tools.savings_gap())
+            assert storage.get_data_tools() is tools, "The user's tools should be shared"
+            assert gap["months"] == 3 and gap["months_below_target"] == 1, "A save should drop the memoized results"
+
+def test_cached_savings_view_is_private():
+    """Test that changing a cached savings view doesn't change what the next caller gets"""
+    import tempfile
+    import unittest.mock as mock
+    from components.utils import storage
+    from components.utils.backends import create_backend
+    from components.visualization import build_savings_view
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = create_backend("json", data_dir=tmp, default_factory=storage.initialize_test_user)
+        with mock.patch.object(storage, "_backend", backend):
+            first = build_savings_view("private_view_user", 0, "2024")
+            first["df"].loc[0, "Target Savings"] = -1
+            first["comparison_fig"].update_layout(title="changed")
+            second = build_savings_view("private_view_user", 0, "2024")
+        assert second["df"].loc[0, "Target Savings"] != -1, "Frames should not be shared between callers"
+        assert second["comparison_fig"].layout.title.text != "changed", "Figures should not be shared"
+
+def test_retirement_simulation():
+    """Test that the Monte Carlo projection is monotonic, exact without volatility and memoized"""
+    import math
+    import unittest.mock as mock
+    from components.utils import retirement_sim
+    from components.utils.retirement_sim import simulate_retirement
+
+    required = [simulate_retirement(30, 65, 10000.0, 500.0, goal=goal, n_paths=2000, seed=7)["required_monthly"]
+                for goal in (250_000.0, 500_000.0, 1_000_000.0, 2_000_000.0)]
+    assert required == sorted(required) and required[0] < required[-1], \
+        "A larger goal should never need a smaller contribution"
+
+    with mock.patch.dict(retirement_sim.RISK_PROFILES, {"Flat": (0.05, 0.0)}), \
+            mock.patch.object(retirement_sim, "INFLATION_VOLATILITY", 0.0):
+        result = simulate_retirement(40, 60, 20000.0, 300.0, "Flat", 2.0, goal=1.0, n_paths=100, seed=1)
+    growth = 1.05 / 1.02
+    expected = 20000.0 * growth ** 20 + 12 * 300.0 * (growth ** 20 - 1) / (growth - 1)
+    assert math.isclose(result["median_balance"], expected, rel_tol=1e-9), \
+        "Without volatility every path should match the closed-form future value"
+
+    args = (25, 65, 10000.0, 1000.0, "Moderate", 2.5)
+    before = simulate_retirement.cache_info().hits
+    first = simulate_retirement(*args, monthly_income=5000.0, n_paths=1000)
+    second = simulate_retirement(*args, monthly_income=5000.0, n_paths=1000)
+    assert second is first and simulate_retirement.cache_info().hits > before, \
+        "The inputs the app passes should be hashable, so a repeat call is a cache hit"
+
+def test_model_gateway_coalescing():
+    """Test that identical concurrent requests share one call and throttling slows the limiter"""
+    import threading
+    from components.utils.gateway import ModelGateway
+    from fake_agent import FakeBudgetBuddyAgent
+    
+    gateway = ModelGateway(rate=50, burst=50, base_delay=0.01, max_retries=8)
+    agents = [FakeBudgetBuddyAgent(latency=0.2, gateway=gateway) for _ in range(5)]
+    responses = []
+    threads = [threading.Thread(target=lambda a=a: responses.append(a.run("Monthly Income: $4,000.00")))
+               for a in agents]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(a.calls for a in agents) == 1, "Identical requests should share one upstream call"
+    assert len(responses) == 5 and len(set(responses)) == 1, "Every caller should get the shared response"
+    
+    throttled = [FakeBudgetBuddyAgent(throttle_rate=0.5, seed=i, gateway=gateway) for i in range(5)]
+    for i, agent in enumerate(throttled):
+        assert "NEW SAVINGS TARGET" in agent.run(f"Monthly Income: ${i + 1},000.00"), "Throttled calls should be retried"
+    assert gateway.limiter.throttled > 0 and gateway.limiter.rate < gateway.limiter.max_rate, \
+        "Throttling should lower the rate"
+
+def test_model_gateway_key_isolation():
+    """Test that only identical conversations share an answer, and that sharing records it in each history"""
+    import threading
+    import time
+    import unittest.mock as mock
+    from agent import BudgetBuddyAgent
+    from components.utils.gateway import ModelGateway, request_key
+
+    class StubStrandsAgent:
+        def __init__(self, messages=()):
+            self.messages = list(messages)
+            self.calls = 0
+
+        def __call__(self, prompt):
+            self.calls += 1
+            time.sleep(0.2)
+            self.messages += [{"role": "user", "content": [{"text": prompt}]},
+                              {"role": "assistant", "content": [{"text": "answer"}]}]
+            return "answer"
+
+    def make_agent(messages=(), user_id=None):
+        agent = BudgetBuddyAgent()
+        agent._model_id = "test-model"
+        agent.agent = StubStrandsAgent(messages)
+        agent.user_id = user_id
+        return agent
+
+    earlier = [{"role": "user", "content": [{"text": "hi"}]}, {"role": "assistant", "content": [{"text": "hello"}]}]
+    prompt = "What is my new target?"
+    base = request_key("run", make_agent(), prompt)
+    assert request_key("run", make_agent(earlier), prompt) != base, "Different histories should not share"
+    assert request_key("run", make_agent(user_id="bob"), prompt) != base, "Different users should not share"
+
+    gateway = ModelGateway(rate=50, burst=50)
+    agents = [make_agent() for _ in range(3)]
+    with mock.patch("agent.get_model_gateway", return_value=gateway):
+        threads = [threading.Thread(target=agent.run, args=(prompt,)) for agent in agents]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert sum(agent.agent.calls for agent in agents) == 1, "Identical conversations should share one call"
+    assert all(agent.messages == agents[0].messages and len(agent.messages) == 2 for agent in agents), \
+        "Every agent's history should hold the shared exchange"
+
+def test_agent_history_trimming():
+    """Test that trimming keeps the last exchange and never starts the history on a tool result"""
+    import types
+    from agent import BudgetBuddyAgent
+
+    def text(role, value):
+        return {"role": role, "content": [{"text": value}]}
+
+    def trimmed(messages, max_history_tokens):
+        agent = BudgetBuddyAgent(max_history_tokens=max_history_tokens)
+        agent.agent = types.SimpleNamespace(messages=list(messages))
+        agent.trim_history()
+        return agent.messages
+
+    tool_use = {"role": "assistant", "content": [{"toolUse": {"toolUseId": "1", "name": "get_trends", "input": {}}}]}
+    tool_result = {"role": "user", "content": [{"toolResult": {"toolUseId": "1", "content": [{"text": "up"}]}}]}
+    messages = [text("user", "a" * 400), tool_use, tool_result, text("assistant", "trends are up"),
+                text("user", "and savings?"), text("assistant", "on track")]
+
+    assert trimmed(messages, 10_000) == messages, "A history within budget should be left alone"
+    assert trimmed(messages, 60) == messages[4:], \
+        "Dropping the first turn should skip past the tool call and its result to the next user turn"
+    huge = [text("user", "x" * 4000), text("assistant", "y" * 4000)]
+    assert trimmed(messages + huge, 1) == huge, "The last exchange should be kept even over budget"
+
+def test_agent_pool_eviction():
+    """Test that the agent pool evicts the least recently used and idle agents"""
+    import unittest.mock as mock
+    from agent import AgentPool
+
+    clock = [0.0]
+    created = []
+    pool = AgentPool(factory=lambda: created.append(object()) or created[-1], max_size=2, idle_seconds=60)
+    with mock.patch("agent.time", mock.Mock(monotonic=lambda: clock[0])):
+        alice = pool.get("alice")
+        bob = pool.get("bob")
+        assert pool.get("alice") is alice, "A key should keep its agent"
+        pool.get("carol")
+        assert len(pool) == 2 and pool.get("alice") is alice, "The pool should not grow past max_size"
+        assert pool.get("bob") is not bob, "The least recently used agent should have been evicted"
+
+        clock[0] += 30
+        pool.get("bob")
+        clock[0] += 45
+        assert pool.get("bob") is created[-1] and len(pool) == 1, "Agents idle past idle_seconds should be dropped"
+        assert pool.get("alice") is not alice, "An idle key should get a fresh agent"
+
+def test_structured_output_repair():
+    """Test that an invalid structured answer is asked for once more and a second failure is raised"""
+    from pydantic import ValidationError
+    from agent import BudgetBuddyAgent
+    from components.utils.gateway import ModelGateway
+    from components.utils.recommendation import AnalysisReport
+
+    class StubStrandsAgent:
+        def __init__(self, answers):
+            self.answers = list(answers)
+            self.prompts = []
+            self.messages = []
+
+        def structured_output(self, output_model, prompt):
+            self.prompts.append(prompt)
+            return output_model.model_validate(self.answers.pop(0))
+
+    def make_agent(answers):
+        agent = BudgetBuddyAgent(gateway=ModelGateway(rate=50, burst=50))
+        agent._model_id = "test-model"
+        agent.agent = StubStrandsAgent(answers)
+        return agent
+
+    valid = {"analysis": "Spending is steady.", "action_items": ["Cut dining out", " "]}
+    agent = make_agent([{"analysis": ""}, valid])
+    report = agent.run_structured("Review my month")
+    assert isinstance(report, AnalysisReport) and report.action_items == ["Cut dining out"], \
+        "The repaired answer should be returned"
+    assert len(agent.agent.prompts) == 2 and "analysis" in agent.agent.prompts[1] \
+        and "rejected" in agent.agent.prompts[1], "The retry should spell out what failed validation"
+
+    agent = make_agent([{"analysis": ""}, {"analysis": "ok", "recommended_monthly_savings": -5}])
+    try:
+        agent.run_structured("Review my month")
+        assert False, "A second invalid answer should be raised"
+    except ValidationError as e:
+        assert "recommended_monthly_savings" in str(e), "The second failure should be the one raised"
+    assert len(agent.agent.prompts) == 2, "There should be only one retry"
+
+def test_year_ledger_round_trip():
+    """Test that months read into a YearLedger come back exactly, ints included"""
+    import json
+    from components.utils.model import YearLedger
+    
+    months = {
+        "january_2024": {
+            "income": {"salary": 5000, "investment": 12.5, "total": 5012.5, "bonus": "n/a"},
+            "expenses": {"rent": 1500, "total": 1500},
+            "savings": {"target": 1000, "actual": 3512.5, "difference": 2512.5},
+            "completed": True,
+            "note": "first month",
+        },
+        "march_2024": {"income": {}, "completed": False},
+    }
+    restored = YearLedger.from_months(months, 2024).to_months()
+    assert restored == months, "Round trip should reproduce the document"
+    assert json.dumps(restored, sort_keys=True) == json.dumps(months, sort_keys=True), \
+        "Ints should stay ints so the stored JSON text doesn't change"
+
+def test_user_record_round_trip():
+    """Test that the cached Profile and YearLedgers reproduce the document in less memory"""
+    from components.utils.document_cache import estimate_size
+    from components.utils.model import UserRecord
+    from components.utils.storage import initialize_test_user
+
+    document = initialize_test_user()
+    document["profile"]["nickname"] = "tester"
+    del document["profile"]["inflation_rate"]
+    document["months"]["notes"] = {"text": "not a month"}
+    document["settings"] = {"theme": "dark"}
+    record = UserRecord.from_document(document)
+    assert record.to_document() == document, "Round trip should reproduce the document"
+    assert record.profile.monthly_savings_target == 1000, "Stored profile fields should read as attributes"
+    assert record.profile.inflation_rate is None and not record.profile.is_set("inflation_rate"), \
+        "Unset profile fields should fall back to their default"
+    assert record.month("march_2024") == document["months"]["march_2024"], "Single months should match"
+    assert record.nbytes < estimate_size(document) / 4, "The record should be much smaller than the nested dicts"
+
 def run_all_tests():
     """Run all simple tests"""
     print("🚀 Running simple tests...")
     print("-" * 40)
     
-    tests = [
-        test_imports,
-        test_agent_creation
-    ]
+    tests = [test for name, test in globals().items() if name.startswith("test_") and callable(test)]
     
     results = []
     for test in tests:
         try:
-            result = test()
-            results.append(result)
+            # Older tests report their own result and return False on failure
+            passed = test() is not False
+            print(f"{'✅' if passed else '❌'} {test.__name__}")
+            results.append(passed)
         except Exception as e:
-            print(f"❌ Test {test.__name__} crashed: {e}")
+            print(f"❌ {test.__name__} failed: {type(e).__name__}: {e}")
             results.append(False)
     
     print("-" * 40)
@@ -78,4 +778,4 @@ def run_all_tests():
 if __name__ == "__main__":
     # Run tests when file is executed directly
     success = run_all_tests()
-    sys.exit(0 if success else 1)
\ No newline at end of file
+    sys.exit(0 if success else 1)